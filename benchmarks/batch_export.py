@@ -0,0 +1,56 @@
+"""
+Benchmark exporting many small documents one after another and with `DdlBatchExporter`, in documents per second.
+
+Run with `PYTHONPATH=src python benchmarks/batch_export.py`.
+"""
+import functools
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(seed, nodes=20, vertices=100):
+    """
+    Create a document with `nodes` nodes with a vertex array of `vertices` float[3] vertices each.
+    """
+    rand = random.Random(seed)
+    document = DdlDocument()
+    for i in range(nodes):
+        node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"))
+        node.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+            DataType.float, [(rand.random(), rand.random(), rand.random()) for j in range(vertices)], vector_size=3)
+    return document
+
+
+if __name__ == "__main__":
+    count = 1000
+    directory = tempfile.mkdtemp()
+    paths = [os.path.join(directory, "{}.ddl".format(i)) for i in range(count)]
+    documents = [create_document(i) for i in range(count)]
+
+    start = time.perf_counter()
+    for document, path in zip(documents, paths):
+        DdlTextWriter(document).write(path)
+    print("{:24}: {:8.1f} documents/s".format("one at a time", count / (time.perf_counter() - start)))
+
+    with DdlBatchExporter() as exporter:
+        # start the workers
+        exporter.export([(documents[0], paths[0])])
+
+        start = time.perf_counter()
+        exporter.export(zip(documents, paths))
+        print("{:24}: {:8.1f} documents/s".format("batch, documents", count / (time.perf_counter() - start)))
+
+        start = time.perf_counter()
+        exporter.export((functools.partial(create_document, i), path) for i, path in enumerate(paths))
+        print("{:24}: {:8.1f} documents/s".format("batch, factories", count / (time.perf_counter() - start)))
+    print("({} processes)".format(exporter.processes))
+
+    shutil.rmtree(directory)
@@ -0,0 +1,50 @@
+"""
+Benchmark building, hashing and freeing a document of many small structures. Content hashes must not cost anything
+while they are not used, so building and freeing are measured without hashing first.
+
+Run with `PYTHONPATH=src python benchmarks/build.py`.
+"""
+import gc
+import time
+import tracemalloc
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(nodes=25000):
+    """
+    Create a document of 4 * nodes structures and primitive structures.
+    """
+    document = DdlDocument()
+    for i in range(nodes):
+        node = document.add_structure(B"Node", bytes("node" + str(i), "UTF-8"), props={B"visible": True})
+        node.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["node" + str(i)])])
+        node.add_primitive(DataType.float, [1.0, 0.0, 0.0, 1.0])
+    return document
+
+
+def run(hashed):
+    start = time.perf_counter()
+    document = create_document()
+    built = time.perf_counter()
+    if hashed:
+        document.content_hash()
+    hashed_time = time.perf_counter()
+    del document
+    gc.collect()
+    freed = time.perf_counter()
+    return built - start, hashed_time - built, freed - hashed_time
+
+
+if __name__ == "__main__":
+    for hashed in [False, True]:
+        build, hashing, free = min(run(hashed) for i in range(3))
+        print("{:10}: build {:7.1f} ms, hash {:7.1f} ms, free {:7.1f} ms".format(
+            "hashed" if hashed else "not hashed", build * 1e3, hashing * 1e3, free * 1e3))
+
+    tracemalloc.start()
+    document = create_document()
+    print("peak memory: {:6.1f} MB".format(tracemalloc.get_traced_memory()[1] * 1e-6))
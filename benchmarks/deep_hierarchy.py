@@ -0,0 +1,44 @@
+"""
+Benchmark writing deep, narrow hierarchies (e.g. bone chains).
+
+Every structure is visited once and appended to a single output buffer, so the time per structure should stay
+constant with increasing depth for DdlCompressedTextWriter. For DdlTextWriter it grows slowly, since the indentation
+itself grows linearly with depth.
+
+Run with `PYTHONPATH=src python benchmarks/deep_hierarchy.py`.
+"""
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_chain(depth, width=2):
+    """
+    Create a document with a chain of `depth` nested structures, each with `width` primitive children.
+    """
+    document = DdlDocument()
+    node = document.add_structure(B"Node", B"root")
+    for i in range(depth):
+        for j in range(width):
+            node.add_primitive(DataType.float, [(float(i), float(j), 0.0)] * 8, vector_size=3)
+        node = node.add_structure(B"Node")
+    return document
+
+
+def bench(writer_class, depth, repeat=5):
+    document = create_chain(depth)
+    writer = writer_class(document)
+    root = document.structures[0]
+    seconds = min(timeit.repeat(lambda: writer.structure_as_text(root), number=1, repeat=repeat))
+    return seconds
+
+
+if __name__ == "__main__":
+    for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+        print(writer_class.__name__)
+        for depth in [250, 500, 1000, 2000, 4000, 8000]:
+            seconds = bench(writer_class, depth)
+            print("  depth {:5d}: {:8.2f} ms, {:6.2f} us/structure".format(depth, seconds * 1e3, seconds * 1e6 / depth))
@@ -0,0 +1,43 @@
+"""
+Benchmark writing a scene whose geometry is encoded on every export, compared to geometry cached as fragments.
+
+Run with `PYTHONPATH=src python benchmarks/fragments.py`.
+"""
+import random
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_geometry(i, vertices=5000):
+    geometry = DdlStructure(B"GeometryObject", bytes("geometry" + str(i), "UTF-8"))
+    mesh = geometry.add_structure(B"Mesh", props={B"primitive": "triangles"})
+    mesh.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+        DataType.float, [(random.random(), random.random(), random.random()) for j in range(vertices)], vector_size=3)
+    mesh.add_structure(B"IndexArray").add_primitive(DataType.unsigned_int32, list(range(vertices)))
+    return geometry
+
+
+def create_scene(geometries):
+    document = DdlDocument()
+    for i, geometry in enumerate(geometries):
+        node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"))
+        node.add_structure(B"Transform", children=[
+            DdlPrimitive(DataType.float, [tuple(float(i == j) for i in range(4) for j in range(4))], vector_size=16)])
+        node.children.append(geometry)
+    return document
+
+
+if __name__ == "__main__":
+    geometries = [create_geometry(i) for i in range(50)]
+    encode = min(timeit.repeat(lambda: [DdlFragment.from_structures([g]) for g in geometries], number=1, repeat=3))
+    print("encode fragments: {:8.1f} ms".format(encode * 1e3))
+
+    fragments = [DdlFragment.from_structures([g]) for g in geometries]
+    for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+        for label, scene in [("structures", create_scene(geometries)), ("fragments", create_scene(fragments))]:
+            seconds = min(timeit.repeat(lambda: writer_class(scene).write("/dev/null"), number=1, repeat=3))
+            print("{:23} {:10}: {:8.1f} ms".format(writer_class.__name__, label, seconds * 1e3))
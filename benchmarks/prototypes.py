@@ -0,0 +1,52 @@
+"""
+Benchmark building and writing a scene of many near-identical structures, once from copies and once from instances of
+a prototype.
+
+Run with `PYTHONPATH=src python benchmarks/prototypes.py`.
+"""
+import timeit
+import tracemalloc
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_light(name=None):
+    light = DdlStructure(B"LightObject", name, props={B"type": "point"})
+    light.add_structure(B"Color", props={B"attrib": "light"}, children=[
+        DdlPrimitive(DataType.float, [(1.0, 0.5, 0.25)], vector_size=3)])
+    light.add_structure(B"Param", props={B"attrib": "intensity"}, children=[DdlPrimitive(DataType.float, [1.0])])
+    light.add_structure(B"Transform", children=[
+        DdlPrimitive(DataType.float, [tuple(float(i == j) for i in range(4) for j in range(4))], vector_size=16)])
+    return light
+
+
+def create_copies(count):
+    document = DdlDocument()
+    for i in range(count):
+        document.structures.append(create_light(bytes("light" + str(i), "UTF-8")))
+    return document
+
+
+def create_instances(count):
+    document = DdlDocument()
+    template = create_light(B"template")
+    for i in range(count):
+        document.structures.append(template.instance(bytes("light" + str(i), "UTF-8")))
+    return document
+
+
+if __name__ == "__main__":
+    count = 20000
+    for create in [create_copies, create_instances]:
+        tracemalloc.start()
+        document = create(count)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        build = min(timeit.repeat(lambda: create(count), number=1, repeat=3))
+        write = min(timeit.repeat(lambda: DdlTextWriter(document).write("/dev/null"), number=1, repeat=3))
+        print("{:16}: build {:7.1f} ms, write {:7.1f} ms, {:6.1f} MB".format(
+            create.__name__, build * 1e3, write * 1e3, memory / 1e6))
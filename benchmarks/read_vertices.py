@@ -0,0 +1,44 @@
+"""
+Benchmark reading vertex-heavy files, with numeric data decoded into lists, into typed arrays and into numpy arrays,
+if numpy is installed.
+
+Run with `PYTHONPATH=src python benchmarks/read_vertices.py`.
+"""
+import random
+import timeit
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_text(writer_class, arrays=10, vertices=100000):
+    """
+    Create OpenDDL text of a geometry with `arrays` float[3] vertex arrays of `vertices` vectors each.
+    """
+    document = DdlDocument()
+    mesh = document.add_structure(B"GeometryObject", B"geometry").add_structure(B"Mesh")
+    for i in range(arrays):
+        vertex_array = mesh.add_structure(B"VertexArray", props={B"attrib": "position"})
+        vertex_array.add_primitive(DataType.float, [(random.random(), random.random(), random.random())
+                                                    for j in range(vertices)], vector_size=3)
+
+    writer = writer_class(document)
+    return B"".join(writer.structure_as_text(s) for s in document.structures), arrays * vertices * 3
+
+
+if __name__ == "__main__":
+    for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+        text, values = create_text(writer_class)
+        print(writer_class.__name__)
+        for typed_arrays in [None, "array"] + (["numpy"] if numpy is not None else []):
+            reader = DdlTextReader(typed_arrays)
+            seconds = min(timeit.repeat(lambda: reader.read_bytes(text), number=1, repeat=3))
+            print("  typed_arrays={!s:6}: {:8.2f} ms, {:6.2f} M values/s".format(
+                typed_arrays, seconds * 1e3, values / seconds * 1e-6))
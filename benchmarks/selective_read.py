@@ -0,0 +1,23 @@
+"""
+Benchmark reading only the structure of vertex-heavy files, skipping the vertex arrays, compared to reading them fully.
+
+Run with `PYTHONPATH=src python benchmarks/selective_read.py`.
+"""
+import timeit
+
+from pyddl import *
+from read_vertices import create_text
+
+__author__ = "Jonathan Hale"
+
+
+if __name__ == "__main__":
+    for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+        text, values = create_text(writer_class)
+        print("{} ({:.1f} MB)".format(writer_class.__name__, len(text) * 1e-6))
+        for label, reader in [("full", DdlTextReader("array")),
+                              ("exclude", DdlTextReader(exclude=[B"VertexArray"])),
+                              ("include", DdlTextReader(include=[B"GeometryObject", B"Mesh"])),
+                              ("predicate", DdlTextReader(predicate=lambda s: s.identifier != B"VertexArray"))]:
+            seconds = min(timeit.repeat(lambda: reader.read_bytes(text), number=1, repeat=3))
+            print("  {:9}: {:8.2f} ms, {:7.1f} MB/s".format(label, seconds * 1e3, len(text) / seconds * 1e-6))
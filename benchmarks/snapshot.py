@@ -0,0 +1,49 @@
+"""
+Benchmark loading a document from a snapshot compared to reading it from text.
+
+Run with `PYTHONPATH=src python benchmarks/snapshot.py`.
+"""
+import os
+import random
+import tempfile
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(nodes, vertices):
+    """
+    Create a document with `nodes` nodes with a transform and a mesh of `vertices` float[3] vertices each.
+    """
+    document = DdlDocument()
+    for i in range(nodes):
+        node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"), props={B"visible": True})
+        node.add_structure(B"Transform", children=[DdlPrimitive(DataType.float, [(1.0, 0.0, 0.0, 1.0)], None, 4)])
+        node.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+            DataType.float, [(random.random(), random.random(), random.random()) for j in range(vertices)],
+            vector_size=3)
+    return document
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "scene.ddl")
+    snapshot_path = os.path.join(directory, "scene.snapshot")
+
+    for nodes, vertices in [(10, 200000), (20000, 10)]:
+        DdlCompressedTextWriter(create_document(nodes, vertices)).write(text_path)
+        reader = DdlTextReader(typed_arrays="array")
+        save_snapshot(reader.read(text_path), snapshot_path)
+
+        print("{} nodes with {} vertices, {:.1f} MB text".format(nodes, vertices, os.path.getsize(text_path) / 1e6))
+        for name, load in [("text", lambda: reader.read(text_path)),
+                           ("snapshot", lambda: load_snapshot(snapshot_path))]:
+            seconds = min(timeit.repeat(load, number=1, repeat=3))
+            print("  {:8}: {:8.2f} ms".format(name, seconds * 1e3))
+
+    os.remove(text_path)
+    os.remove(snapshot_path)
+    os.rmdir(directory)
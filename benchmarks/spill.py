@@ -0,0 +1,49 @@
+"""
+Benchmark building and writing a document of large vertex arrays, once in memory and once with a `DdlSpillStore`
+which keeps at most 16 MB of primitive data in memory.
+
+Run with `PYTHONPATH=src python benchmarks/spill.py`.
+"""
+import os
+import random
+import time
+import tracemalloc
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(meshes=10, vertices=50000):
+    document = DdlDocument()
+    for i in range(meshes):
+        mesh = document.add_structure(B"GeometryObject", bytes("geometry" + str(i), "UTF-8")).add_structure(B"Mesh")
+        mesh.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+            DataType.float, [(random.random(), random.random(), random.random()) for j in range(vertices)],
+            vector_size=3)
+    return document
+
+
+def run(store):
+    tracemalloc.start()
+    start = time.perf_counter()
+    if store is None:
+        document = create_document()
+    else:
+        with store:
+            document = create_document()
+    built = time.perf_counter()
+    DdlCompressedTextWriter(document).write("spill.ddl")
+    written = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return built - start, written - built, peak
+
+
+if __name__ == "__main__":
+    for label, store in [("in memory", None), ("spilled", DdlSpillStore(budget=16 << 20))]:
+        build, write, peak = run(store)
+        print("{:10}: build {:7.1f} ms, write {:7.1f} ms, peak {:6.1f} MB".format(
+            label, build * 1e3, write * 1e3, peak * 1e-6))
+    os.remove("spill.ddl")
@@ -0,0 +1,35 @@
+"""
+Benchmark encoding large string tables: plain names, which take the fast path, repeated paths with backslashes, which
+are escaped once and then cached, and mixed str/bytes names. Escaping and encoding every value on its own with
+`DdlTextWriter.to_string_byte()` is shown for comparison.
+
+Run with `PYTHONPATH=src python benchmarks/string_tables.py`.
+"""
+import random
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_tables(values=200000):
+    names = ["Armature/bone_{}/rotation".format(random.randrange(values)) for i in range(values)]
+    paths = ["C:\\textures\\material_{}.png".format(random.randrange(100)) for i in range(values)]
+    mixed = [name.encode() if i % 2 else name for i, name in enumerate(names)]
+    return [("plain", names), ("repeated paths", paths), ("mixed str/bytes", mixed)]
+
+
+def per_value(values):
+    return B", ".join(map(DdlTextWriter.to_string_byte, values))
+
+
+if __name__ == "__main__":
+    for label, values in create_tables():
+        primitive = DdlPrimitive(DataType.string, values)
+        DdlTextWriter.set_max_elements_per_line(primitive, 8)
+        writer = DdlTextWriter(DdlDocument())
+        seconds = min(timeit.repeat(lambda: writer.primitive_as_text(primitive), number=1, repeat=5))
+        baseline = min(timeit.repeat(lambda: per_value(values), number=1, repeat=5))
+        print("{:16}: {:7.1f} ms, per value {:7.1f} ms".format(label, seconds * 1e3, baseline * 1e3))
@@ -0,0 +1,47 @@
+"""
+Benchmark writing the same scene with every text layout, to make sure optimizations of the writer apply to all of them.
+
+Run with `PYTHONPATH=src python benchmarks/write_layouts.py`.
+"""
+import os
+import random
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(nodes=2000, vertices=200):
+    """
+    Create a scene of many small structures with comments and properties, each with a vertex array.
+    """
+    document = DdlDocument()
+    for i in range(nodes):
+        node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"), props={B"visible": True})
+        DdlTextWriter.set_comment(node, B"node")
+        node.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["node" + str(i)])])
+        node.add_structure(B"Transform", children=[
+            DdlPrimitive(DataType.float, [tuple(float(i == j) for i in range(4) for j in range(4))], vector_size=16)])
+        mesh = node.add_structure(B"Mesh", props={B"primitive": "triangles"})
+        mesh.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+            DataType.float, [(random.random(), random.random(), random.random()) for j in range(vertices)],
+            vector_size=3)
+        mesh.add_structure(B"IndexArray").add_primitive(DataType.unsigned_int32, list(range(vertices)))
+    return document
+
+
+if __name__ == "__main__":
+    document = create_document()
+    layouts = [("pretty", DdlTextLayout()),
+               ("compact", DdlTextLayout.compact()),
+               ("two spaces, 100 wide", DdlTextLayout(indent=B"  ", line_width=100))]
+    for label, layout in layouts:
+        DdlTextWriter(document, layout=layout).write("write_layouts.ddl")
+        size = os.path.getsize("write_layouts.ddl")
+        seconds = min(timeit.repeat(lambda: DdlTextWriter(document, layout=layout).write("write_layouts.ddl"),
+                                    number=1, repeat=3))
+        print("{:20}: {:8.1f} ms, {:6.1f} MB, {:6.1f} MB/s".format(label, seconds * 1e3, size * 1e-6,
+                                                                  size / seconds * 1e-6))
+    os.remove("write_layouts.ddl")
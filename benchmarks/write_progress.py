@@ -0,0 +1,43 @@
+"""
+Benchmark the overhead of progress reporting while writing a scene: without a callback, with the default throttling and
+with a report after every chunk.
+
+Run with `PYTHONPATH=src python benchmarks/write_progress.py`.
+"""
+import os
+import random
+import timeit
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(nodes=5000, vertices=100):
+    document = DdlDocument()
+    for i in range(nodes):
+        node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"))
+        node.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["node" + str(i)])])
+        mesh = node.add_structure(B"Mesh")
+        mesh.add_structure(B"VertexArray").add_primitive(
+            DataType.float, [(random.random(), random.random(), random.random()) for j in range(vertices)],
+            vector_size=3)
+    return document
+
+
+def write(document, progress, interval):
+    writer = DdlCompressedTextWriter(document, progress=progress, cancellation=DdlCancellationToken())
+    writer.progress_interval = interval
+    writer.write("write_progress.ddl")
+
+
+if __name__ == "__main__":
+    document = create_document()
+    reports = []
+    for label, progress, interval in [("no progress", None, 0.5), ("every 0.5 s", reports.append, 0.5),
+                                      ("every chunk", reports.append, 0.0)]:
+        reports.clear()
+        seconds = min(timeit.repeat(lambda: write(document, progress, interval), number=1, repeat=3))
+        print("{:12}: {:8.1f} ms, {:5} reports".format(label, seconds * 1e3, len(reports)))
+    os.remove("write_progress.ddl")
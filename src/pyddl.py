@@ -1,7 +1,30 @@
 from abc import abstractmethod
+import argparse
+import array
+import collections
+import concurrent.futures
+from collections import namedtuple
+import difflib
+import gc
+import hashlib
+import itertools
 import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+import traceback
+import weakref
 from enum import Enum
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __author__ = "Jonathan Hale"
 __version__ = "0.1.0"
 
@@ -30,9 +53,16 @@ class DdlPrimitiveDataType(Enum):
     type = 14
 
 
+# store which tracks the data of primitive structures while it is active, see `DdlSpillStore`
+_spill_store = None
+
+
 class DdlPrimitive:
     """
     An OpenDDL primitive structure.
+
+    Data moved to a file by an active `DdlSpillStore` is replaced by a read-only view of the file, see there. Lists
+    of vectors become a sequence of tuples and other lists a `memoryview`, assign new data to change them.
     """
 
     def __init__(self, data_type, data, name=None, vector_size=0):
@@ -43,18 +73,133 @@ class DdlPrimitive:
         :param name: name of the primitive structure
         :param vector_size: size of the contained vectors
         """
-        self.data_type = data_type
-        self.name = name
-        self.vector_size = vector_size
-        self.data = data
+        # assigned directly, there is no hash to invalidate yet. Assigning the keys one by one keeps the compact
+        # attribute storage which instances of a class share, `update()` does not.
+        attributes = self.__dict__
+        attributes["_hash"] = None
+        attributes["data_type"] = data_type
+        attributes["name"] = name
+        attributes["name_is_global"] = True
+        attributes["vector_size"] = vector_size
+        attributes["data"] = data
+        if _spill_store is not None:
+            _spill_store.track(self)
+
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        if self._hash is not None and key[0] != "_":
+            _invalidate(self)
+        if key == "data" and _spill_store is not None:
+            _spill_store.track(self)
+
+    def instance(self, name=None):
+        """
+        Create a primitive structure which shares the data of this one, until it is accessed through its `data`
+        attribute for the first time. Use `elements()` to read the data without copying it.
+        The data type and vector size are copied.
+        :param name: name of the new primitive structure
+        :return: the new `DdlPrimitive`
+        """
+        instance = _PrimitiveInstance.__new__(_PrimitiveInstance)
+        instance.__dict__.update(_hash=None, _prototype=self, data_type=self.data_type, name=name,
+                                 name_is_global=True, vector_size=self.vector_size)
+        return instance
 
     def is_simple_primitive(self):
-        if len(self.data) == 1:
+        data = _shared(self, "data")
+        count = len(data)
+        if self.vector_size != 0 and isinstance(data, (array.array, memoryview)):
+            count //= self.vector_size
+
+        if count == 1:
             return self.vector_size <= 4
-        elif len(self.data) <= 4:
+        elif count <= 4:
             return self.vector_size == 0
         return False
 
+    def elements(self):
+        """
+        Get the data as a sequence of values, or of tuples if vector_size != 0, regardless of whether it is stored
+        as list or as typed buffer (flat `array.array` or `memoryview`, numpy array).
+        :return: a sequence of values or tuples
+        """
+        data = _shared(self, "data")
+        if not hasattr(data, "tolist"):
+            return data
+
+        data = data.tolist()
+        if self.vector_size != 0 and len(data) != 0 and not isinstance(data[0], list):
+            # flat buffer
+            return list(zip(*[iter(data)] * self.vector_size))
+        return data
+
+    def content_hash(self):
+        """
+        Get a hash of everything that influences how this primitive is written.
+        The hash is memoized and reset whenever an attribute of the primitive is assigned. Changes made to `data`
+        in place are not noticed, call `invalidate_hash()` after those. Typed data (`array.array`, `memoryview`,
+        numpy array) is hashed as raw bytes with its format and shape, so it hashes differently than a list of the
+        same values.
+        :return: a 16 byte digest
+        """
+        if self._hash is None:
+            _compute_hashes(self)
+        return self._hash
+
+    def invalidate_hash(self):
+        """
+        Reset the memoized content hash of this primitive and of all structures containing it.
+        """
+        _invalidate(self)
+
+    def __getstate__(self):
+        state = _node_state(self)
+        # views of snapshot or spill files cannot be pickled, copies of their values can
+        if isinstance(state.get("data"), (memoryview, _VectorView)):
+            state["data"] = _copy_data(state["data"])
+        return state
+
+    def _digest(self):
+        h = hashlib.blake2b(_header_key(self), digest_size=16)
+        data = _shared(self, "data")
+        if isinstance(data, _VectorView):
+            data = data.buffer
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            data = numpy.ascontiguousarray(data)
+        if isinstance(data, (array.array, memoryview)) or numpy is not None and isinstance(data, numpy.ndarray):
+            # typed buffers are hashed as they are, without converting the values to Python objects
+            view = memoryview(data)
+            h.update(repr((view.format, view.shape)).encode())
+            h.update(view.cast("B") if view.c_contiguous else view.tobytes())
+            return h.digest()
+
+        data = self.elements()
+        if self.data_type == DdlPrimitiveDataType.ref:
+            h.update(repr([_ref_key(ref) for ref in data]).encode())
+        elif self.vector_size == 0:
+            h.update(repr(list(data)).encode())
+        else:
+            h.update(repr([tuple(vec) for vec in data]).encode())
+        return h.digest()
+
+
+class _PrimitiveInstance(DdlPrimitive):
+    """
+    A primitive structure which shares its data with its prototype, see `DdlPrimitive.instance()`.
+    """
+
+    def __getattr__(self, key):
+        # only called for attributes which are not set, i.e. those still shared with the prototype
+        prototype = self.__dict__.get("_prototype")
+        if prototype is None or key[0] == "_":
+            raise AttributeError(key)
+        if key == "data":
+            # copied on first access, since it may be modified in place through it
+            data = _copy_data(_shared(prototype, "data"))
+            self.__dict__["data"] = data
+            return data
+        return getattr(prototype, key)
+
 
 class DdlStructure:
     """
@@ -68,31 +213,62 @@ class DdlStructure:
         :param name: optional name
         :param children: list of substructures
         """
-        self.children = children
-        self.properties = props
-        self.identifier = identifier
-        self.name = name if name != "" else None
-        self.name_is_global = True
+        # assigned directly, there is no hash to invalidate yet, see `DdlPrimitive`
+        attributes = self.__dict__
+        attributes["_hash"] = None
+        attributes["children"] = DdlChildList(children)
+        attributes["properties"] = DdlPropertyDict(props)
+        attributes["identifier"] = identifier
+        attributes["name"] = name if name != "" else None
+        attributes["name_is_global"] = True
+
+    def __setattr__(self, key, value):
+        if key == "children":
+            value = DdlChildList(value)
+        elif key == "properties":
+            value = DdlPropertyDict(value)
+
+        object.__setattr__(self, key, value)
+        if self._hash is not None and key[0] != "_":
+            _invalidate(self)
+
+    def instance(self, name=None, props=None):
+        """
+        Create a structure which shares the substructures and properties of this one (its prototype).
+        Nothing is copied until the `children` or `properties` of the instance are accessed for the first time, then
+        the substructures are replaced with instances of themselves, so they are copied lazily as well. Until then,
+        writers reuse the text of the prototype's substructures.
+        :param name: name of the new structure
+        :param props: dict of properties to set on the new structure, in addition to those of the prototype
+        :return: the new `DdlStructure`
+        """
+        instance = _StructureInstance.__new__(_StructureInstance)
+        instance.__dict__.update(_hash=None, _prototype=self, identifier=self.identifier, name=name,
+                                 name_is_global=True)
+        if props:
+            instance.properties.update(props)
+        return instance
 
     def is_simple_structure(self):
         """
         A structure is simple if it contains exactly one primitive and has no properties or name.
         :return: true if this structure is simple
         """
-        if len(self.children) != 1:
+        children = _shared(self, "children")
+        if len(children) != 1:
             # a simple structure may contain only one primitive substructure
             return False
-        if len(self.properties) > 1:
+        if len(_shared(self, "properties")) > 1:
             # a simple structure does not have more than one property
             return False
         if self.name is not None:
             # simple children don't have a name
             return False
-        if not isinstance(self.children[0], DdlPrimitive):
+        if not isinstance(children[0], DdlPrimitive):
             # the only substructure needs to be a primitive
             return False
 
-        return self.children[0].is_simple_primitive()
+        return children[0].is_simple_primitive()
 
     def add_structure(self, identifier, name=None, children=[], props=dict()):
         """
@@ -119,6 +295,76 @@ class DdlStructure:
         self.children.append(DdlPrimitive(data_type, data, name, vector_size))
         return self
 
+    def content_hash(self):
+        """
+        Get a hash of this structure and all of its substructures, computed bottom-up.
+        Hashes are memoized per structure and reset whenever the structure or one of its descendants is modified, so
+        after a change only the path up to the root is rehashed. Referenced structures are hashed by name only.
+        :return: a 16 byte digest, usable as a cache key for the written output
+        """
+        if self._hash is None:
+            _compute_hashes(self)
+        return self._hash
+
+    def invalidate_hash(self):
+        """
+        Reset the memoized content hash of this structure and of all structures containing it.
+        """
+        _invalidate(self)
+
+    def diff(self, other):
+        """
+        Find the differences between this structure and another one.
+        Only substructures whose content hashes differ are visited.
+        :param other: the structure to compare to
+        :return: list of `DdlDifference`
+        """
+        return _diff([(self, other, (), ())])
+
+    def __getstate__(self):
+        return _node_state(self)
+
+    def __setstate__(self, state):
+        # child lists and property dicts are pickled as plain containers. Instances do not have them while they are
+        # shared with the prototype. The state may be another node's, e.g. with `copy.copy()`, it is not changed.
+        state = dict(state)
+        if "children" in state:
+            state["children"] = DdlChildList(state.pop("children"))
+        if "properties" in state:
+            state["properties"] = DdlPropertyDict(state.pop("properties"))
+        self.__dict__.update(state)
+
+    def _digest(self):
+        h = hashlib.blake2b(_header_key(self), digest_size=16)
+        for child in _shared(self, "children"):
+            h.update(child._hash)
+        return h.digest()
+
+
+class _StructureInstance(DdlStructure):
+    """
+    A structure which shares its substructures and properties with its prototype, see `DdlStructure.instance()`.
+    """
+
+    def __getattr__(self, key):
+        # only called for attributes which are not set, i.e. those still shared with the prototype
+        prototype = self.__dict__.get("_prototype")
+        if prototype is None or key[0] == "_":
+            raise AttributeError(key)
+        if key == "children":
+            # copied on first access, since the list or any of the substructures may be modified through it
+            children = DdlChildList(child.instance() for child in _shared(prototype, "children"))
+            self.__dict__["children"] = children
+            _invalidate(self)
+            return children
+        if key == "properties":
+            properties = DdlPropertyDict(_shared(prototype, "properties"))
+            self.__dict__["properties"] = properties
+            # the new dict is only linked to the instance by its next `content_hash()`
+            _invalidate(self)
+            return properties
+        return getattr(prototype, key)
+
 
 class DdlDocument:
     """
@@ -126,7 +372,16 @@ class DdlDocument:
     """
 
     def __init__(self):
-        self.structures = []
+        self.__dict__["_hash"] = None
+        self.__dict__["structures"] = DdlChildList()
+
+    def __setattr__(self, key, value):
+        if key == "structures":
+            value = DdlChildList(value)
+
+        object.__setattr__(self, key, value)
+        if self._hash is not None and key[0] != "_":
+            _invalidate(self)
 
     def add_structure(self, identifier, name=None, children=[], props=dict()):
         """
@@ -141,18 +396,599 @@ class DdlDocument:
         self.structures.append(s)
         return s
 
+    def content_hash(self):
+        """
+        Get a hash of the entire document. See `DdlStructure.content_hash()`.
+        :return: a 16 byte digest
+        """
+        if self._hash is None:
+            _compute_hashes(self)
+        return self._hash
+
+    def diff(self, other):
+        """
+        Find the differences between this document and another one, e.g. two versions of the same scene.
+        Only substructures whose content hashes differ are visited.
+        :param other: the document to compare to
+        :return: list of `DdlDifference`
+        """
+        return _diff([(self, other, (), ())])
+
+    def __getstate__(self):
+        return _node_state(self)
+
+    def __setstate__(self, state):
+        state = dict(state)
+        state["structures"] = DdlChildList(state.pop("structures"))
+        self.__dict__.update(state)
+
+    def _digest(self):
+        h = hashlib.blake2b(b"document", digest_size=16)
+        for child in self.structures:
+            h.update(child._hash)
+        return h.digest()
+
+
+class DdlFragment:
+    """
+    Text of one or more structures which has been written before, e.g. cached output of an earlier export or output
+    created by other processes. Can be added to the substructures of a `DdlStructure` or the structures of a
+    `DdlDocument` and is copied to the output by the text writers without encoding anything again.
+
+    The text is not parsed, so it is not checked, its structures are not indexed and cannot be referenced as objects.
+    """
+
+    def __init__(self, text, compressed=None):
+        """
+        Constructor
+        :param text: the structures as written by `DdlTextWriter` at top-level. `DdlTextWriter` indents every
+            non-empty line to the level the fragment is written at.
+        :param compressed: optional text of the same structures as written by `DdlCompressedTextWriter`, which
+            writes `text` instead if not given
+        """
+        # assigned directly, there is no hash to invalidate yet
+        self.__dict__.update(_hash=None, text=text, compressed=compressed)
+
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        if self._hash is not None and key[0] != "_":
+            _invalidate(self)
+
+    @staticmethod
+    def from_structures(structures, rounding=6):
+        """
+        Write structures to a fragment in both text styles.
+        :param structures: iterable of `DdlStructure`
+        :param rounding: number of decimal places to keep or None to keep all
+        :return: the new `DdlFragment`
+        """
+        structures = list(structures)
+        text_writer = DdlTextWriter(None, rounding)
+        compressed_writer = DdlCompressedTextWriter(None, rounding)
+        return DdlFragment(B"\n".join(text_writer.structure_as_text(s) for s in structures),
+                           B"".join(compressed_writer.structure_as_text(s) for s in structures))
+
+    def instance(self, name=None):
+        # fragments are not copied, instances of their parents share them
+        return self
+
+    def content_hash(self):
+        """
+        Get a hash of the text of this fragment, see `DdlStructure.content_hash()`.
+        :return: a 16 byte digest
+        """
+        if self._hash is None:
+            _compute_hashes(self)
+        return self._hash
+
+    def invalidate_hash(self):
+        """
+        Reset the memoized content hash of this fragment and of all structures containing it.
+        """
+        _invalidate(self)
+
+    def __getstate__(self):
+        return _node_state(self)
+
+    def _digest(self):
+        h = hashlib.blake2b(B"fragment %d " % len(self.text), digest_size=16)
+        h.update(self.text)
+        if self.compressed is not None:
+            h.update(B" ")
+            h.update(self.compressed)
+        return h.digest()
+
+
+class DdlChildList(list):
+    """
+    List of substructures of a `DdlStructure` or `DdlDocument`.
+
+    Behaves like a regular list, but invalidates the content hash of its owner on modification.
+    """
+
+    # weak reference to the owner, only set once the owner has a content hash, see `_link()`
+    _owner = None
+
+    def __reduce__(self):
+        # the owner re-creates the list when it is unpickled
+        return list, (list(self),)
+
+    def _changed(self):
+        if self._owner is not None:
+            _invalidate_owner(self)
+
+    def append(self, child):
+        list.append(self, child)
+        if self._owner is not None:
+            _invalidate_owner(self)
+
+    def extend(self, children):
+        list.extend(self, children)
+        self._changed()
+
+    def insert(self, index, child):
+        list.insert(self, index, child)
+        self._changed()
+
+    def __iadd__(self, children):
+        self.extend(children)
+        return self
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._changed()
+        return self
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def pop(self, index=-1):
+        child = list.pop(self, index)
+        self._changed()
+        return child
+
+    def remove(self, child):
+        list.remove(self, child)
+        self._changed()
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
+
+class DdlPropertyDict(dict):
+    """
+    Properties of a `DdlStructure`.
+
+    Behaves like a regular (insertion ordered) dict, but invalidates the content hash of its owner on modification.
+    """
+
+    # weak reference to the owner, only set once the owner has a content hash, see `_link()`
+    _owner = None
+
+    def __reduce__(self):
+        # the owner re-creates the dict when it is unpickled
+        return dict, (dict(self),)
+
+    def _changed(self):
+        if self._owner is not None:
+            _invalidate_owner(self)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        value = dict.pop(self, *args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self._changed()
+        return item
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+
+
+DdlDifference = namedtuple("DdlDifference", ["old_path", "new_path", "old", "new"])
+DdlDifference.__doc__ = """
+A difference between two documents or structures found by `diff()`.
+
+Paths are tuples of child indices from the compared roots. For inserted substructures `old` and `old_path` are None,
+for removed ones `new` and `new_path` are None.
+"""
+
+
+def _attach(child, parent, reference=None):
+    """
+    Register a weak reference to a parent (or instance) of a node, whose hash is invalidated with the node's.
+    Parents are keyed by id, an entry of a parent which no longer exists is replaced by the new owner of its id.
+    :param reference: `weakref.ref(parent)`, if it was created already
+    """
+    if reference is None:
+        reference = weakref.ref(parent)
+    attributes = child.__dict__
+    parents = attributes.get("_parents")
+    if parents is None:
+        attributes["_parents"] = {id(parent): reference}
+    elif parents.get(id(parent)) is not reference:
+        parents[id(parent)] = reference
+
+
+def _link(node, children, prototype):
+    """
+    Link a node which was just hashed to everything its hash depends on.
+    Links are only created for hashed nodes and are weak, so documents which are never hashed do not pay for them,
+    and no reference cycles keep documents alive until the garbage collector runs. Links of removed children are not
+    removed again, they only cause the hash of the former parent to be recomputed unnecessarily.
+    """
+    reference = weakref.ref(node)
+    for child in children:
+        _attach(child, node, reference)
+    if prototype is not None:
+        _attach(prototype, node, reference)
+
+    attributes = node.__dict__
+    if isinstance(node, DdlDocument):
+        attributes["structures"]._owner = reference
+    elif isinstance(node, DdlStructure):
+        # instances do not have their own containers while they are shared with the prototype
+        for key in ("children", "properties"):
+            container = attributes.get(key)
+            if container is not None:
+                container._owner = reference
+
+
+def _invalidate_owner(container):
+    owner = container._owner()
+    if owner is not None:
+        _invalidate(owner)
+
+
+def _node_state(node):
+    # parent links are weak and the hash is only valid while they exist, both are restored by `content_hash()`
+    state = dict(node.__dict__)
+    state.pop("_parents", None)
+    state["_hash"] = None
+    return state
+
+
+def _shared_owner(node, key):
+    """
+    :return: the node in the prototype chain of `node` which holds the attribute `key`
+    """
+    while key not in node.__dict__:
+        node = node.__dict__["_prototype"]
+    return node
+
+
+def _shared(node, key):
+    """
+    Get an attribute of a node without copying it, even if it is still shared with the prototype of the node.
+    Must not be used to modify the attribute.
+    """
+    attributes = node.__dict__
+    if key in attributes:
+        return attributes[key]
+    return _shared_owner(node, key).__dict__[key]
+
+
+def _copy_data(data):
+    if isinstance(data, memoryview):
+        return array.array(data.format, data.tobytes())
+    if isinstance(data, array.array):
+        return data[:]
+    return data.copy() if hasattr(data, "copy") else list(data)
+
+
+def _invalidate(node):
+    # A node only has a hash if all of its descendants have one and all changes are propagated upwards, so we can stop
+    # at the first node without a hash.
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node._hash is not None:
+            node.__dict__["_hash"] = None
+            parents = node.__dict__.get("_parents")
+            if parents:
+                stack.extend(parent for parent in [reference() for reference in parents.values()]
+                             if parent is not None)
+
+
+def _compute_hashes(root):
+    # post-order traversal with an explicit stack, deep hierarchies would exceed the recursion limit otherwise. Every
+    # entry holds a node and, once it was visited, the children its hash is computed from.
+    stack = [(root, None)]
+    # the links created are all alive until the end, collecting garbage in between would only waste time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while stack:
+            node, children = stack.pop()
+            if node._hash is not None:
+                continue
+            prototype = node.__dict__.get("_prototype")
+            if children is None:
+                if isinstance(node, DdlDocument):
+                    children = node.structures
+                elif isinstance(node, DdlStructure):
+                    children = _shared(node, "children")
+                else:
+                    children = ()
+                pending = [child for child in children if child._hash is None]
+                # an instance is invalidated through its prototype, so the prototype needs a hash as well
+                if prototype is not None and prototype._hash is None:
+                    pending.append(prototype)
+                if pending:
+                    stack.append((node, children))
+                    stack.extend((child, None) for child in pending)
+                    continue
+            node.__dict__["_hash"] = node._digest()
+            _link(node, children, prototype)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _ref_key(ref):
+    if ref is None or isinstance(ref, bytes):
+        return ref
+    return (B"$" if ref.name_is_global else B"%") + ref.name
+
+
+def _header_key(node):
+    """
+    :return: byte string of everything except the substructures that influences the output of a (primitive) structure
+    """
+    if isinstance(node, DdlPrimitive):
+        key = (b"primitive", node.data_type.name, node.vector_size, node.name, node.name_is_global,
+               getattr(node, "comment", None), getattr(node, "max_elements_per_line", None))
+    else:
+        props = tuple((k, _ref_key(v) if isinstance(v, (DdlStructure, DdlPrimitive)) else v)
+                      for k, v in _shared(node, "properties").items())
+        key = (b"structure", node.identifier, node.name, node.name_is_global, props,
+               getattr(node, "comment", None))
+    return repr(key).encode()
+
+
+def _diff(stack):
+    differences = []
+    while stack:
+        old, new, old_path, new_path = stack.pop()
+        if old.content_hash() == new.content_hash():
+            continue
+        if isinstance(old, DdlDocument):
+            old_children, new_children = old.structures, new.structures
+        elif isinstance(old, DdlStructure) and isinstance(new, DdlStructure) \
+                and _header_key(old) == _header_key(new):
+            old_children, new_children = _shared(old, "children"), _shared(new, "children")
+        else:
+            differences.append(DdlDifference(old_path, new_path, old, new))
+            continue
+
+        old_hashes = [child.content_hash() for child in old_children]
+        new_hashes = [child.content_hash() for child in new_children]
+
+        # skip common prefix and suffix, usually only few substructures changed
+        start = 0
+        end = min(len(old_hashes), len(new_hashes))
+        while start < end and old_hashes[start] == new_hashes[start]:
+            start += 1
+        old_end, new_end = len(old_hashes), len(new_hashes)
+        while old_end > start and new_end > start and old_hashes[old_end - 1] == new_hashes[new_end - 1]:
+            old_end -= 1
+            new_end -= 1
+
+        matcher = difflib.SequenceMatcher(None, old_hashes[start:old_end], new_hashes[start:new_end], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+            paired = min(i2 - i1, j2 - j1)
+            for k in range(paired):
+                stack.append((old_children[i1 + k], new_children[j1 + k], old_path + (i1 + k,), new_path + (j1 + k,)))
+            for i in range(i1 + paired, i2):
+                differences.append(DdlDifference(old_path + (i,), None, old_children[i], None))
+            for j in range(j1 + paired, j2):
+                differences.append(DdlDifference(None, new_path + (j,), None, new_children[j]))
+
+    return differences
+
+
+# first line of indices, and last line of files with an index footer, with the offset of the footer
+_INDEX_MAGIC = B"pyddl-index"
+_INDEX_FOOTER = B"// pyddl-index %20d\n"
+
+# number of byte strings collected in an output buffer before it is written to the file
+_FLUSH_THRESHOLD = 4096
+
+# number of values of typed primitive data encoded at once when writing to a file
+_CHUNK_VALUES = 1 << 16
+
+# maximum number of string literals cached by a text writer
+_STRING_CACHE_SIZE = 1 << 16
+
+# quotes, backslashes and control characters, which cannot appear unescaped in string literals
+_STRING_SPECIAL = re.compile("[\"\\\\\x00-\x1f\x7f-\x9f]")
+
+_C1_CONTROL = re.compile("[\x80-\x9f]")
+
+_STRING_ESCAPES = {"\"": "\\\"", "\\": "\\\\", "\a": "\\a", "\b": "\\b", "\f": "\\f", "\n": "\\n",
+                   "\r": "\\r", "\t": "\\t", "\v": "\\v"}
+
+
+# UTF-8 bytes which are never part of quotes, backslashes or ASCII control characters
+_PLAIN_BYTES = bytes(c for c in range(0x20, 0x100) if c not in B"\"\\\x7f")
+
+
+def _escape(match):
+    char = match.group()
+    escape = _STRING_ESCAPES.get(char)
+    if escape is None:
+        escape = "\\x%02x" % ord(char) if char < "\x80" else "\\u%04x" % ord(char)
+    return escape
+
+
+def _plain_string_array(values, separator, line_break=None, n=None):
+    """
+    Join the literals of string values, which is several times faster than encoding every value on its own.
+    :param values: sequence of str or bytes of UTF-8 text, may be mixed
+    :param separator: byte string between values
+    :param line_break: byte string between every n values
+    :param n: number of values per line or None
+    :return: a byte string, or None if there are no values or any value has characters which need to be escaped
+    """
+    if len(values) == 0:
+        return None
+    quoted_separator = "\"" + separator.decode("UTF-8") + "\""
+    quoted_line_break = None if n is None else "\"" + line_break.decode("UTF-8") + "\""
+
+    def join(values):
+        if n is None:
+            return quoted_separator.join(values)
+        return quoted_line_break.join(quoted_separator.join(values[i:i + n]) for i in range(0, len(values), n))
+
+    try:
+        text = join(values)
+    except TypeError:
+        values = [value.decode("UTF-8") if isinstance(value, bytes) else value for value in values]
+        text = join(values)
+
+    breaks = 0 if n is None else (len(values) - 1) // n
+    encoded = B"\"" + bytes(text, "UTF-8") + B"\""
+
+    # the values need no escaping if only the quotes and whitespace of the separators are left, which is much faster
+    # to check than searching with `_STRING_SPECIAL`. C1 control characters start with 0xc2 in UTF-8.
+    special = len(encoded.translate(None, _PLAIN_BYTES))
+    expected = 2 + (len(values) - 1 - breaks) * (len(separator.translate(None, _PLAIN_BYTES)) + 2)
+    if breaks:
+        expected += breaks * (len(line_break.translate(None, _PLAIN_BYTES)) + 2)
+    if special != expected or (B"\xc2" in encoded and _C1_CONTROL.search(text) is not None):
+        return None
+    return encoded
+
+
+# end marker for iterators
+_END = object()
+
+
+DdlWriteProgress = namedtuple("DdlWriteProgress", ["structures", "total_structures", "elements", "total_elements",
+                                                   "written", "estimated_size"])
+DdlWriteProgress.__doc__ = """
+Progress of a write reported to the progress callback of a `DdlWriter`.
+
+`structures` and `elements` count the structures and the values of primitive data written so far, out of the totals of
+the document. `written` is the number of bytes written to the file, `estimated_size` the expected size of the file
+extrapolated from it, or None before anything was written.
+"""
+
+
+class DdlWriteCancelled(Exception):
+    """
+    Error raised by `DdlWriter.write()` when writing was cancelled with a `DdlCancellationToken`.
+    """
+
+
+class DdlCancellationToken:
+    """
+    Cancels writes which were given this token, e.g. from a user interface thread. Writers check the token whenever
+    they write a chunk to the file, stop, remove the partial file and raise `DdlWriteCancelled`.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Request cancellation of the writes using this token.
+        """
+        self.cancelled = True
+
+
+def _value_count(primitive):
+    """
+    :return: number of values in the data of a primitive structure, counting every component of vectors
+    """
+    data = _shared(primitive, "data")
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return data.size
+    if primitive.vector_size != 0 and not hasattr(data, "tolist"):
+        return len(data) * primitive.vector_size
+    return len(data)
+
+
+def _content_counts(nodes):
+    """
+    :param nodes: structures, primitive structures and fragments
+    :return: number of structures and number of values of primitive data in the nodes and their substructures
+    """
+    structures = values = 0
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, DdlPrimitive):
+            values += _value_count(node)
+        elif isinstance(node, DdlStructure):
+            structures += 1
+            stack.extend(_shared(node, "children"))
+    return structures, values
+
 
 class DdlWriter:
     """
     Abstract class for classes responsible for writing OpenDdlDocuments.
     """
 
-    def __init__(self, document):
+    # minimum number of seconds between two calls of the progress callback
+    progress_interval = 0.5
+
+    def __init__(self, document, *, progress=None, cancellation=None):
         """
         Constructor
         :param document: document to write
+        :param progress: optional callable, which is called with a `DdlWriteProgress` at most every
+            `progress_interval` seconds while writing, and once when the file is complete
+        :param cancellation: optional `DdlCancellationToken` to cancel writing with
         """
         self.doc = document
+        self.progress = progress
+        self.cancellation = cancellation
+        # structures and values of primitive data written so far and in the whole document
+        self.done = [0, 0]
+        self.totals = (0, 0)
+        self.next_report = 0.0
 
     def get_document(self):
         """
@@ -169,23 +1005,144 @@ class DdlWriter:
         """
         pass
 
+    def start_progress(self):
+        """
+        Reset the progress at the start of a write, and count the contents of the document if progress is reported.
+        """
+        self.done = [0, 0]
+        self.next_report = time.monotonic() + self.progress_interval
+        if self.progress is not None:
+            self.totals = _content_counts(self.get_document().structures)
+
+    def report_progress(self, written, final=False):
+        """
+        Check for cancellation and call the progress callback, if `progress_interval` has passed since the last call.
+        Called by implementations whenever they have written a chunk to the file.
+        :param written: number of bytes written so far
+        :param final: whether the file is complete, which is always reported
+        :raise DdlWriteCancelled: if the cancellation token was cancelled
+        """
+        if self.cancellation is not None and self.cancellation.cancelled:
+            raise DdlWriteCancelled("writing was cancelled")
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not final and now < self.next_report:
+            return
+        self.next_report = now + self.progress_interval
+
+        structures, elements = self.done
+        total_structures, total_elements = self.totals
+        # every structure and every value is assumed to take about the same number of bytes
+        done = structures + elements
+        if final:
+            estimated_size = written
+        elif done and written:
+            estimated_size = max(written, written * (total_structures + total_elements) // done)
+        else:
+            estimated_size = None
+        self.progress(DdlWriteProgress(structures, total_structures, elements, total_elements, written,
+                                       estimated_size))
+
+
+class DdlTextLayout:
+    """
+    Layout of the text written by `DdlTextWriter`: indentation, line breaks and the whitespace between tokens.
+    Everything else, i.e. how structures and data are encoded, is the same for every layout.
+    """
+
+    def __init__(self, indent=B"\t", newline=B"\n", space=B" ", comment_prefix=B"\t\t// ", line_width=None):
+        """
+        Constructor
+        :param indent: byte string substructures are indented with per level
+        :param newline: line break, or B"" to write everything on one line
+        :param space: byte string written between tokens for readability, e.g. after commas, or B""
+        :param comment_prefix: byte string written before comments set with `DdlTextWriter.set_comment()`, or None to
+            leave out comments. Comments need line breaks.
+        :param line_width: optional maximum width in bytes of the lines of primitive data, excluding indentation.
+            Lines are broken between elements, primitives with `max_elements_per_line` set are not affected.
+        """
+        if comment_prefix is not None and not newline:
+            raise ValueError("comments can only be written with line breaks")
+
+        self.indent = indent
+        self.newline = newline
+        self.space = space
+        self.comment_prefix = comment_prefix
+        self.line_width = line_width
+
+    @staticmethod
+    def compact():
+        """
+        :return: the layout of `DdlCompressedTextWriter`, without any whitespace or comments
+        """
+        return DdlTextLayout(indent=B"", newline=B"", space=B"", comment_prefix=None)
+
+
+def _wrap(items, separator, width):
+    """
+    Group byte strings into lines of at most `width` bytes including separators, with at least one item per line.
+    :return: list of lines, each a list of items
+    """
+    lines = []
+    line = []
+    size = 0
+    for item in items:
+        if line and size + len(separator) + len(item) > width:
+            lines.append(line)
+            line = []
+        size = len(item) if not line else size + len(separator) + len(item)
+        line.append(item)
+    if line:
+        lines.append(line)
+    return lines
+
 
 class DdlTextWriter(DdlWriter):
     """
     OpenDdlWriter which writes OpenDdlDocuments in human-readable text form.
+
+    The whitespace is decided by a `DdlTextLayout`, so this writer also writes the output of
+    `DdlCompressedTextWriter` or any custom layout.
     """
 
-    def __init__(self, document, rounding=6):
+    def __init__(self, document, rounding=6, *, index=None, layout=None, progress=None, cancellation=None):
         """
         Constructor
         :param document: document to write
         :param rounding: number of decimal places to keep or None to keep all
+        :param index: None, "footer" to append an index of the top-level and globally named structures to the file
+            as a comment, or "sidecar" to write it to a separate file with ".index" appended to the file name. See
+            `DdlIndex`.
+        :param layout: `DdlTextLayout` to write with, the default layout is human-readable with tabs and blank
+            lines between structures
+        :param progress: optional progress callback, see `DdlWriter`
+        :param cancellation: optional `DdlCancellationToken`, see `DdlWriter`
         """
-        DdlWriter.__init__(self, document)
+        DdlWriter.__init__(self, document, progress=progress, cancellation=cancellation)
+        if index not in (None, "footer", "sidecar"):
+            raise ValueError("index must be None, \"footer\" or \"sidecar\"")
 
         self.file = None
+        self.layout = DdlTextLayout() if layout is None else layout
         self.indent = B""
         self.rounding = rounding
+        # text of the substructures of prototypes by content hash (and indent), reused for unmodified instances
+        self.prototype_encodings = {}
+        # indented text of fragments by content hash and indent
+        self.fragment_encodings = {}
+        # string literals by value, see `to_string_literal()`
+        self.string_encodings = {}
+
+        self.index = index
+        # list of [offset, length, top-level, identifier, name] of the written structures, if an index is written
+        self.index_entries = []
+        # number of bytes written to the current file, number of byte strings in the buffer and their total size
+        # counted by `buffer_position()` so far
+        self.written = 0
+        self.counted = (0, 0)
+        # structures and values in the substructures of prototypes by id, counted for the progress of instances
+        self.prototype_counts = {}
 
     def to_float_byte_rounded(self, f):
         if (math.isinf(f)) or (math.isnan(f)):
@@ -206,8 +1163,28 @@ class DdlTextWriter(DdlWriter):
 
     @staticmethod
     def to_string_byte(s):
+        """
+        :param s: str, or bytes of UTF-8 text
+        :return: string literal with quotes, backslashes and control characters escaped, see the OpenDDL specification
+        """
+        if isinstance(s, bytes):
+            s = s.decode("UTF-8")
+        if _STRING_SPECIAL.search(s) is not None:
+            s = _STRING_SPECIAL.sub(_escape, s)
         return B"\"" + bytes(s, "UTF-8") + B"\""
 
+    def to_string_literal(self, s):
+        """
+        Like `to_string_byte()`, but literals are cached by value, so that repeated strings like texture paths or bone
+        names are only escaped and encoded once per writer.
+        """
+        literal = self.string_encodings.get(s)
+        if literal is None:
+            if len(self.string_encodings) >= _STRING_CACHE_SIZE:
+                self.string_encodings.clear()
+            literal = self.string_encodings[s] = self.to_string_byte(s)
+        return literal
+
     @staticmethod
     def to_bool_byte(b):
         return B"true" if b else B"false"
@@ -216,8 +1193,14 @@ class DdlTextWriter(DdlWriter):
     def to_ref_byte(structure):
         if structure is None:
             return B"null"
+        if isinstance(structure, DdlReference):
+            return structure
         return (B"$" if structure.name_is_global else B"%") + structure.name
 
+    @staticmethod
+    def to_type_byte(data_type):
+        return bytes(data_type.name, "UTF-8")
+
     @staticmethod
     def id(val):
         return val
@@ -226,31 +1209,96 @@ class DdlTextWriter(DdlWriter):
         """
         Increase the current line indent.
         """
-        self.indent = self.indent + B"\t"
+        self.indent = self.indent + self.layout.indent
 
     def dec_indent(self):
         """
         Decrease the current line indent.
         """
-        self.indent = self.indent[:-1]
+        if self.layout.indent:
+            self.indent = self.indent[:-len(self.layout.indent)]
 
     def write(self, filename):
+        """
+        Write the document to a file. The file is always closed, and removed again if writing fails or is cancelled.
+        :param filename: path to a file to write to
+        :raise DdlWriteCancelled: if writing was cancelled with the cancellation token
+        """
         self.file = open(filename, "wb")
+        # a previous write may have stopped anywhere
+        self.indent = B""
+        self.written = 0
+        self.counted = (0, 0)
+        self.index_entries = []
+        self.prototype_counts = {}
+        newline = self.layout.newline
+        complete = False
+        try:
+            self.start_progress()
+            out = []
+            previous_was_simple = False
+            for i, structure in enumerate(self.get_document().structures):
+                is_fragment = isinstance(structure, DdlFragment)
+                # simple structures are only kept together if there are line breaks
+                is_simple = newline and not is_fragment and structure.is_simple_structure()
+                # first element will never prepend a empty line
+                if i != 0 and not (previous_was_simple and is_simple):
+                    out.append(newline)
+                previous_was_simple = is_simple
+
+                if is_fragment:
+                    out.append(self.fragment_as_text(structure))
+                else:
+                    self.structure_to_buffer(structure, out, flush=True)
+
+            self.flush_buffer(out)
+            if self.index is not None:
+                self.write_index(filename)
+            self.report_progress(self.written, final=True)
+            complete = True
+        finally:
+            self.file.close()
+            if not complete:
+                os.remove(filename)
+                if self.index == "sidecar" and os.path.exists(filename + ".index"):
+                    os.remove(filename + ".index")
+
+    def flush_buffer(self, out):
+        """
+        Write the contents of an output buffer to the current file and empty it.
+        :param out: list of byte strings
+        """
+        data = B''.join(out)
+        self.file.write(data)
+        self.written += len(data)
+        self.counted = (0, 0)
+        out.clear()
+        self.report_progress(self.written)
+
+    def buffer_position(self, out):
+        """
+        Get the offset in the current file at which the next byte string appended to an output buffer will be written.
+        Every byte string is only counted once, until the buffer is flushed.
+        :param out: list of byte strings, which is flushed with `flush_buffer()`
+        :return: offset in bytes
+        """
+        count, size = self.counted
+        size += sum(map(len, out[count:]))
+        self.counted = (len(out), size)
+        return self.written + size
 
-        if len(self.get_document().structures) != 0:
-            # first element will never prepend a empty line
-            structure = self.get_document().structures[0]
-            self.file.write(self.structure_as_text(structure))
-            previous_was_simple = structure.is_simple_structure()
-
-            for structure in self.get_document().structures[1:]:
-                if not (previous_was_simple and structure.is_simple_structure()):
-                    self.file.write(B"\n")
-                    previous_was_simple = structure.is_simple_structure()
-
-                self.file.write(self.structure_as_text(structure))
-
-        self.file.close()
+    def write_index(self, filename):
+        """
+        Write the index of the structures written to the current file, as footer or sidecar file.
+        :param filename: path of the current file
+        """
+        lines = [B"%d %d %d %s %s\n" % (offset, length, top_level, identifier, B"-" if name is None else name)
+                 for offset, length, top_level, identifier, name in self.index_entries]
+        if self.index == "footer":
+            self.file.write(B"".join([B"/* " + _INDEX_MAGIC + B"\n"] + lines + [B"*/\n", _INDEX_FOOTER % self.written]))
+        else:
+            with open(filename + ".index", "wb") as file:
+                file.write(B"".join([_INDEX_MAGIC + B" %d\n" % self.written] + lines))
 
     def property_as_text(self, prop):
         """
@@ -265,37 +1313,47 @@ class DdlTextWriter(DdlWriter):
             value_bytes = self.to_int_byte(value)
         elif isinstance(value, float):
             value_bytes = self.to_float_byte(value)
-        elif isinstance(value, DdlStructure):
+        elif isinstance(value, (DdlStructure, DdlPrimitive)):
             value_bytes = self.to_ref_byte(value)
-        elif isinstance(value, str):
-            value_bytes = B"\"" + bytes(value, "UTF-8") + B"\""
-        elif isinstance(value, bytes):
-            value_bytes = B"\"" + value + B"\""
+        elif isinstance(value, (str, bytes)):
+            value_bytes = self.to_string_literal(value)
+        elif isinstance(value, DdlPrimitiveDataType):
+            value_bytes = self.to_type_byte(value)
+        elif isinstance(value, DdlReference):
+            value_bytes = value
         else:
             raise TypeError("ERROR: Unknown property type for property \"{}\"".format(prop[0]))
 
-        return prop[0] + B" = " + value_bytes
+        space = self.layout.space
+        return prop[0] + space + B"=" + space + value_bytes
 
-    def primitive_as_text(self, primitive, no_indent=False):
+    def primitive_header(self, primitive, no_indent=False):
         """
-        Get a text representation of the given primitive structure
-        :param primitive: primitive structure to get the text representation for
+        Get the text of a primitive structure up to its data: data type, vector size, name and comment.
+        :param primitive: the primitive structure
         :param no_indent: if true will skip adding the first indent
-        :return: a byte string representing the primitive structure
+        :return: list of byte strings, and whether a comment was written
         """
+        layout = self.layout
         lines = [(B"" if no_indent else self.indent) + bytes(primitive.data_type.name, "UTF-8")]
 
         if primitive.vector_size > 0:
             lines.append(B"[" + self.to_int_byte(primitive.vector_size) + B"]")
 
         if primitive.name is not None:
-            lines.append(B" $" + primitive.name + B" ")
+            lines.append(layout.space + (B"$" if primitive.name_is_global else B"%") + primitive.name + layout.space)
 
-        has_comment = hasattr(primitive, 'comment')
+        has_comment = layout.comment_prefix is not None and hasattr(primitive, 'comment')
         if has_comment:
-            lines.append(B"\t\t// " + primitive.comment)
+            lines.append(layout.comment_prefix + primitive.comment)
+        return lines, has_comment
 
-        # find appropriate conversion function
+    def value_encoder(self, primitive):
+        """
+        Find the function which converts the values of a primitive structure to text.
+        :param primitive: the primitive structure
+        :return: a function from a value to a byte string
+        """
         if primitive.data_type in [DdlPrimitiveDataType.bool]:
             # bool
             to_bytes = self.to_bool_byte
@@ -309,112 +1367,347 @@ class DdlTextWriter(DdlWriter):
             # integer types
             to_bytes = self.to_int_byte
         elif primitive.data_type in [DdlPrimitiveDataType.string]:
-            # string
-            if primitive.vector_size == 0 and len(primitive.data) > 0:
-                to_bytes = self.id if isinstance(primitive.data[0], bytes) else self.to_string_byte
-            else:
-                if len(primitive.data) > 0:
-                    to_bytes = self.id if isinstance(primitive.data[0][0], bytes) else self.to_string_byte
+            # string, str and bytes may be mixed
+            to_bytes = self.to_string_literal
         elif primitive.data_type in [DdlPrimitiveDataType.ref]:
             to_bytes = self.to_ref_byte
+        elif primitive.data_type in [DdlPrimitiveDataType.type]:
+            to_bytes = self.to_type_byte
         else:
             raise TypeError("Encountered unknown primitive type.")
+        return to_bytes
 
-        if len(primitive.data) == 0:
-            lines.append(B"\n" if has_comment else B" ")
-            lines.append(B"{ }")
-        elif primitive.is_simple_primitive():
-            lines.append(B"\n" if has_comment else B" ")
-            if primitive.vector_size == 0:
-                lines.append(B"{" + B", ".join(map(to_bytes, primitive.data)) + B"}")
-            else:
-                lines.append(B"{{" + (B", ".join(map(to_bytes, primitive.data[0]))) + B"}}")
-        else:
-            lines.append(B"\n" + self.indent + B"{\n")
-            self.inc_indent()
+    def string_literals(self, values):
+        """
+        Get the literals of string values with `to_string_literal()`, looking up the cached ones all at once.
+        :param values: sequence of str or bytes
+        :return: list of byte strings
+        """
+        literals = list(map(self.string_encodings.get, values))
+        if None in literals:
+            literals = [self.to_string_literal(value) if literal is None else literal
+                        for value, literal in zip(values, literals)]
+        return literals
 
-            if primitive.vector_size == 0:
+    def values_as_text(self, primitive, data, to_bytes, separator, line_break=None, n=None):
+        """
+        Join the text of the values of a primitive structure without vectors. Arrays of strings which need no escaping
+        are joined as text and encoded at once.
+        :param primitive: the primitive structure
+        :param data: its data
+        :param to_bytes: function from a value to a byte string, see `value_encoder()`
+        :param separator: byte string between values
+        :param line_break: byte string between every n values
+        :param n: number of values per line or None
+        :return: a byte string
+        """
+        if primitive.data_type == DdlPrimitiveDataType.string:
+            text = _plain_string_array(data, separator, line_break, n)
+            if text is not None:
+                return text
+            values = self.string_literals(data)
+        else:
+            values = list(map(to_bytes, data))
+        if n is None:
+            return separator.join(values)
+        return line_break.join(separator.join(values[i:i + n]) for i in range(0, len(values), n))
+
+    def primitive_as_text(self, primitive, no_indent=False):
+        """
+        Get a text representation of the given primitive structure
+        :param primitive: primitive structure to get the text representation for
+        :param no_indent: if true will skip adding the first indent
+        :return: a byte string representing the primitive structure
+        """
+        layout = self.layout
+        space = layout.space
+        newline = layout.newline
+        separator = B"," + space
+
+        data = primitive.elements()
+        lines, has_comment = self.primitive_header(primitive, no_indent)
+        to_bytes = self.value_encoder(primitive)
+
+        if len(data) == 0:
+            lines.append(newline if has_comment else space)
+            lines.append(B"{" + space + B"}")
+        elif primitive.is_simple_primitive():
+            lines.append(newline if has_comment else space)
+            if primitive.vector_size == 0:
+                lines.append(B"{" + self.values_as_text(primitive, data, to_bytes, separator) + B"}")
+            else:
+                lines.append(B"{{" + (separator.join(map(to_bytes, data[0]))) + B"}}")
+        else:
+            lines.append(newline + self.indent + B"{" + newline)
+            self.inc_indent()
+            line_break = B"," + newline + self.indent
+
+            if primitive.vector_size == 0:
                 if hasattr(primitive, 'max_elements_per_line'):
                     n = primitive.max_elements_per_line
-                    data = primitive.data
-                    lines.append(self.indent + ((B",\n" + self.indent).join(
-                        [B", ".join(group) for group in
-                         [map(to_bytes, data[i:i + n]) for i in range(0, len(data), n)]])) + B"\n")
+                    lines.append(self.indent + self.values_as_text(primitive, data, to_bytes, separator, line_break, n)
+                                 + newline)
+                elif layout.line_width is not None:
+                    lines.append(self.indent + line_break.join(
+                        separator.join(line) for line in _wrap(map(to_bytes, data), separator, layout.line_width))
+                                 + newline)
                 else:
-                    lines.append(self.indent + (B", ".join(map(to_bytes, primitive.data))) + B"\n")
+                    lines.append(self.indent + self.values_as_text(primitive, data, to_bytes, separator) + newline)
             else:
                 if hasattr(primitive, 'max_elements_per_line'):
                     n = primitive.max_elements_per_line
-                    data = primitive.data
 
                     if len(data) == 1:
                         data = data[0]
                         # there is exactly one vector, we will handle its components for formatting with
                         # max_elements_per_line.
-                        lines.append(self.indent + B"{" + ((B",\n" + self.indent + B" ").join(
-                            [(B", ".join(map(to_bytes, line))) for line in
+                        lines.append(self.indent + B"{" + ((line_break + space).join(
+                            [(separator.join(map(to_bytes, line))) for line in
                              [data[i:i + n] for i in range(0, len(data), n)]  # group generator
-                             ]) + B"}\n"))
+                             ]) + B"}" + newline))
                     else:
-                        lines.append(self.indent + B"{" + ((B"},\n" + self.indent + B"{").join(
-                            [(B"}, {".join(B", ".join(map(to_bytes, vec)) for vec in group)) for group in
-                             [data[i:i + n] for i in range(0, len(data), n)]])) + B"}\n")
+                        lines.append(self.indent + B"{" + ((B"}" + line_break + B"{").join(
+                            [((B"}" + separator + B"{").join(separator.join(map(to_bytes, vec)) for vec in group))
+                             for group in [data[i:i + n] for i in range(0, len(data), n)]])) + B"}" + newline)
+                elif layout.line_width is not None:
+                    vectors = (B"{" + separator.join(map(to_bytes, vec)) + B"}" for vec in data)
+                    lines.append(self.indent + line_break.join(
+                        separator.join(line) for line in _wrap(vectors, separator, layout.line_width)) + newline)
                 else:
-                    lines.append(self.indent + B"{" + (B"}, {".join(
-                        B", ".join(map(to_bytes, vec)) for vec in primitive.data)) + B"}\n")
+                    lines.append(self.indent + B"{" + ((B"}" + separator + B"{").join(
+                        separator.join(map(to_bytes, vec)) for vec in data)) + B"}" + newline)
 
             self.dec_indent()
             lines.append(self.indent + B"}")
 
         return lines
 
+    def primitive_to_buffer(self, primitive, out, flush=False):
+        """
+        Append the text representation of a primitive structure to an output buffer, see `primitive_as_text()`.
+        Large typed data, e.g. spilled by a `DdlSpillStore`, is encoded in chunks which are written to the current file
+        one by one if `flush` is true, so that neither the data nor its text are held in memory as a whole.
+        :param primitive: the primitive structure
+        :param out: list of byte strings to append to
+        :param flush: whether to write the buffer to the current file with `flush_buffer()` after every chunk
+        """
+        data = _shared(primitive, "data")
+        vector_size = primitive.vector_size
+        n = getattr(primitive, "max_elements_per_line", None)
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            data = data.reshape(-1)
+        elif isinstance(data, _VectorView):
+            data = data.buffer
+        counting = flush and self.progress is not None
+        if not flush or not hasattr(data, "tolist") or len(data) < _CHUNK_VALUES or self.layout.line_width is not None \
+                or (n is not None and len(data) == vector_size):
+            out.extend(self.primitive_as_text(primitive))
+            if counting:
+                self.done[1] += _value_count(primitive)
+            return
+
+        newline = self.layout.newline
+        separator = B"," + self.layout.space
+        lines, has_comment = self.primitive_header(primitive)
+        out.extend(lines)
+        out.append(newline + self.indent + B"{" + newline)
+        self.inc_indent()
+        to_bytes = self.value_encoder(primitive)
+        line_break = B"," + newline + self.indent
+
+        # whole lines of max_elements_per_line elements per chunk, so that the chunks can be joined with line breaks
+        width = max(vector_size, 1)
+        chunk = _CHUNK_VALUES // width
+        if n is not None:
+            chunk = max(n, chunk - chunk % n)
+            joiner = line_break
+        else:
+            n = chunk
+            joiner = separator
+        for start in range(0, len(data), chunk * width):
+            values = data[start:start + chunk * width].tolist()
+            if vector_size == 0:
+                text = line_break.join(separator.join(map(to_bytes, values[i:i + n])) for i in range(0, len(values), n))
+                out.append((self.indent if start == 0 else joiner) + text)
+            else:
+                vectors = list(zip(*[iter(values)] * vector_size))
+                text = (B"}" + line_break + B"{").join((B"}" + separator + B"{").join(
+                    separator.join(map(to_bytes, vec)) for vec in vectors[i:i + n]) for i in range(0, len(vectors), n))
+                out.append(self.indent + B"{" if start == 0 else B"}" + joiner + B"{")
+                out.append(text)
+            if counting:
+                self.done[1] += len(values)
+            self.flush_buffer(out)
+
+        self.dec_indent()
+        out.append((B"}" if vector_size != 0 else B"") + newline + self.indent + B"}")
+
     def structure_as_text(self, structure):
         """
         Get a text representation of the given structure
         :param structure: structure to get the text representation for
         :return: a byte string representing the structure
         """
-        lines = [self.indent + structure.identifier]
-
-        if structure.name:
-            lines.append(B" $" if structure.name_is_global else B" %")
-            lines.append(structure.name)
+        out = []
+        self.structure_to_buffer(structure, out)
+        return B''.join(out)
 
-        if len(structure.properties) != 0:
-            lines.append(B" (" + B", ".join(self.property_as_text(prop) for prop in structure.properties.items()) + B")")
-
-        has_comment = hasattr(structure, 'comment')
-        if has_comment:
-            lines.append(B"\t\t// " + structure.comment)
-
-        if structure.is_simple_structure() and not has_comment:
-            lines.append(B" {")
-            lines.extend(self.primitive_as_text(structure.children[0], True))
-            lines.append(B"}\n")
-        else:
-            lines.append(B"\n" + self.indent + B"{\n")
-
-            previous_was_simple = False
-            first = structure.children[0]
-
-            self.inc_indent()
-            for sub in structure.children:
-                if isinstance(sub, DdlPrimitive):
-                    lines.extend(self.primitive_as_text(sub))
-                    lines.append(B"\n")
-                    previous_was_simple = False
+    def prototype_body_as_text(self, prototype):
+        """
+        Get the text of the substructures of a prototype including the surrounding braces, as written for all
+        instances which still share them. The text is created once per content and indent.
+        :param prototype: structure whose substructures are shared
+        :return: a byte string
+        """
+        key = (prototype.content_hash(), self.indent)
+        body = self.prototype_encodings.get(key)
+        if body is None:
+            out = []
+            self.structure_to_buffer(prototype, out, body_only=True)
+            body = self.prototype_encodings[key] = B"".join(out)
+        return body
+
+    def fragment_as_text(self, fragment):
+        """
+        Get the text of a fragment as written at the current indent, ending with a line break. The indented text is
+        created once per content and indent. Layouts without line breaks write the compressed text of the fragment,
+        if it has one.
+        :param fragment: the `DdlFragment`
+        :return: a byte string
+        """
+        if not self.layout.newline:
+            return fragment.text if fragment.compressed is None else fragment.compressed
+
+        text = fragment.text
+        if not self.indent and text.endswith(B"\n"):
+            return text
+
+        key = (fragment.content_hash(), self.indent)
+        indented = self.fragment_encodings.get(key)
+        if indented is None:
+            if not text.endswith(B"\n"):
+                text += B"\n"
+            if self.indent:
+                # much faster than a regular expression, empty lines are not indented
+                text = (B"\n" + text).replace(B"\n", B"\n" + self.indent)
+                blank = B"\n" + self.indent + B"\n"
+                while blank in text:
+                    text = text.replace(blank, B"\n\n")
+                text = text[1:-len(self.indent)]
+            indented = self.fragment_encodings[key] = text
+        return indented
+
+    def structure_to_buffer(self, structure, out, flush=False, body_only=False):
+        """
+        Append the text representation of the given structure to an output buffer.
+        Substructures are visited with an explicit stack instead of recursion, so that every byte string is only
+        created once and arbitrarily deep hierarchies can be written.
+        :param structure: structure to get the text representation for
+        :param out: list of byte strings to append to
+        :param flush: whether to periodically write the buffer to the current file with `flush_buffer()`
+        :param body_only: whether to skip the header of the structure and only write the braces and substructures
+        """
+        layout = self.layout
+        space = layout.space
+        newline = layout.newline
+        base_indent = self.indent
+        # every frame holds a structure, an iterator over its children, whether the previous child was a simple
+        # structure, its first child and its index entry
+        stack = []
+        # simple structures are only written on one line and kept together if there are line breaks
+        is_simple = newline and not body_only and structure.is_simple_structure()
+        # only structures written to the file are indexed and counted, not those of cached prototype bodies
+        index = flush and self.index is not None
+        counting = flush and self.progress is not None
+        done = self.done
+
+        while True:
+            if structure is not None:
+                entry = None
+                if index and (not stack or (structure.name and structure.name_is_global)):
+                    entry = [self.buffer_position(out) + len(self.indent), None, not stack, structure.identifier,
+                             structure.name if structure.name_is_global else None]
+                    self.index_entries.append(entry)
+
+                has_comment = False
+                if not body_only:
+                    if counting:
+                        done[0] += 1
+                    out.append(self.indent + structure.identifier)
+
+                    if structure.name:
+                        out.append(space + (B"$" if structure.name_is_global else B"%"))
+                        out.append(structure.name)
+
+                    properties = _shared(structure, "properties")
+                    if len(properties) != 0:
+                        out.append(space + B"(" + (B"," + space).join(self.property_as_text(prop)
+                                                                      for prop in properties.items()) + B")")
+
+                    has_comment = layout.comment_prefix is not None and hasattr(structure, 'comment')
+                    if has_comment:
+                        out.append(layout.comment_prefix + structure.comment)
+
+                owner = _shared_owner(structure, "children")
+                if is_simple and not has_comment:
+                    out.append(space + B"{")
+                    out.extend(self.primitive_as_text(owner.children[0], True))
+                    out.append(B"}" + newline)
+                    if counting:
+                        done[1] += _value_count(owner.children[0])
+                elif owner is not structure and not body_only:
+                    out.append(self.prototype_body_as_text(owner))
+                    if counting:
+                        counts = self.prototype_counts.get(id(owner))
+                        if counts is None:
+                            counts = self.prototype_counts[id(owner)] = _content_counts(owner.children)
+                        done[0] += counts[0]
+                        done[1] += counts[1]
                 else:
-                    if not (previous_was_simple and sub.is_simple_structure()) and not sub == first:
-                        lines.append(B"\n")
-
-                    lines.append(self.structure_as_text(sub))
-                    previous_was_simple = sub.is_simple_structure()
-
-            self.dec_indent()
-
-            lines.append(self.indent + B"}\n")
+                    out.append(newline + self.indent + B"{" + newline)
+                    children = owner.children
+                    stack.append([structure, iter(children), False, children[0] if children else None, entry])
+                    self.inc_indent()
+                    entry = None
+
+                if entry is not None:
+                    # without the line break
+                    entry[1] = self.buffer_position(out) - len(newline) - entry[0]
+                structure = None
+                body_only = False
+
+                if flush and len(out) >= _FLUSH_THRESHOLD:
+                    self.flush_buffer(out)
+
+            if not stack:
+                break
+
+            frame = stack[-1]
+            sub = next(frame[1], _END)
+
+            if sub is _END:
+                stack.pop()
+                self.dec_indent()
+                out.append(self.indent + B"}" + newline)
+                if frame[4] is not None:
+                    frame[4][1] = self.buffer_position(out) - len(newline) - frame[4][0]
+            elif isinstance(sub, DdlPrimitive):
+                self.primitive_to_buffer(sub, out, flush)
+                out.append(newline)
+                frame[2] = False
+            elif isinstance(sub, DdlFragment):
+                if sub is not frame[3]:
+                    out.append(newline)
+                out.append(self.fragment_as_text(sub))
+                frame[2] = False
+            else:
+                is_simple = newline and sub.is_simple_structure()
+                if not (frame[2] and is_simple) and sub is not frame[3]:
+                    out.append(newline)
+                frame[2] = is_simple
+                structure = sub
 
-        return B''.join(lines)
+        self.indent = base_indent
 
     @staticmethod
     def set_max_elements_per_line(primitive, elements):
@@ -459,129 +1752,2198 @@ class DdlCompressedTextWriter(DdlTextWriter):
     Making use of "Whitespace never has any meaning, so OpenDDL files can be formatted in any manner preferred.", see
     OpenDDL specification.
 
-    Faster than DdlTextWriter and produces smaller files.
+    Faster than DdlTextWriter and produces smaller files. This is `DdlTextWriter` with `DdlTextLayout.compact()`.
     """
 
-    def __init__(self, document, rounding=6):
+    def __init__(self, document, rounding=6, *, index=None, progress=None, cancellation=None):
         """
         Constructor
         :param document: document to write
         :param rounding: number of decimal places to keep or None to keep all
+        :param index: None, "footer" or "sidecar" to write an index, see `DdlTextWriter`
+        :param progress: optional progress callback, see `DdlWriter`
+        :param cancellation: optional `DdlCancellationToken`, see `DdlWriter`
         """
-        super().__init__(document, rounding)
+        super().__init__(document, rounding, index=index, layout=DdlTextLayout.compact(), progress=progress,
+                         cancellation=cancellation)
 
-    def write(self, filename):
-        self.file = open(filename, "wb")
 
-        if len(self.get_document().structures) != 0:
-            for structure in self.get_document().structures:
-                self.file.write(self.structure_as_text(structure))
+DdlExportJob = namedtuple("DdlExportJob", ["document", "path", "writer_class", "options"])
+DdlExportJob.__new__.__defaults__ = (DdlTextWriter, None)
+DdlExportJob.__doc__ = """
+A document to write with `DdlBatchExporter`.
 
-        self.file.close()
+`document` is either a `DdlDocument` or a picklable callable without arguments returning one (e.g. a module level
+function or a `functools.partial`), which is called in the worker process. `options` is an optional dict of keyword
+arguments for the constructor of `writer_class`.
+"""
 
-    def property_as_text(self, prop):
+DdlExportFailure = namedtuple("DdlExportFailure", ["index", "path", "error"])
+DdlExportFailure.__doc__ = """
+A job which could not be exported: its index in the jobs, the path and the formatted exception.
+"""
+
+
+class DdlExportError(Exception):
+    """
+    Error raised by `DdlBatchExporter.export()` after all jobs were processed, if any of them failed.
+    """
+
+    def __init__(self, failures):
         """
-        Create a text representation for a key-value-pair. E.g.: "key=value".
-        :param prop: a pair to represent as text
-        :return: a byte-string in the form "key=value"
+        Constructor
+        :param failures: list of `DdlExportFailure`
         """
-        value = prop[1]
-        if isinstance(value, bool):
-            value_bytes = self.to_bool_byte(value)
-        elif isinstance(value, int):
-            value_bytes = self.to_int_byte(value)
-        elif isinstance(value, float):
-            value_bytes = self.to_float_byte(value)
-        elif isinstance(value, str):
-            value_bytes = B"\"" + bytes(value, "UTF-8") + B"\""
-        elif isinstance(value, bytes):
-            value_bytes = B"\"" + value + B"\""
+        self.failures = failures
+        Exception.__init__(self, "{} document(s) could not be exported, first: {}\n{}".format(
+            len(failures), failures[0].path, failures[0].error))
+
+
+def _export_chunk(chunk):
+    """
+    Write a chunk of export jobs, in a worker process.
+    :param chunk: list of job indices and jobs
+    :return: list of `DdlExportFailure`
+    """
+    failures = []
+    for index, job in chunk:
+        try:
+            document = job.document() if callable(job.document) else job.document
+            job.writer_class(document, **(job.options or {})).write(job.path)
+        except Exception:
+            failures.append(DdlExportFailure(index, job.path, traceback.format_exc()))
+    return failures
+
+
+class DdlBatchExporter:
+    """
+    Writes many documents in parallel in a pool of worker processes.
+
+    The workers are started once and kept for all calls of `export()` until the exporter is closed, use it as a
+    context manager. Jobs are sent to the workers in chunks, of which only a limited number is pending at a time, so
+    generators of jobs are consumed lazily and memory stays bounded.
+    """
+
+    def __init__(self, processes=None, chunk_size=8, max_in_flight=None):
+        """
+        Constructor
+        :param processes: number of worker processes, defaults to the number of CPUs. With 0 the jobs are written in
+            the calling process, which is useful for debugging.
+        :param chunk_size: number of jobs sent to a worker at once
+        :param max_in_flight: maximum number of chunks sent to the workers but not yet finished, defaults to twice the
+            number of processes
+        """
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * max(self.processes, 1)
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def export(self, jobs, progress=None):
+        """
+        Write the documents of the given jobs. Failing jobs do not stop the others, their errors are collected and
+        raised together at the end.
+        :param jobs: iterable of `DdlExportJob` or of (document, path) tuples
+        :param progress: optional callable, called with the number of processed and the total number of jobs (None
+            if `jobs` has no length) after every chunk
+        :return: number of written documents
+        :raises DdlExportError: if any of the jobs failed
+        """
+        total = len(jobs) if hasattr(jobs, "__len__") else None
+        chunks = self._chunks(jobs)
+        failures = []
+        done = 0
+
+        if self.processes == 0:
+            for chunk in chunks:
+                failures.extend(_export_chunk(chunk))
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, total)
         else:
-            raise TypeError("ERROR: Unknown property type for property \"{}\"".format(prop[0]))
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.processes)
+            # pending chunks by their futures
+            pending = {}
+            try:
+                while True:
+                    for chunk in itertools.islice(chunks, self.max_in_flight - len(pending)):
+                        pending[self.executor.submit(_export_chunk, chunk)] = chunk
+                    if not pending:
+                        break
+
+                    finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        chunk = pending.pop(future)
+                        done += len(chunk)
+                        try:
+                            failures.extend(future.result())
+                        except concurrent.futures.process.BrokenProcessPool:
+                            raise
+                        except Exception:
+                            # e.g. a document which can not be pickled, the whole chunk failed
+                            error = traceback.format_exc()
+                            failures.extend(DdlExportFailure(index, job.path, error) for index, job in chunk)
+                    if progress is not None:
+                        progress(done, total)
+            except BaseException as error:
+                for future in pending:
+                    future.cancel()
+                if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                    # a worker died, the pool can not be used anymore. The next export starts a new one.
+                    self.close()
+                raise
+
+        if failures:
+            failures.sort()
+            raise DdlExportError(failures)
+        return done
+
+    def _chunks(self, jobs):
+        chunk = []
+        for index, job in enumerate(jobs):
+            chunk.append((index, job if isinstance(job, DdlExportJob) else DdlExportJob(*job)))
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
-        return prop[0] + B"=" + value_bytes
 
-    def primitive_as_text(self, primitive):
+# Space reserved for a specification based OpenDdlBinaryWriter ;)
+# Hope there will be some specification for it some day.
+
+
+class DdlReference(bytes):
+    """
+    A reference which has not been resolved to a structure, e.g. `%local` or `$global%local`.
+
+    Written as-is by the text writers.
+    """
+    pass
+
+
+class DdlParseError(Exception):
+    """
+    Error raised for malformed OpenDDL text.
+    """
+
+    def __init__(self, message, text=None, pos=None):
         """
-        Get a text representation of the given primitive structure
-        :param primitive: primitive structure to get the text representation for
-        :return: a byte string representing the primitive structure
+        Constructor
+        :param message: description of the error
+        :param text: text which was being parsed, used to compute the line number
+        :param pos: offset into `text` at which the error occurred
         """
-        lines = [bytes(primitive.data_type.name, "UTF-8")]
+        self.line = None if text is None else text.count(B"\n", 0, pos) + 1
+        Exception.__init__(self, message if self.line is None else "line {}: {}".format(self.line, message))
 
-        if primitive.vector_size > 0:
-            lines.append(B"[" + self.to_int_byte(primitive.vector_size) + B"]")
 
-        if primitive.name is not None:
-            lines.append(B"$"+ primitive.name)
+class DdlReader:
+    """
+    Abstract class for classes responsible for reading OpenDdlDocuments.
+    """
 
-        # find appropriate conversion function
-        if primitive.data_type in [DdlPrimitiveDataType.bool]:
-            # bool
-            to_bytes = self.to_bool_byte
-        elif primitive.data_type in [DdlPrimitiveDataType.double, DdlPrimitiveDataType.float]:
-            # float/double
-            to_bytes = self.to_float_byte if self.rounding is None else self.to_float_byte_rounded
-        elif primitive.data_type in [DdlPrimitiveDataType.int8, DdlPrimitiveDataType.int16, DdlPrimitiveDataType.int32,
-                                     DdlPrimitiveDataType.int64, DdlPrimitiveDataType.unsigned_int8,
-                                     DdlPrimitiveDataType.unsigned_int16, DdlPrimitiveDataType.unsigned_int32,
-                                     DdlPrimitiveDataType.unsigned_int64, DdlPrimitiveDataType.half]:
-            # integer types
-            to_bytes = self.to_int_byte
-        elif primitive.data_type in [DdlPrimitiveDataType.string]:
-            # string
-            if primitive.vector_size == 0 and len(primitive.data) > 0:
-                to_bytes = self.id if isinstance(primitive.data[0], bytes) else self.to_string_byte
+    @abstractmethod
+    def read(self, filename):
+        """
+        Read a document from a specified file.
+        :param filename: path to a file to read from
+        :return: the read `DdlDocument`
+        """
+        pass
+
+
+# all data type names of the OpenDDL specification, including the short forms
+_DATA_TYPES = {
+    B"bool": DdlPrimitiveDataType.bool, B"b": DdlPrimitiveDataType.bool,
+    B"int8": DdlPrimitiveDataType.int8, B"i8": DdlPrimitiveDataType.int8,
+    B"int16": DdlPrimitiveDataType.int16, B"i16": DdlPrimitiveDataType.int16,
+    B"int32": DdlPrimitiveDataType.int32, B"i32": DdlPrimitiveDataType.int32,
+    B"int64": DdlPrimitiveDataType.int64, B"i64": DdlPrimitiveDataType.int64,
+    B"unsigned_int8": DdlPrimitiveDataType.unsigned_int8, B"uint8": DdlPrimitiveDataType.unsigned_int8,
+    B"u8": DdlPrimitiveDataType.unsigned_int8,
+    B"unsigned_int16": DdlPrimitiveDataType.unsigned_int16, B"uint16": DdlPrimitiveDataType.unsigned_int16,
+    B"u16": DdlPrimitiveDataType.unsigned_int16,
+    B"unsigned_int32": DdlPrimitiveDataType.unsigned_int32, B"uint32": DdlPrimitiveDataType.unsigned_int32,
+    B"u32": DdlPrimitiveDataType.unsigned_int32,
+    B"unsigned_int64": DdlPrimitiveDataType.unsigned_int64, B"uint64": DdlPrimitiveDataType.unsigned_int64,
+    B"u64": DdlPrimitiveDataType.unsigned_int64,
+    B"half": DdlPrimitiveDataType.half, B"float16": DdlPrimitiveDataType.half, B"h": DdlPrimitiveDataType.half,
+    B"float": DdlPrimitiveDataType.float, B"float32": DdlPrimitiveDataType.float, B"f": DdlPrimitiveDataType.float,
+    B"double": DdlPrimitiveDataType.double, B"float64": DdlPrimitiveDataType.double,
+    B"d": DdlPrimitiveDataType.double,
+    B"string": DdlPrimitiveDataType.string, B"s": DdlPrimitiveDataType.string,
+    B"ref": DdlPrimitiveDataType.ref, B"r": DdlPrimitiveDataType.ref,
+    B"type": DdlPrimitiveDataType.type, B"t": DdlPrimitiveDataType.type,
+}
+
+_FLOAT_TYPES = {DdlPrimitiveDataType.half: "e", DdlPrimitiveDataType.float: "f", DdlPrimitiveDataType.double: "d"}
+
+_INTEGER_TYPES = {
+    DdlPrimitiveDataType.int8: (1, True), DdlPrimitiveDataType.int16: (2, True),
+    DdlPrimitiveDataType.int32: (4, True), DdlPrimitiveDataType.int64: (8, True),
+    DdlPrimitiveDataType.unsigned_int8: (1, False), DdlPrimitiveDataType.unsigned_int16: (2, False),
+    DdlPrimitiveDataType.unsigned_int32: (4, False), DdlPrimitiveDataType.unsigned_int64: (8, False),
+}
+
+
+def _array_typecode(size, signed):
+    for code in ("bhilq" if signed else "BHILQ"):
+        if array.array(code).itemsize == size:
+            return code
+
+
+# typecodes of the `array.array`s numeric data is decoded into. There is no typecode for half floats.
+_ARRAY_TYPECODES = dict([(data_type, _array_typecode(*size)) for data_type, size in _INTEGER_TYPES.items()] +
+                        [(DdlPrimitiveDataType.half, "f"), (DdlPrimitiveDataType.float, "f"),
+                         (DdlPrimitiveDataType.double, "d")])
+
+# whitespace and comments
+_SKIP = re.compile(rb"(?:\s+|//[^\n]*|/\*.*?\*/)*", re.S)
+
+_TOKEN = re.compile(rb"""
+    (?P<punctuation>[{}\[\](),=])
+  | (?P<number>[+-]?(?:0[xX][0-9A-Fa-f_]+|0[bB][01_]+|0[oO][0-7_]+
+                     |(?:[0-9][0-9_]*(?:\.[0-9_]*)?|\.[0-9][0-9_]*)(?:[eE][+-]?[0-9_]+)?))
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<ref>[$%][A-Za-z_][A-Za-z0-9_]*(?:%[A-Za-z_][A-Za-z0-9_]*)*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<char>'(?:[^'\\]|\\.)*')
+    """, re.S | re.X)
+
+# whitespace and comments followed by a token
+_STREAM_TOKEN = re.compile(_SKIP.pattern + rb"(?:" + _TOKEN.pattern + rb")", re.S | re.X)
+
+# the closing braces of the last vector and of the data of a primitive
+_VECTORS_END = re.compile(rb"\}\s*\}")
+
+# characters which can not appear in numeric data outside of character literals and comments
+_NOT_NUMERIC = re.compile(rb"[\"'/]")
+
+# characters which open or close structures, or start strings, character literals or comments
+_SCAN = re.compile(rb"[{}\"'/]")
+
+# end of the header of a primitive structure: data type or vector size, and optional name
+_DATA_HEADER_END = re.compile(rb"(?:[^A-Za-z0-9_$%]([A-Za-z_][A-Za-z0-9_]*)|(\]))"
+                              rb"\s*(?:[$%][A-Za-z_][A-Za-z0-9_]*\s*)?$")
+
+_WHITESPACE = re.compile(rb"\s*")
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_CHAR = re.compile(rb"'(?:[^'\\]|\\.)*'", re.S)
+
+
+def _has_special(text, start, end):
+    # cheaper than a regular expression search
+    return text.find(B'"', start, end) != -1 or text.find(B"'", start, end) != -1 or \
+        text.find(B"/", start, end) != -1
+
+
+def _skip_data(text, pos):
+    """
+    Find the end of the data of a primitive structure without scanning every brace of its vectors.
+    :param pos: offset of an opening brace
+    :return: offset after the closing brace of the data, or None if the brace does not open the data of a primitive
+        structure or the data contains strings, character literals or comments
+    """
+    match = _DATA_HEADER_END.search(text[max(pos - 256, 0):pos] if pos >= 256 else B" " + text[:pos])
+    if match is None or (match.group(1) is not None and match.group(1) not in _DATA_TYPES):
+        return None
+
+    start = _WHITESPACE.match(text, pos + 1).end()
+    if text[start:start + 1] == B"}":
+        return start + 1
+    if match.group(2) is None:
+        end = text.find(B"}", start)
+        if end == -1 or _has_special(text, start, end):
+            return None
+        return end + 1
+
+    match = _VECTORS_END.search(text, start)
+    if match is None or _has_special(text, start, match.start()):
+        return None
+    return match.end()
+
+
+def _skip_body(text, pos):
+    """
+    Find the end of a structure in OpenDDL text without tokenizing it, by counting braces outside of strings,
+    character literals and comments. The data of primitive structures is skipped as a whole where possible.
+    :param text: the text
+    :param pos: offset after the opening brace of the structure
+    :return: offset after its closing brace
+    """
+    depth = 1
+    while True:
+        match = _SCAN.search(text, pos)
+        if match is None:
+            raise DdlParseError("missing \"}\"", text, len(text))
+        c = match.group()
+        pos = match.start()
+
+        if c == B"{":
+            end = _skip_data(text, pos)
+            if end is None:
+                depth += 1
+                end = pos + 1
+            pos = end
+        elif c == B"}":
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+        elif c == B"/":
+            c = text[pos + 1:pos + 2]
+            if c == B"/":
+                end = text.find(B"\n", pos)
+                pos = len(text) if end == -1 else end + 1
+            elif c == B"*":
+                end = text.find(B"*/", pos + 2)
+                if end == -1:
+                    raise DdlParseError("unterminated comment", text, pos)
+                pos = end + 2
             else:
-                if len(primitive.data) > 0:
-                    to_bytes = self.id if isinstance(primitive.data[0][0], bytes) else self.to_string_byte
-        elif primitive.data_type in [DdlPrimitiveDataType.ref]:
-            to_bytes = self.to_ref_byte
+                pos += 1
         else:
-            raise TypeError("Encountered unknown primitive type.")
+            match = (_STRING if c == B"\"" else _CHAR).match(text, pos)
+            if match is None:
+                raise DdlParseError("unterminated literal", text, pos)
+            pos = match.end()
 
-        if len(primitive.data) == 0:
-            lines.append(B"{}")
-        elif primitive.is_simple_primitive():
-            if primitive.vector_size == 0:
-                lines.append(B"{" + to_bytes(primitive.data[0]) + B"}")
+
+def _identifier_set(identifiers):
+    return frozenset(identifier.encode() if isinstance(identifier, str) else identifier for identifier in identifiers)
+
+
+# characters of decimal literals and separators
+_DECIMAL = B"0123456789.eE+-{}, \t\r\n"
+
+_SEPARATORS = bytes.maketrans(B"{},", B"   ")
+
+# everything but the separators of values and vectors, and whitespace
+_NOT_SEPARATORS = bytes(sorted(set(range(256)) - set(B"{},")))
+_SPACES = B" \t\r\n\f\v"
+
+_ESCAPE = re.compile(rb"\\(?:x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{6}|.)", re.S)
+
+_ESCAPES = {B"\\\"": "\"", B"\\'": "'", B"\\?": "?", B"\\\\": "\\", B"\\a": "\a", B"\\b": "\b", B"\\f": "\f",
+            B"\\n": "\n", B"\\r": "\r", B"\\t": "\t", B"\\v": "\v"}
+
+
+def _unescape(match):
+    escape = match.group()
+    if escape in _ESCAPES:
+        return _ESCAPES[escape].encode("UTF-8")
+    if len(escape) > 2:
+        return chr(int(escape[2:], 16)).encode("UTF-8")
+    raise ValueError("invalid escape sequence " + escape.decode("UTF-8", "replace"))
+
+
+def _string_literal(token):
+    body = token[1:-1]
+    if B"\\" in body:
+        body = _ESCAPE.sub(_unescape, body)
+    return body.decode("UTF-8")
+
+
+def _integer_literal(token, char=False):
+    """
+    :param token: decimal, hex, octal, binary or (if char is set) character literal
+    :return: value of the literal as int
+    """
+    if char:
+        return int.from_bytes(_string_literal(token).encode("ASCII"), "big")
+    token = token.replace(B"_", B"")
+    sign = -1 if token[:1] == B"-" else 1
+    token = token.lstrip(B"+-")
+    if token[:2] in (B"0x", B"0X", B"0b", B"0B", B"0o", B"0O"):
+        return sign * int(token, 0)
+    return sign * int(token)
+
+
+def _float_literal(token, data_type):
+    """
+    :param token: decimal literal, or hex, octal or binary literal containing the bits of the floating point value
+    :return: value of the literal as float
+    """
+    token = token.replace(B"_", B"")
+    sign = B"-" if token[:1] == B"-" else B""
+    digits = token.lstrip(B"+-")
+    if digits[:2] in (B"0x", B"0X", B"0b", B"0B", B"0o", B"0O"):
+        code = _FLOAT_TYPES[data_type]
+        bits = int(digits, 0)
+        value = struct.unpack("<" + code, bits.to_bytes(struct.calcsize(code), "little"))[0]
+        return -value if sign else value
+    return float(token)
+
+
+def _numeric_count(data, vector_size):
+    """
+    Check the separators of numeric data without tokenizing it: values separated by commas, or vectors of
+    `vector_size` values in braces separated by commas. Compare the count with the number of tokens, which differs
+    if a value is missing or contains whitespace.
+    :param data: the data without the closing brace of the primitive
+    :return: number of values, or None if the data is malformed
+    """
+    separators = data.translate(None, _NOT_SEPARATORS)
+    if vector_size == 0:
+        if len(separators) != separators.count(B","):
+            return None
+        count = len(separators) + 1 if separators or data.strip() else 0
+    else:
+        vector = B"{" + B"," * (vector_size - 1) + B"},"
+        vectors = (len(separators) + 1) // len(vector)
+        if vectors == 0 or separators + B"," != vector * vectors:
+            return None
+        count = vectors * vector_size
+
+    # a value split by whitespace makes up for a missing one in the number of tokens. Whitespace only after commas,
+    # as written by the text writers, can not split a value.
+    data = data.strip()
+    spaces = len(data) - len(data.translate(None, _SPACES))
+    if spaces != 0 and spaces != data.count(B", "):
+        data = data.translate(None, _SPACES)
+        if vector_size == 0:
+            if data[:1] == B"," or data[-1:] == B"," or B",," in data:
+                return None
+        elif B"{," in data or B",," in data or B",}" in data or B"{}" in data:
+            return None
+    return count
+
+
+def _numpy_numbers(text, data_type):
+    """
+    Parse whitespace separated decimal literals into a numpy array in bulk.
+    :return: the array, or None if an integer is out of range of the data type, which numpy does not check
+    """
+    dtype = numpy.dtype(_ARRAY_TYPECODES[data_type])
+    if data_type in _FLOAT_TYPES:
+        data = numpy.fromstring(text, dtype, sep=" ")
+        return data.astype(numpy.float16) if data_type == DdlPrimitiveDataType.half else data
+
+    # parsed as 64 bit integers, which are clamped to their limits
+    wide = numpy.dtype(numpy.uint64 if dtype.kind == "u" else numpy.int64)
+    data = numpy.fromstring(text, wide, sep=" ")
+    if data.size != 0:
+        limits, wide_limits = numpy.iinfo(dtype), numpy.iinfo(wide)
+        low, high = data.min(), data.max()
+        if low < limits.min or high > limits.max or high == wide_limits.max or (low == wide_limits.min != 0):
+            return None
+    return data.astype(dtype)
+
+
+class DdlTextReader(DdlReader):
+    """
+    OpenDdlReader which reads OpenDdlDocuments from text form.
+
+    References of the form `$name` are resolved to the structure with that global name, all other references are
+    kept as `DdlReference`.
+    """
+
+    def __init__(self, typed_arrays=None, include=None, exclude=None, predicate=None):
+        """
+        Constructor
+        :param typed_arrays: None to read numeric primitive data into lists of numbers (or of tuples, if vector_size
+            != 0), "array" to read it into flat `array.array`s or "numpy" to read it into numpy arrays of shape
+            (n,) or (n, vector_size). Typed arrays are decoded in bulk and much faster to read.
+        :param include: optional identifiers of the structures to read, all others are skipped
+        :param exclude: optional identifiers of structures to skip
+        :param predicate: optional callable, called with every structure which is not skipped by identifier after
+            its name and properties are read, but not its substructures. The structure is skipped if it returns
+            false.
+        Skipped structures are skipped together with all of their substructures, without tokenizing them. References
+        to them are kept as `DdlReference`. Identifiers may be given as bytes or str.
+        """
+        if typed_arrays not in (None, "array", "numpy"):
+            raise ValueError("typed_arrays must be None, \"array\" or \"numpy\"")
+        if typed_arrays == "numpy" and numpy is None:
+            raise ValueError("typed_arrays=\"numpy\" requires numpy to be installed")
+
+        self.typed_arrays = typed_arrays
+        self.include = None if include is None else _identifier_set(include)
+        self.exclude = None if exclude is None else _identifier_set(exclude)
+        self.predicate = predicate
+        self.text = None
+        self.pos = 0
+
+    def read(self, filename):
+        with open(filename, "rb") as file:
+            return self.read_bytes(file.read())
+
+    def read_bytes(self, text):
+        """
+        Read a document from OpenDDL text.
+        :param text: bytes-like object containing the text
+        :return: the read `DdlDocument`
+        """
+        self.text = text
+        self.pos = 0
+        try:
+            return self._document()
+        finally:
+            self.text = None
+
+    def _error(self, message, pos=None):
+        return DdlParseError(message, self.text, self.pos if pos is None else pos)
+
+    def _token(self):
+        """
+        :return: kind and text of the next token, or (None, None) at the end of the text
+        """
+        pos = _SKIP.match(self.text, self.pos).end()
+        if pos == len(self.text):
+            self.pos = pos
+            return None, None
+
+        match = _TOKEN.match(self.text, pos)
+        if match is None:
+            raise self._error("unexpected character", pos)
+        self.pos = match.end()
+        return match.lastgroup, match.group()
+
+    def _expect(self, punctuation):
+        kind, token = self._token()
+        if token != punctuation:
+            raise self._error("expected \"{}\"".format(punctuation.decode()))
+
+    def _document(self):
+        document = DdlDocument()
+        # nodes with global names, primitives and structures with references to resolve afterwards
+        self.names = {}
+        self.references = []
+        stack = []
+
+        while True:
+            kind, token = self._token()
+            if kind is None:
+                if stack:
+                    raise self._error("missing \"}\"")
+                break
+
+            if token == B"}":
+                if not stack:
+                    raise self._error("unexpected \"}\"")
+                stack.pop()
+            elif kind != "identifier":
+                raise self._error("expected structure identifier")
+            elif token in _DATA_TYPES:
+                if not stack:
+                    raise self._error("primitive structures at top-level are not supported")
+                stack[-1].children.append(self._primitive(_DATA_TYPES[token]))
+            else:
+                references = len(self.references)
+                structure = self._structure(token)
+                if not self._keep(structure):
+                    # forget the name and references of the header
+                    if structure.name is not None and self.names.get(structure.name) is structure:
+                        del self.names[structure.name]
+                    del self.references[references:]
+                    self.pos = _skip_body(self.text, self.pos)
+                    continue
+                (stack[-1].children if stack else document.structures).append(structure)
+                stack.append(structure)
+
+        self._resolve_references()
+        return document
+
+    def _keep(self, structure):
+        """
+        :return: whether a structure is read according to include, exclude and predicate
+        """
+        if self.include is not None and structure.identifier not in self.include:
+            return False
+        if self.exclude is not None and structure.identifier in self.exclude:
+            return False
+        return self.predicate is None or self.predicate(structure)
+
+    def _name(self, node, token):
+        if B"%" in token[1:]:
+            raise self._error("invalid name")
+        node.name = token[1:]
+        node.name_is_global = token[:1] == B"$"
+        if node.name_is_global:
+            self.names[node.name] = node
+
+    def _structure(self, identifier):
+        """
+        Read a structure header, up to and including the opening brace.
+        """
+        structure = DdlStructure(identifier)
+
+        kind, token = self._token()
+        if kind == "ref":
+            self._name(structure, token)
+            kind, token = self._token()
+
+        if token == B"(":
+            while True:
+                kind, key = self._token()
+                if key == B")" and not structure.properties:
+                    break
+                if kind != "identifier":
+                    raise self._error("expected property identifier")
+
+                kind, token = self._token()
+                if token in (B",", B")"):
+                    # properties without value are true
+                    structure.properties[key] = True
+                else:
+                    if token != B"=":
+                        raise self._error("expected \"=\"")
+                    structure.properties[key] = self._property_value(structure, key)
+                    kind, token = self._token()
+
+                if token == B")":
+                    break
+                if token != B",":
+                    raise self._error("expected \",\" or \")\"")
+            kind, token = self._token()
+
+        if token != B"{":
+            raise self._error("expected \"{\"")
+        return structure
+
+    def _property_value(self, structure, key):
+        kind, token = self._token()
+        if kind == "string":
+            return self._strings(token)
+        if kind == "number":
+            if token.lstrip(B"+-")[:2].lower() not in (B"0x", B"0b", B"0o") and \
+                    (B"." in token or B"e" in token or B"E" in token):
+                return float(token.replace(B"_", B""))
+            return _integer_literal(token)
+        if kind == "char":
+            return _integer_literal(token, char=True)
+        if kind == "ref" or token == B"null":
+            self.references.append((structure.properties, key))
+            return None if token == B"null" else DdlReference(token)
+        if token in (B"true", B"false"):
+            return token == B"true"
+        if token in _DATA_TYPES:
+            return _DATA_TYPES[token]
+        raise self._error("expected property value")
+
+    def _strings(self, token):
+        """
+        Read one or more consecutive string literals, starting with the given already read one.
+        """
+        value = _string_literal(token)
+        while True:
+            pos = self.pos
+            kind, token = self._token()
+            if kind != "string":
+                self.pos = pos
+                return value
+            value += _string_literal(token)
+
+    def _primitive(self, data_type):
+        """
+        Read a primitive structure, including its data.
+        """
+        primitive = DdlPrimitive(data_type, [])
+
+        kind, token = self._token()
+        if token == B"[":
+            kind, token = self._token()
+            if kind != "number":
+                raise self._error("expected vector size")
+            primitive.vector_size = int(token)
+            self._expect(B"]")
+            kind, token = self._token()
+
+        if kind == "ref":
+            self._name(primitive, token)
+            kind, token = self._token()
+
+        if token != B"{":
+            raise self._error("expected \"{\"")
+
+        if data_type in _ARRAY_TYPECODES:
+            end = self._numeric_payload_end(primitive.vector_size)
+            if end is not None:
+                primitive.data = self._numeric_payload(primitive, end)
+                return primitive
+
+        values = []
+        vector_size = primitive.vector_size
+        while True:
+            kind, token = self._token()
+            if token == B"}" and not values:
+                break
+            if vector_size == 0:
+                values.append(self._value(data_type, kind, token))
             else:
-                lines.append(B"{{" + (B",".join(map(to_bytes, primitive.data[0]))) + B"}}")
+                if token != B"{":
+                    raise self._error("expected \"{\"")
+                vector = []
+                for i in range(vector_size):
+                    if i != 0:
+                        self._expect(B",")
+                    kind, token = self._token()
+                    vector.append(self._value(data_type, kind, token))
+                self._expect(B"}")
+                values.append(tuple(vector))
+
+            kind, token = self._token()
+            if token == B"}":
+                break
+            if token != B",":
+                raise self._error("expected \",\" or \"}\"")
+
+        if data_type in _ARRAY_TYPECODES:
+            values = self._numeric_data(data_type, vector_size, values)
+        elif data_type == DdlPrimitiveDataType.ref:
+            self.references.append((primitive, None))
+        primitive.data = values
+        return primitive
+
+    def _value(self, data_type, kind, token):
+        try:
+            if data_type in _INTEGER_TYPES:
+                if kind in ("number", "char"):
+                    return _integer_literal(token, char=kind == "char")
+            elif data_type in _FLOAT_TYPES:
+                if kind == "number":
+                    return _float_literal(token, data_type)
+            elif data_type == DdlPrimitiveDataType.bool:
+                if token in (B"true", B"false"):
+                    return token == B"true"
+            elif data_type == DdlPrimitiveDataType.string:
+                if kind == "string":
+                    return self._strings(token)
+            elif data_type == DdlPrimitiveDataType.ref:
+                if token == B"null":
+                    return None
+                if kind == "ref":
+                    return DdlReference(token)
+            elif data_type == DdlPrimitiveDataType.type:
+                if token in _DATA_TYPES:
+                    return _DATA_TYPES[token]
+        except ValueError as e:
+            raise self._error(str(e))
+        raise self._error("invalid {} value".format(data_type.name))
+
+    def _numeric_payload_end(self, vector_size):
+        """
+        Find the end of the data of a numeric primitive without tokenizing it.
+        :return: offset after the closing brace, or None if the data contains strings, character literals or
+            comments and needs to be tokenized
+        """
+        if vector_size == 0:
+            end = self.text.find(B"}", self.pos) + 1
         else:
-            if primitive.vector_size == 0:
-                lines.append(B"{" + B",".join(map(to_bytes, primitive.data)) + B"}")
+            start = _WHITESPACE.match(self.text, self.pos).end()
+            if self.text[start:start + 1] == B"}":
+                return None  # empty, its closing brace would be taken for the end of a vector
+            match = _VECTORS_END.search(self.text, self.pos)
+            end = 0 if match is None else match.end()
+        if end == 0:
+            return None
+
+        payload = self.text[self.pos:end]
+        if B"\"" in payload or B"'" in payload or B"/" in payload:
+            return None
+        return end
+
+    def _numeric_payload(self, primitive, end):
+        """
+        Decode the data of a numeric primitive in bulk, without tokenizing it.
+        :param end: end of the data, after the closing brace
+        """
+        payload = self.text[self.pos:end - 1]
+        vector_size = primitive.vector_size
+        data_type = primitive.data_type
+
+        count = _numeric_count(payload, vector_size)
+        text = payload.translate(_SEPARATORS)
+
+        if count and self.typed_arrays == "numpy" and not text.translate(None, _DECIMAL):
+            # parsed by numpy, without a Python object per value
+            try:
+                data = _numpy_numbers(text, data_type)
+            except ValueError as e:
+                raise self._error("invalid {} data: {}".format(data_type.name, e))
+            if data is not None:
+                # every value is a single token
+                if data.size != count:
+                    raise self._error("malformed {} data".format(data_type.name))
+                self.pos = end
+                return data.reshape(-1, vector_size) if vector_size != 0 else data
+
+        # check the separators, and that every value is a single token
+        tokens = text.split()
+        if len(tokens) != count:
+            raise self._error("malformed {} data".format(data_type.name))
+
+        try:
+            if payload.translate(None, _DECIMAL):
+                # hex, octal or binary literals or digit separators
+                if data_type in _FLOAT_TYPES:
+                    values = [_float_literal(token, data_type) for token in tokens]
+                else:
+                    values = [_integer_literal(token) for token in tokens]
+            elif data_type in _FLOAT_TYPES:
+                values = map(float, tokens)
             else:
-                lines.append(B"{{" + (B"},{".join(B",".join(map(to_bytes, vec)) for vec in primitive.data)) + B"}}")
+                values = map(int, tokens)
+            data = self._numeric_data(data_type, vector_size, values, flat=True)
+        except (ValueError, OverflowError) as e:
+            raise self._error("invalid {} data: {}".format(data_type.name, e))
 
-        return lines
+        self.pos = end
+        return data
 
-    def structure_as_text(self, structure):
+    def _numeric_data(self, data_type, vector_size, values, flat=False):
         """
-        Get a text representation of the given structure
-        :param structure: structure to get the text representation for
-        :return: a byte string representing the structure
+        Store numeric values in the container configured with `typed_arrays`.
+        :param values: iterable of numbers, or of tuples if vector_size != 0 and not flat
         """
-        lines = [structure.identifier]
+        if not flat and vector_size != 0:
+            values = [value for vector in values for value in vector]
+
+        if self.typed_arrays is None:
+            values = list(values)
+            if vector_size != 0:
+                return list(zip(*[iter(values)] * vector_size))
+            return values
+
+        data = array.array(_ARRAY_TYPECODES[data_type], values)
+        if self.typed_arrays == "numpy":
+            data = numpy.frombuffer(data, numpy.dtype(data.typecode))
+            if data_type == DdlPrimitiveDataType.half:
+                data = data.astype(numpy.float16)
+            if vector_size != 0:
+                data = data.reshape(-1, vector_size)
+        return data
+
+    def _resolve_references(self):
+        for container, key in self.references:
+            if isinstance(container, DdlPrimitive):
+                container.data = [self._resolve(ref) for ref in container.data]
+            else:
+                container[key] = self._resolve(container[key])
 
-        if structure.name:
-            lines.append(B"$" if structure.name_is_global else B"%")
-            lines.append(structure.name)
+    def _resolve(self, reference):
+        if reference is None or reference[:1] != B"$" or B"%" in reference:
+            return reference
+        return self.names.get(reference[1:], reference)
 
-        if len(structure.properties) != 0:
-            lines.append(B"(" + B",".join(self.property_as_text(prop) for prop in structure.properties.items()) + B")")
 
-        lines.append(B"{")
+DdlIndexEntry = namedtuple("DdlIndexEntry", ["offset", "length", "top_level", "identifier", "name"])
+DdlIndexEntry.__doc__ = """
+A structure in a `DdlIndex`: offset and length of its text in bytes, whether it is a top-level structure, its
+identifier and its global name (or None).
+"""
 
-        for sub in structure.children:
-            if isinstance(sub, DdlPrimitive):
-                lines.extend(self.primitive_as_text(sub))
+
+class DdlIndex:
+    """
+    Index of the top-level and globally named structures of a file written with `index="footer"` or
+    `index="sidecar"` by a text writer, to read single structures without parsing the whole file.
+    """
+
+    def __init__(self, filename):
+        """
+        Constructor, reads the index from the sidecar file if there is one, otherwise from the footer of the file.
+        Only the index is read, not the rest of the file.
+        :param filename: path of the indexed file
+        :raises ValueError: if the file has no index, or the sidecar file does not belong to it
+        """
+        self.filename = filename
+        size = os.path.getsize(filename)
+
+        if os.path.exists(filename + ".index"):
+            with open(filename + ".index", "rb") as file:
+                lines = file.read().splitlines()
+            if not lines or lines[0] != _INDEX_MAGIC + B" %d" % size:
+                raise ValueError("the index of {} is outdated".format(filename))
+            lines = lines[1:]
+        else:
+            footer_size = len(_INDEX_FOOTER % 0)
+            with open(filename, "rb") as file:
+                file.seek(max(size - footer_size, 0))
+                footer = file.read()
+                prefix = B"// " + _INDEX_MAGIC + B" "
+                if len(footer) != footer_size or not footer.startswith(prefix):
+                    raise ValueError("{} has no index".format(filename))
+                offset = int(footer[len(prefix):])
+                file.seek(offset)
+                lines = file.read(size - footer_size - offset).splitlines()
+            if lines[:1] != [B"/* " + _INDEX_MAGIC] or lines[-1:] != [B"*/"]:
+                raise ValueError("{} has a malformed index".format(filename))
+            lines = lines[1:-1]
+
+        self.entries = []
+        # entries by global name
+        self.names = {}
+        for line in lines:
+            offset, length, top_level, identifier, name = line.split()
+            entry = DdlIndexEntry(int(offset), int(length), top_level == B"1", identifier,
+                                  None if name == B"-" else name)
+            self.entries.append(entry)
+            if entry.name is not None:
+                self.names.setdefault(entry.name, entry)
+
+    def top_level(self):
+        """
+        :return: list of the entries of the top-level structures
+        """
+        return [entry for entry in self.entries if entry.top_level]
+
+    def read_text(self, entry):
+        """
+        Read the text of a structure by seeking to it.
+        :param entry: a `DdlIndexEntry` or the global name of a structure
+        :return: the text of the structure
+        """
+        if not isinstance(entry, DdlIndexEntry):
+            entry = self.names[entry]
+        with open(self.filename, "rb") as file:
+            file.seek(entry.offset)
+            return file.read(entry.length)
+
+    def read_structure(self, entry, reader=None):
+        """
+        Read a single structure, parsing only its text. References to structures outside of it are not resolved and
+        kept as `DdlReference`.
+        :param entry: a `DdlIndexEntry` or the global name of a structure
+        :param reader: `DdlTextReader` to parse the text with, defaults to one with default options
+        :return: the `DdlStructure`
+        """
+        reader = reader if reader is not None else DdlTextReader()
+        return reader.read_bytes(self.read_text(entry)).structures[0]
+
+
+# magic, version, source modification time, size and digest, offsets and sizes of the sections
+_SNAPSHOT_HEADER = struct.Struct("<8sIxxxxQQ16sQQQQQQQQ")
+_SNAPSHOT_MAGIC = B"PYDDLSNP"
+_SNAPSHOT_VERSION = 2
+
+# kind, flags, data type, typecode, vector size, max elements per line, identifier, name and comment string index,
+# prototype node index and three kind dependent fields: properties, first child and number of children for
+# structures, data kind, offset and size for primitives. Fragments store their text and compressed text in place of
+# identifier and name.
+_SNAPSHOT_NODE = struct.Struct("<BBBBiiIIIIQQQ")
+
+_NO_STRING = 0xFFFFFFFF
+_NO_NODE = 0xFFFFFFFF
+_NO_VALUES = 0xFFFFFFFFFFFFFFFF
+
+# node flags: global name, multidimensional numpy data, data or children shared with the prototype, properties shared
+# with the prototype
+_FLAG_GLOBAL, _FLAG_NDIM, _FLAG_SHARED, _FLAG_SHARED_PROPERTIES = 1, 2, 4, 8
+
+# node kinds
+_SNAPSHOT_DOCUMENT, _SNAPSHOT_STRUCTURE, _SNAPSHOT_PRIMITIVE, _SNAPSHOT_FRAGMENT = range(4)
+
+# primitive data kinds: tagged values, numeric list stored as typed payload, flat typed buffer, numpy array
+_DATA_VALUES, _DATA_LIST, _DATA_BUFFER, _DATA_NUMPY = range(4)
+
+_DATA_TYPES_BY_VALUE = list(DdlPrimitiveDataType)
+
+_SNAPSHOT_CLASSES = [DdlDocument, DdlStructure, DdlPrimitive, DdlFragment]
+# classes of nodes which have a prototype, see `DdlStructure.instance()`
+_SNAPSHOT_INSTANCE_CLASSES = [None, _StructureInstance, _PrimitiveInstance, None]
+
+
+class _SnapshotEncoder:
+    """
+    Collects the sections of a snapshot: interned strings, tagged values and aligned typed payloads.
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.values = bytearray()
+        self.payloads = []
+        self.payload_size = 0
+        # node index by id(), nodes to encode
+        self.index = {}
+        self.nodes = []
+
+    def string(self, s):
+        if s is None:
+            return _NO_STRING
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def node(self, node):
+        index = self.index.get(id(node))
+        if index is None:
+            index = self.index[id(node)] = len(self.nodes)
+            self.nodes.append(node)
+        return index
+
+    def payload(self, buffer):
+        """
+        :return: offset of the payload relative to the start of the payload section
+        """
+        buffer = memoryview(buffer).cast("B")
+        offset = self.payload_size
+        padding = -len(buffer) % 8
+        self.payloads.append(buffer)
+        if padding:
+            self.payloads.append(B"\0" * padding)
+        self.payload_size += len(buffer) + padding
+        return offset
+
+    def value(self, value):
+        out = self.values
+        if value is None:
+            out += B"N"
+        elif value is True or value is False:
+            out += B"T" if value else B"F"
+        elif isinstance(value, int) and not isinstance(value, Enum):
+            if -1 << 63 <= value < 1 << 63:
+                out += B"i" + struct.pack("<q", value)
             else:
-                lines.append(self.structure_as_text(sub))
+                out += B"I" + struct.pack("<I", self.string(str(value).encode()))
+        elif isinstance(value, float):
+            out += B"f" + struct.pack("<d", value)
+        elif isinstance(value, DdlReference):
+            out += B"R" + struct.pack("<I", self.string(bytes(value)))
+        elif isinstance(value, bytes):
+            out += B"b" + struct.pack("<I", self.string(value))
+        elif isinstance(value, str):
+            out += B"s" + struct.pack("<I", self.string(value.encode()))
+        elif isinstance(value, DdlPrimitiveDataType):
+            out += B"t" + struct.pack("<B", value.value)
+        elif isinstance(value, (DdlStructure, DdlPrimitive)):
+            out += B"r" + struct.pack("<I", self.node(value))
+        elif isinstance(value, (list, tuple)):
+            out += (B"l" if isinstance(value, list) else B"v") + struct.pack("<I", len(value))
+            for item in value:
+                self.value(item)
+        else:
+            raise TypeError("cannot store value of type {} in a snapshot".format(type(value).__name__))
 
-        lines.append(B"}")
+    def primitive_data(self, primitive):
+        """
+        :return: data kind, typecode, offset and size of the data of a primitive
+        """
+        data = _shared(primitive, "data")
+        typecode = _ARRAY_TYPECODES.get(primitive.data_type)
+        if typecode is not None:
+            if numpy is not None and isinstance(data, numpy.ndarray):
+                data = numpy.ascontiguousarray(data)
+                return _DATA_NUMPY, data.dtype.char, self.payload(data.reshape(-1).view(numpy.uint8)), data.size
+            if isinstance(data, (array.array, memoryview)):
+                data = memoryview(data)
+                return _DATA_BUFFER, data.format[-1], self.payload(data), data.nbytes // data.itemsize
+            if isinstance(data, _VectorView):
+                # loaded as a list of vectors again
+                return _DATA_LIST, data.buffer.format, self.payload(data.buffer), len(data.buffer)
+
+            try:
+                values = [value for vector in data for value in vector] if primitive.vector_size != 0 else data
+                buffer = array.array("d" if primitive.data_type in _FLOAT_TYPES else "q", values)
+            except (TypeError, OverflowError):
+                pass
+            else:
+                return _DATA_LIST, buffer.typecode, self.payload(buffer), len(buffer)
 
-        return B''.join(lines)
+        offset = len(self.values)
+        self.value(list(data))
+        return _DATA_VALUES, "\0", offset, len(self.values) - offset
 
 
-# Space reserved for a specification based OpenDdlBinaryWriter ;)
-# Hope there will be some specification for it some day.
+def save_snapshot(document, filename, source=None):
+    """
+    Write a document to a binary snapshot file, which can be loaded much faster than text with `load_snapshot()`.
+    Identifiers and names are interned, numeric primitive data is stored as raw typed payload in native byte order,
+    so snapshots are meant as a cache on one machine rather than for exchange.
+    :param document: the `DdlDocument` to store
+    :param filename: path of the snapshot file
+    :param source: optional tuple of modification time in nanoseconds, size and digest of the text file the document
+        was read from, see `DdlSnapshotCache`
+    """
+    encoder = _SnapshotEncoder()
+    encoder.node(document)
+    records = []
+    children = array.array("I")
+
+    # nodes are appended while encoding, e.g. structures which are referenced but not part of the document
+    i = 0
+    while i < len(encoder.nodes):
+        node = encoder.nodes[i]
+        i += 1
+        # instances only store what they do not share with their prototype
+        attributes = node.__dict__
+        comment = encoder.string(attributes.get("comment"))
+        prototype = attributes.get("_prototype")
+        prototype = encoder.node(prototype) if prototype is not None else _NO_NODE
+        if isinstance(node, DdlPrimitive):
+            if "data" in attributes:
+                kind, typecode, offset, size = encoder.primitive_data(node)
+                flags = node.name_is_global | (getattr(attributes["data"], "ndim", 1) > 1) * _FLAG_NDIM
+            else:
+                kind, typecode, offset, size = _DATA_VALUES, "\0", 0, 0
+                flags = node.name_is_global | _FLAG_SHARED
+            max_elements = attributes.get("max_elements_per_line")
+            records.append(_SNAPSHOT_NODE.pack(
+                _SNAPSHOT_PRIMITIVE, flags, node.data_type.value, ord(typecode), node.vector_size,
+                -1 if max_elements is None else max_elements, _NO_STRING, encoder.string(node.name), comment,
+                prototype, kind, offset, size))
+            continue
+        if isinstance(node, DdlFragment):
+            records.append(_SNAPSHOT_NODE.pack(_SNAPSHOT_FRAGMENT, 0, 0, 0, 0, -1, encoder.string(node.text),
+                                               encoder.string(node.compressed), _NO_STRING, _NO_NODE, 0, 0, 0))
+            continue
+
+        if isinstance(node, DdlDocument):
+            kind, flags, nodes, identifier, name, properties = (_SNAPSHOT_DOCUMENT, _FLAG_GLOBAL, node.structures,
+                                                                None, None, 0)
+        else:
+            kind, flags, identifier, name = _SNAPSHOT_STRUCTURE, int(node.name_is_global), node.identifier, node.name
+            nodes = attributes.get("children", ())
+            if "children" not in attributes:
+                flags |= _FLAG_SHARED
+            properties = _NO_VALUES
+            if "properties" not in attributes:
+                flags |= _FLAG_SHARED_PROPERTIES
+            elif node.properties:
+                properties = len(encoder.values)
+                encoder.value(list(node.properties.items()))
+
+        first = len(children)
+        children.extend(encoder.node(child) for child in nodes)
+        records.append(_SNAPSHOT_NODE.pack(
+            kind, flags, 0, 0, 0, -1, encoder.string(identifier), encoder.string(name), comment, prototype,
+            properties, first, len(nodes)))
+
+    strings = list(encoder.strings)
+    string_offsets = array.array("Q", [0])
+    for s in strings:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    # sections, each aligned to 8 bytes
+    sections = [B"".join(records), children, string_offsets, B"".join(strings), encoder.values]
+    offsets = []
+    offset = _SNAPSHOT_HEADER.size
+    for i, section in enumerate(sections):
+        section = sections[i] = memoryview(section).cast("B")
+        offsets.append(offset)
+        offset += len(section) + (-len(section) % 8)
+
+    mtime, size, digest = source if source is not None else (0, 0, B"\0" * 16)
+    header = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, mtime, size, digest, len(records),
+                                   offsets[1], len(children), offsets[2], len(strings), offsets[4],
+                                   len(encoder.values), offset)
+
+    with open(filename, "wb") as file:
+        file.write(header)
+        for section in sections:
+            file.write(section)
+            file.write(B"\0" * (-len(section) % 8))
+        for payload in encoder.payloads:
+            file.write(payload)
+
+
+def _read_snapshot_header(buffer):
+    if len(buffer) < _SNAPSHOT_HEADER.size:
+        raise ValueError("not a pyddl snapshot")
+    header = _SNAPSHOT_HEADER.unpack_from(buffer)
+    if header[0] != _SNAPSHOT_MAGIC:
+        raise ValueError("not a pyddl snapshot")
+    if header[1] != _SNAPSHOT_VERSION:
+        raise ValueError("unsupported snapshot version {}".format(header[1]))
+    return header
+
+
+class _SnapshotDecoder:
+    """
+    Decodes tagged values of a snapshot.
+    """
+
+    def __init__(self, values, strings, nodes):
+        self.values = values
+        self.strings = strings
+        self.nodes = nodes
+        self.pos = 0
+
+    def value(self, pos=None):
+        if pos is not None:
+            self.pos = pos
+        values, pos = self.values, self.pos
+        tag = values[pos]
+        self.pos = pos + 1
+        if tag == 0x4E:  # N
+            return None
+        if tag == 0x54:  # T
+            return True
+        if tag == 0x46:  # F
+            return False
+        self.pos = pos + 9
+        if tag == 0x69:  # i
+            return struct.unpack_from("<q", values, pos + 1)[0]
+        if tag == 0x66:  # f
+            return struct.unpack_from("<d", values, pos + 1)[0]
+        self.pos = pos + 2
+        if tag == 0x74:  # t
+            return _DATA_TYPES_BY_VALUE[values[pos + 1]]
+
+        self.pos = pos + 5
+        index = struct.unpack_from("<I", values, pos + 1)[0]
+        if tag == 0x62:  # b
+            return self.strings[index]
+        if tag == 0x73:  # s
+            return self.strings[index].decode()
+        if tag == 0x72:  # r
+            return self.nodes[index]
+        if tag == 0x52:  # R
+            return DdlReference(self.strings[index])
+        if tag == 0x49:  # I
+            return int(self.strings[index])
+        if tag == 0x6C:  # l
+            return [self.value() for _ in range(index)]
+        if tag == 0x76:  # v
+            return tuple(self.value() for _ in range(index))
+        raise ValueError("invalid snapshot value tag {}".format(tag))
+
+
+def load_snapshot(filename, copy=False):
+    """
+    Load a document from a snapshot written by `save_snapshot()`.
+    The file is memory mapped and typed primitive data is returned as `memoryview`s into it (or numpy arrays, if it
+    was stored from numpy arrays), so loading takes time proportional to the number of structures, not to the size
+    of their data. These views are read-only and keep the file mapped as long as they are referenced.
+    :param filename: path of the snapshot file
+    :param copy: read the file into memory instead, which makes the typed primitive data writable
+    :return: the loaded `DdlDocument`
+    """
+    with open(filename, "rb") as file:
+        if copy:
+            buffer = bytearray(file.read())
+        else:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                buffer = B""
+
+    (_, _, _, _, _, node_count, children_offset, children_count, strings_offset, string_count, values_offset,
+     values_size, payload_offset) = _read_snapshot_header(buffer)
+    view = memoryview(buffer)
+
+    records = _SNAPSHOT_NODE.iter_unpack(view[_SNAPSHOT_HEADER.size:_SNAPSHOT_HEADER.size +
+                                              node_count * _SNAPSHOT_NODE.size])
+    children = view[children_offset:children_offset + 4 * children_count].cast("I").tolist()
+    string_offsets = view[strings_offset:strings_offset + 8 * (string_count + 1)].cast("Q").tolist()
+    blob_offset = strings_offset + 8 * (string_count + 1)
+    blob = bytes(view[blob_offset:blob_offset + string_offsets[-1]])
+    strings = [blob[string_offsets[i]:string_offsets[i + 1]] for i in range(string_count)]
+    strings.append(None)
+
+    records = list(records)
+    # objects are created first and filled in afterwards, since any node can be referenced by any other
+    nodes = [object.__new__((_SNAPSHOT_CLASSES if record[9] == _NO_NODE else _SNAPSHOT_INSTANCE_CLASSES)[record[0]])
+             for record in records]
+    decoder = _SnapshotDecoder(bytes(view[values_offset:values_offset + values_size]), strings, nodes)
+
+    # the objects are all alive until the end, collecting garbage in between would only waste time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i, (kind, flags, data_type, typecode, vector_size, max_elements, identifier, name, comment, prototype,
+                a, b, c) in enumerate(records):
+            node = nodes[i]
+            state = {"_hash": None}
+            if prototype != _NO_NODE:
+                state["_prototype"] = nodes[prototype]
+
+            if kind == _SNAPSHOT_PRIMITIVE:
+                typecode = chr(typecode)
+                if flags & _FLAG_SHARED:
+                    data = None
+                elif a == _DATA_VALUES:
+                    data = decoder.value(b)
+                elif a == _DATA_NUMPY and numpy is not None:
+                    data = numpy.frombuffer(buffer, numpy.dtype(typecode), c, payload_offset + b)
+                    if flags & _FLAG_NDIM:
+                        data = data.reshape(-1, vector_size)
+                else:
+                    data = view[payload_offset + b:payload_offset + b + c * struct.calcsize(typecode)]
+                    if typecode == "e":
+                        # memoryviews do not support half floats
+                        data = array.array("f", struct.unpack("<{}e".format(c), data))
+                    else:
+                        data = data.cast(typecode)
+                    if a == _DATA_LIST:
+                        data = data.tolist()
+                        if vector_size != 0:
+                            data = list(zip(*[iter(data)] * vector_size))
+                state.update(data_type=_DATA_TYPES_BY_VALUE[data_type], vector_size=vector_size)
+                if not flags & _FLAG_SHARED:
+                    state["data"] = data
+                if max_elements != -1:
+                    state["max_elements_per_line"] = max_elements
+            elif kind == _SNAPSHOT_FRAGMENT:
+                node.__dict__.update(state, text=strings[identifier], compressed=strings[min(name, string_count)])
+                continue
+            else:
+                indices = children[b:b + c]
+                child_list = DdlChildList([nodes[child] for child in indices])
+
+                if kind == _SNAPSHOT_DOCUMENT:
+                    node.__dict__.update(state, structures=child_list)
+                    continue
+                state["identifier"] = strings[identifier]
+                if not flags & _FLAG_SHARED:
+                    state["children"] = child_list
+                if not flags & _FLAG_SHARED_PROPERTIES:
+                    state["properties"] = DdlPropertyDict(decoder.value(a) if a != _NO_VALUES else ())
+
+            state.update(name=strings[min(name, string_count)], name_is_global=bool(flags & _FLAG_GLOBAL))
+            if comment != _NO_STRING:
+                state["comment"] = strings[comment]
+            node.__dict__.update(state)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return nodes[0]
+
+
+def _file_digest(filename):
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), B""):
+            h.update(chunk)
+    return h.digest()
+
+
+class DdlSnapshotCache:
+    """
+    Cache of documents read from text files, stored as snapshots (see `save_snapshot()`) in a directory.
+
+    Snapshots are keyed by the absolute path of the text file and record its modification time, size and content
+    digest. A snapshot is used if modification time and size are unchanged, or if only the modification time changed
+    but the content is the same. Otherwise the text file is read again and the snapshot replaced.
+    """
+
+    def __init__(self, directory, reader=None):
+        """
+        Constructor
+        :param directory: directory to store snapshots in, created if it does not exist
+        :param reader: `DdlReader` to read text files with, defaults to a `DdlTextReader` reading into typed arrays
+        """
+        self.directory = directory
+        self.reader = reader if reader is not None else DdlTextReader(typed_arrays="array")
+
+    def snapshot_path(self, filename):
+        """
+        :return: path of the snapshot for the given text file
+        """
+        key = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, key + ".snapshot")
+
+    def load(self, filename, copy=False):
+        """
+        Load a document from its snapshot, or read it from text and store a snapshot if there is no valid one.
+        The document is loaded from the snapshot either way, so its typed primitive data is of the same kind, see
+        `load_snapshot()`.
+        :param filename: path of the text file
+        :param copy: read the snapshot into memory instead of mapping it, which makes the typed primitive data writable
+        :return: the `DdlDocument`
+        """
+        stat = os.stat(filename)
+        path = self.snapshot_path(filename)
+
+        try:
+            with open(path, "rb") as file:
+                header = _read_snapshot_header(file.read(_SNAPSHOT_HEADER.size))
+            mtime, size, digest = header[2:5]
+            if size == stat.st_size and mtime != stat.st_mtime_ns and digest == _file_digest(filename):
+                # touched, but not modified. The snapshot is valid even if it cannot be updated, e.g. in a read-only
+                # cache directory
+                mtime = stat.st_mtime_ns
+                try:
+                    with open(path, "r+b") as file:
+                        file.seek(16)  # after magic and version
+                        file.write(struct.pack("<Q", mtime))
+                except OSError:
+                    pass
+            if (mtime, size) == (stat.st_mtime_ns, stat.st_size):
+                return load_snapshot(path, copy)
+        except (OSError, ValueError):
+            pass
+
+        document = self.reader.read(filename)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            save_snapshot(document, temporary, (stat.st_mtime_ns, stat.st_size, _file_digest(filename)))
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return load_snapshot(path, copy)
+
+
+def _is_mapped(data):
+    """
+    :return: whether primitive data is a view of a buffer, e.g. of a memory mapped file it was spilled to or loaded from
+    """
+    while data is not None and not isinstance(data, (memoryview, mmap.mmap)):
+        data = getattr(data, "base", None)
+    return data is not None
+
+
+class _VectorView:
+    """
+    Read-only sequence of the vectors in a flat typed buffer, as tuples. Spilled lists of vectors keep their shape
+    this way.
+    """
+
+    def __init__(self, buffer, vector_size):
+        """
+        Constructor
+        :param buffer: flat `memoryview` of the values
+        :param vector_size: number of values per vector
+        """
+        self.buffer = buffer
+        self.vector_size = vector_size
+
+    @property
+    def base(self):
+        return self.buffer
+
+    def __len__(self):
+        return len(self.buffer) // self.vector_size
+
+    def __getitem__(self, index):
+        size = self.vector_size
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            values = self.buffer[start * size:max(start, stop) * size].tolist()
+            return list(zip(*[iter(values)] * size))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("vector index out of range")
+        return tuple(self.buffer[index * size:(index + 1) * size].tolist())
+
+    def __iter__(self):
+        # in chunks, so that the values are never held in memory as a whole
+        chunk = _CHUNK_VALUES - _CHUNK_VALUES % self.vector_size
+        for start in range(0, len(self.buffer), chunk):
+            values = self.buffer[start:start + chunk].tolist()
+            yield from zip(*[iter(values)] * self.vector_size)
+
+
+class _SpillSegment:
+    """
+    Memory mapped temporary file which spilled payloads are appended to.
+    """
+
+    def __init__(self, directory, capacity):
+        with tempfile.TemporaryFile(dir=directory) as file:
+            file.truncate(capacity)
+            # the mapping keeps the deleted file alive until it is garbage collected with the last view into it
+            self.buffer = mmap.mmap(file.fileno(), capacity)
+        self.view = memoryview(self.buffer)
+        self.size = 0
+
+    def append(self, buffer):
+        """
+        :return: a view of the copy of the buffer in the file
+        """
+        buffer = memoryview(buffer).cast("B")
+        start = self.size
+        self.view[start:start + len(buffer)] = buffer
+        self.size = start + len(buffer) + (-len(buffer) % 8)
+        return self.view[start:start + len(buffer)]
+
+
+class DdlSpillStore:
+    """
+    Memory budget for the numeric data of primitive structures, to build documents which do not fit into memory.
+
+    While a store is active (`with store:`), the data of every primitive structure that is created or assigned new
+    data is tracked, if it is larger than the threshold. Whenever the tracked data exceeds the budget, the data
+    tracked the longest is moved to memory mapped temporary files in typed binary form, i.e. it is replaced by a
+    read-only view of the file: a `memoryview` for lists of values and `array.array`s, a sequence of tuples for lists
+    of vectors and a numpy array of the same shape for numpy arrays. The operating system pages it in and out as needed,
+    and the text writers encode it in chunks, so it is never held in memory as a whole. One store can be shared by
+    many documents.
+    """
+
+    def __init__(self, budget=256 << 20, threshold=1 << 20, directory=None, segment_size=64 << 20):
+        """
+        Constructor
+        :param budget: number of bytes of tracked data to keep in memory
+        :param threshold: data smaller than this number of bytes is not tracked
+        :param directory: directory for the temporary files, defaults to the system's temporary directory
+        :param segment_size: size of the temporary files, larger data gets a file of its own
+        """
+        self.budget = budget
+        self.threshold = threshold
+        self.directory = directory
+        self.segment_size = segment_size
+        # bytes of tracked data in memory and in temporary files
+        self.resident = 0
+        self.spilled = 0
+        # (weak reference, size) of the tracked primitives by id, in the order they were tracked
+        self.tracked = collections.OrderedDict()
+        self.segment = None
+        self.previous = []
+
+    def __enter__(self):
+        global _spill_store
+        self.previous.append(_spill_store)
+        _spill_store = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        global _spill_store
+        _spill_store = self.previous.pop()
+
+    @staticmethod
+    def payload_size(data):
+        """
+        Estimate the memory used by numeric primitive data. Lists are counted with 32 bytes per value for the number
+        objects and references to them.
+        :return: number of bytes
+        """
+        if isinstance(data, array.array):
+            return len(data) * data.itemsize
+        if hasattr(data, "nbytes"):
+            return data.nbytes
+        if len(data) == 0:
+            return 0
+        values = len(data) * (len(data[0]) if isinstance(data[0], (tuple, list)) else 1)
+        return values * 32
+
+    def track(self, primitive):
+        """
+        Account for the data of a primitive structure, and spill data if the budget is exceeded.
+        :param primitive: the `DdlPrimitive`
+        """
+        key = id(primitive)
+        entry = self.tracked.pop(key, None)
+        if entry is not None:
+            self.resident -= entry[1]
+
+        data = primitive.__dict__.get("data")
+        if data is None or primitive.data_type not in _ARRAY_TYPECODES or _is_mapped(data):
+            return
+        size = self.payload_size(data)
+        if size < self.threshold:
+            return
+
+        def forget(reference):
+            entry = self.tracked.pop(key, None)
+            if entry is not None and entry[0] is reference:
+                self.resident -= entry[1]
+
+        self.tracked[key] = (weakref.ref(primitive, forget), size)
+        self.resident += size
+        while self.resident > self.budget and self.tracked:
+            reference, size = self.tracked.popitem(last=False)[1]
+            self.resident -= size
+            primitive = reference()
+            if primitive is not None:
+                self.spill(primitive)
+
+    def track_all(self, root):
+        """
+        Track the data of all primitive structures of a document or structure, e.g. one that was read before.
+        :param root: `DdlDocument` or `DdlStructure`
+        """
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, DdlPrimitive):
+                self.track(node)
+            elif isinstance(node, DdlDocument):
+                stack.extend(node.structures)
+            elif isinstance(node, DdlStructure):
+                stack.extend(node.__dict__.get("children", ()))
+
+    def spill(self, primitive):
+        """
+        Move the data of a primitive structure to a temporary file. The content hash of the primitive is kept.
+        :param primitive: the `DdlPrimitive`
+        :return: whether the data was moved. Numeric lists with values that do not fit into 64 bit are not, the data
+            is not tracked anymore either way.
+        """
+        entry = self.tracked.pop(id(primitive), None)
+        if entry is not None:
+            self.resident -= entry[1]
+
+        data = primitive.__dict__.get("data")
+        if data is None or primitive.data_type not in _ARRAY_TYPECODES or _is_mapped(data):
+            return False
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            buffer = numpy.ascontiguousarray(data)
+        elif isinstance(data, array.array):
+            buffer = data
+        else:
+            try:
+                values = [value for vector in data for value in vector] if primitive.vector_size != 0 else data
+                buffer = array.array("d" if primitive.data_type in _FLOAT_TYPES else "q", values)
+            except (TypeError, OverflowError):
+                return False
+
+        nbytes = memoryview(buffer).nbytes
+        if self.segment is None or self.segment.size + nbytes > len(self.segment.buffer):
+            self.segment = _SpillSegment(self.directory, max(self.segment_size, nbytes + (-nbytes % 8)))
+        view = self.segment.append(buffer)
+        self.spilled += nbytes
+
+        # read-only, changes in place would not invalidate the content hash
+        view = view.toreadonly()
+        if isinstance(buffer, array.array):
+            spilled = view.cast(buffer.typecode)
+            if buffer is not data and primitive.vector_size != 0:
+                spilled = _VectorView(spilled, primitive.vector_size)
+        else:
+            spilled = numpy.frombuffer(view, buffer.dtype).reshape(buffer.shape)
+        # assigned directly, the content does not change
+        primitive.__dict__["data"] = spilled
+        return True
+
+
+class DdlTokenStream:
+    """
+    Reads the tokens of OpenDDL text from a binary stream in chunks, in constant memory.
+
+    Whitespace and comments are skipped. Every token is a tuple of kind ("punctuation", "number", "identifier", "ref",
+    "string" or "char"), text and start and end offset in the stream.
+    """
+
+    def __init__(self, stream, chunk_size=1 << 20):
+        """
+        Constructor
+        :param stream: binary stream to read from, e.g. an open file or `sys.stdin.buffer`
+        :param chunk_size: number of bytes to read at once
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = B""
+        # offset of the buffer in the stream
+        self.offset = 0
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        return iter(self.next_token, None)
+
+    def _refill(self):
+        """
+        Read the next chunk, dropping everything before the current position from the buffer.
+        :return: false if the end of the stream was reached before
+        """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = len(chunk) == 0
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def next_token(self):
+        """
+        :return: the next token, or None at the end of the stream
+        """
+        while True:
+            match = _STREAM_TOKEN.match(self.buffer, self.pos)
+            if match is not None and B"/" in self.buffer[self.pos:match.start(match.lastgroup)]:
+                # the token must not be the end of a comment which was shortened by backtracking
+                if _SKIP.match(self.buffer, self.pos).end() != match.start(match.lastgroup):
+                    match = None
+            if match is None or (match.end() == len(self.buffer) and not self.eof):
+                # the token or comment may continue in the next chunk
+                if self._refill():
+                    continue
+                if match is None:
+                    skip = _SKIP.match(self.buffer, self.pos).end()
+                    if skip == len(self.buffer):
+                        return None
+                    raise DdlParseError("unexpected character at offset {}".format(self.offset + skip))
+
+            kind = match.lastgroup
+            self.pos = match.end()
+            return kind, match.group(kind), self.offset + match.start(kind), self.offset + self.pos
+
+    def numeric_data(self, vectors):
+        """
+        Read the data of a numeric primitive structure in pieces, without tokenizing it. Must be called after the
+        opening brace.
+        Every piece contains complete values (or vectors), the separators between pieces are dropped. Stops after the
+        closing brace, or early before any string, character literal or comment, after which the rest of the data
+        needs to be read with `next_token()`.
+        :param vectors: whether the data consists of vectors
+        :return: generator of byte strings, whose return value is true if the closing brace was reached
+        """
+        if vectors:
+            token = self.next_token()
+            if token is not None and token[1] == B"}":
+                return True
+            if token is not None:
+                self.pos = token[2] - self.offset
+
+        while True:
+            buffer, pos = self.buffer, self.pos
+            if vectors:
+                match = _VECTORS_END.search(buffer, pos)
+                end = match.start() + 1 if match is not None else -1
+            else:
+                end = buffer.find(B"}", pos)
+
+            special = _NOT_NUMERIC.search(buffer, pos, end if end != -1 else len(buffer))
+            if special is None and end != -1:
+                if buffer[pos:end].strip():
+                    yield buffer[pos:end]
+                self.pos = match.end() if vectors else end + 1
+                return True
+
+            # everything up to the last separator is complete
+            stop = special.start() if special is not None else len(buffer)
+            cut = buffer.rfind(B"}," if vectors else B",", pos, stop)
+            if cut != -1:
+                yield buffer[pos:cut + 1 if vectors else cut]
+                self.pos = cut + (2 if vectors else 1)
+            elif special is not None:
+                return False
+            elif not self._refill():
+                raise DdlParseError("missing \"}\" at end of stream")
+
+
+def _iter_events(stream):
+    """
+    Turn a token stream into a stream of events, without building any structures:
+    ("structure", identifier, name, properties, start), ("end", end),
+    ("primitive", data type, vector size, name, start), ("value", text), ("vector", list of texts),
+    ("data", text of complete numeric values or vectors) and ("end_primitive", end).
+    Names and values are kept as they appear in the text, properties are a list of key and value pairs.
+    :param stream: a `DdlTokenStream`
+    """
+    pending = []
+
+    def next_token(expected=None):
+        token = pending.pop() if pending else stream.next_token()
+        if token is None:
+            raise DdlParseError("missing \"}\" at end of stream")
+        if expected is not None and token[1] != expected:
+            raise DdlParseError("expected \"{}\" at offset {}".format(expected.decode(), token[2]))
+        return token
+
+    def value():
+        # values are any single token, or multiple concatenated strings
+        kind, text, start, end = next_token()
+        if kind == "punctuation":
+            raise DdlParseError("expected value at offset {}".format(start))
+        if kind == "string":
+            texts = [text]
+            while True:
+                token = next_token()
+                if token[0] != "string":
+                    pending.append(token)
+                    return B" ".join(texts)
+                texts.append(token[1])
+        return text
+
+    depth = 0
+    while True:
+        token = pending.pop() if pending else stream.next_token()
+        if token is None:
+            if depth != 0:
+                raise DdlParseError("missing \"}\" at end of stream")
+            return
+        kind, text, start, end = token
+
+        if text == B"}":
+            if depth == 0:
+                raise DdlParseError("unexpected \"}\" at offset {}".format(start))
+            depth -= 1
+            yield "end", end
+            continue
+        if kind != "identifier":
+            raise DdlParseError("expected structure identifier at offset {}".format(start))
+
+        if text in _DATA_TYPES:
+            data_type = text
+            vector_size = None
+            name = None
+            kind, text, s, e = next_token()
+            if text == B"[":
+                vector_size = next_token()[1]
+                next_token(B"]")
+                kind, text, s, e = next_token()
+            if kind == "ref":
+                name = text
+                kind, text, s, e = next_token()
+            if text != B"{":
+                raise DdlParseError("expected \"{{\" at offset {}".format(s))
+            yield "primitive", data_type, vector_size, name, start
+
+            if _DATA_TYPES[data_type] in _ARRAY_TYPECODES:
+                pieces = stream.numeric_data(vector_size is not None)
+                while True:
+                    try:
+                        yield "data", next(pieces)
+                    except StopIteration as stop:
+                        complete = stop.value
+                        break
+                if complete:
+                    yield "end_primitive", stream.offset + stream.pos
+                    continue
+
+            token = next_token()
+            while token[1] != B"}":
+                if vector_size is None:
+                    pending.append(token)
+                    yield "value", value()
+                else:
+                    if token[1] != B"{":
+                        raise DdlParseError("expected \"{{\" at offset {}".format(token[2]))
+                    vector = [value()]
+                    token = next_token()
+                    while token[1] == B",":
+                        vector.append(value())
+                        token = next_token()
+                    if token[1] != B"}":
+                        raise DdlParseError("expected \"}}\" at offset {}".format(token[2]))
+                    yield "vector", vector
+
+                token = next_token()
+                if token[1] == B",":
+                    token = next_token()
+                elif token[1] != B"}":
+                    raise DdlParseError("expected \",\" or \"}}\" at offset {}".format(token[2]))
+            yield "end_primitive", token[3]
+        else:
+            identifier = text
+            name = None
+            properties = []
+            kind, text, s, e = next_token()
+            if kind == "ref":
+                name = text
+                kind, text, s, e = next_token()
+            if text == B"(":
+                token = next_token()
+                while token[1] != B")":
+                    key = token[1]
+                    token = next_token()
+                    if token[1] == B"=":
+                        properties.append((key, value()))
+                        token = next_token()
+                    else:
+                        properties.append((key, None))
+                    if token[1] == B",":
+                        token = next_token()
+                    elif token[1] != B")":
+                        raise DdlParseError("expected \",\" or \")\" at offset {}".format(token[2]))
+                kind, text, s, e = next_token()
+            if text != B"{":
+                raise DdlParseError("expected \"{{\" at offset {}".format(s))
+            depth += 1
+            yield "structure", identifier, name, properties, start
+
+
+def _data_values(piece, vector_size):
+    """
+    Split a piece of numeric data into values, or into vectors of values.
+    """
+    values = piece.translate(_SEPARATORS).split()
+    if vector_size is None:
+        if _numeric_count(piece, 0) != len(values):
+            raise DdlParseError("malformed data: " + piece[:40].decode("UTF-8", "replace"))
+        return values
+
+    vector_size = int(vector_size, 0)
+    if _numeric_count(piece, vector_size) != len(values):
+        raise DdlParseError("malformed vector data: " + piece[:40].decode("UTF-8", "replace"))
+    return [values[i:i + vector_size] for i in range(0, len(values), vector_size)]
+
+
+class _BufferedOutput:
+    """
+    Collects byte strings and writes them to a stream in chunks.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = []
+
+    def write(self, text):
+        self.buffer.append(text)
+        if len(self.buffer) >= _FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(B"".join(self.buffer))
+        self.buffer.clear()
+
+
+def minify_stream(source, target, chunk_size=1 << 20):
+    """
+    Rewrite OpenDDL text in the layout of `DdlCompressedTextWriter`, i.e. without any whitespace or comments.
+    Works event by event in constant memory, numeric data is copied in bulk.
+    :param source: binary stream to read from
+    :param target: binary stream to write to
+    :param chunk_size: number of bytes to read at once
+    """
+    out = _BufferedOutput(target)
+    # whether the next value of the current primitive structure is the first
+    first = True
+
+    for event in _iter_events(DdlTokenStream(source, chunk_size)):
+        kind = event[0]
+        if kind == "structure":
+            out.write(event[1] if event[2] is None else event[1] + event[2])
+            if event[3]:
+                out.write(B"(" + B",".join(key + B"=" + (B"true" if value is None else value)
+                                           for key, value in event[3]) + B")")
+            out.write(B"{")
+        elif kind == "end":
+            out.write(B"}")
+        elif kind == "primitive":
+            text = event[1]
+            if event[2] is not None:
+                text += B"[" + event[2] + B"]"
+            if event[3] is not None:
+                text += event[3]
+            out.write(text + B"{")
+            first = True
+        elif kind == "end_primitive":
+            out.write(B"}")
+        else:
+            if not first:
+                out.write(B",")
+            if kind == "data":
+                out.write(event[1].translate(None, B" \t\r\n"))
+            elif kind == "value":
+                out.write(event[1])
+            else:
+                out.write(B"{" + B",".join(event[1]) + B"}")
+            first = False
+
+    out.flush()
+
+
+def prettify_stream(source, target, chunk_size=1 << 20):
+    """
+    Rewrite OpenDDL text in the layout of `DdlTextWriter`.
+    Works event by event in constant memory: only as many values as are needed to decide whether a structure is
+    simple and can be written on one line are looked ahead.
+    :param source: binary stream to read from
+    :param target: binary stream to write to
+    :param chunk_size: number of bytes to read at once
+    """
+    out = _BufferedOutput(target)
+    events = _iter_events(DdlTokenStream(source, chunk_size))
+    lookahead = collections.deque()
+
+    def next_event():
+        return lookahead.popleft() if lookahead else next(events, None)
+
+    def peek(n):
+        while len(lookahead) < n:
+            event = next(events, None)
+            if event is None:
+                return None
+            lookahead.append(event)
+        return lookahead[n - 1]
+
+    def count_elements():
+        # count up to 5 elements of the primitive structure at the front of the lookahead, return whether it is
+        # simple and the number of data events
+        primitive = peek(1)
+        count = 0
+        n = 1
+        while count < 5 and peek(n + 1)[0] != "end_primitive":
+            n += 1
+            event = peek(n)
+            if event[0] == "data":
+                count += len(_data_values(event[1], primitive[2]))
+            else:
+                count += 1
+        if primitive[2] is None:
+            return count <= 4, n - 1
+        return count == 1 and int(primitive[2], 0) <= 4, n - 1
+
+    def write_primitive(inline):
+        primitive = next_event()
+        text = primitive[1]
+        if primitive[2] is not None:
+            text += B"[" + primitive[2] + B"]"
+        if primitive[3] is not None:
+            text += B" " + primitive[3] + B" "
+
+        event = next_event()
+        if event[0] == "end_primitive":
+            out.write(text + B" { }")
+            return
+        out.write(text + (B" {" if inline else B"\n" + indent + B"{\n" + indent + B"\t"))
+
+        first = True
+        while event[0] != "end_primitive":
+            if event[0] == "data":
+                values = _data_values(event[1], primitive[2])
+                if primitive[2] is None:
+                    text = B", ".join(values)
+                else:
+                    text = B"{" + B"}, {".join(B", ".join(vector) for vector in values) + B"}"
+            elif event[0] == "value":
+                text = event[1]
+            else:
+                text = B"{" + B", ".join(event[1]) + B"}"
+            out.write(text if first else B", " + text)
+            first = False
+            event = next_event()
+        out.write(B"}" if inline else B"\n" + indent + B"}")
+
+    indent = B""
+    # whether the previous substructure was simple and whether the next is the first, per open structure
+    stack = [[False, True]]
+
+    while True:
+        event = next_event()
+        if event is None:
+            break
+        frame = stack[-1]
+
+        if event[0] == "structure":
+            is_simple = False
+            if event[2] is None and len(event[3]) <= 1 and peek(1)[0] == "primitive":
+                is_simple, n = count_elements()
+                is_simple = is_simple and peek(n + 3)[0] == "end"
+
+            if not (frame[0] and is_simple) and not frame[1]:
+                out.write(B"\n")
+            frame[0] = is_simple
+            frame[1] = False
+
+            out.write(indent + event[1])
+            if event[2] is not None:
+                out.write(B" " + event[2])
+            if event[3]:
+                out.write(B" (" + B", ".join(key + B" = " + (B"true" if value is None else value)
+                                             for key, value in event[3]) + B")")
+
+            if is_simple:
+                out.write(B" {")
+                write_primitive(True)
+                next_event()
+                out.write(B"}\n")
+            else:
+                out.write(B"\n" + indent + B"{\n")
+                stack.append([False, True])
+                indent += B"\t"
+        elif event[0] == "end":
+            stack.pop()
+            indent = indent[:-1]
+            out.write(indent + B"}\n")
+        else:
+            frame[0] = False
+            frame[1] = False
+            lookahead.appendleft(event)
+            out.write(indent)
+            write_primitive(count_elements()[0])
+            out.write(B"\n")
+
+    out.flush()
+
+
+def stream_statistics(source, chunk_size=1 << 20):
+    """
+    Count structures per identifier and primitive structures per data type, together with the number of bytes they
+    span in the text, in constant memory.
+    :param source: binary stream to read from
+    :param chunk_size: number of bytes to read at once
+    :return: dict of identifier or data type name to a list of count, bytes and (for data types) number of values
+    """
+    statistics = {}
+    # identifiers and start offsets of the open structures
+    stack = []
+    # data type name, start offset and number of values of the current primitive structure
+    primitive = None
+
+    for event in _iter_events(DdlTokenStream(source, chunk_size)):
+        kind = event[0]
+        if kind == "structure":
+            stack.append((event[1], event[4]))
+        elif kind == "end":
+            identifier, start = stack.pop()
+            entry = statistics.setdefault(identifier, [0, 0])
+            entry[0] += 1
+            entry[1] += event[1] - start
+        elif kind == "primitive":
+            primitive = [bytes(_DATA_TYPES[event[1]].name, "UTF-8"), event[4], 0]
+        elif kind == "data":
+            primitive[2] += event[1].count(B",") + 1
+        elif kind == "value":
+            primitive[2] += 1
+        elif kind == "vector":
+            primitive[2] += len(event[1])
+        else:
+            entry = statistics.setdefault(primitive[0], [0, 0, 0])
+            entry[0] += 1
+            entry[1] += event[1] - primitive[1]
+            entry[2] += primitive[2]
+
+    return statistics
+
+
+def main(argv=None):
+    """
+    Entry point of `python -m pyddl`.
+    :param argv: command line arguments, defaults to `sys.argv[1:]`
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m pyddl", description="Reformat and inspect OpenDDL files.")
+    parser.add_argument("command", choices=["minify", "pretty", "stats"],
+                        help="minify: remove whitespace and comments, pretty: layout like DdlTextWriter, "
+                             "stats: count structures and bytes per identifier")
+    parser.add_argument("input", nargs="?", default="-", help="file to read, \"-\" for stdin (default)")
+    parser.add_argument("-o", "--output", default="-", help="file to write, \"-\" for stdout (default)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    target = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        if args.command == "minify":
+            minify_stream(source, target)
+        elif args.command == "pretty":
+            prettify_stream(source, target)
+        else:
+            statistics = stream_statistics(source)
+            lines = [B"%-32s %12s %16s %14s" % (B"identifier", B"count", B"bytes", B"values")]
+            for identifier, entry in sorted(statistics.items(), key=lambda item: -item[1][1]):
+                lines.append(B"%-32s %12d %16d %14s" % (identifier, entry[0], entry[1],
+                                                         str(entry[2]).encode() if len(entry) > 2 else B""))
+            target.write(B"\n".join(lines) + B"\n")
+    except DdlParseError as e:
+        print("error: {}".format(e), file=sys.stderr)
+        return 1
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if target is not sys.stdout.buffer:
+            target.close()
+        else:
+            target.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
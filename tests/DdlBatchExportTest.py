@@ -0,0 +1,92 @@
+import concurrent.futures.process
+import functools
+import os
+import shutil
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+def create_document(i):
+    document = DdlDocument()
+    document.add_structure(B"Node", bytes("node" + str(i), "UTF-8"), props={B"index": i}) \
+        .add_structure(B"Transform").add_primitive(DataType.float, [(1.0, 0.0), (0.0, float(i))], vector_size=2)
+    return document
+
+
+class DdlBatchExportTest(unittest.TestCase):
+
+    directory = "test_batch_export"
+
+    def setUp(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, i):
+        return os.path.join(self.directory, "{}.ddl".format(i))
+
+    def assertExported(self, indices, writer_class=DdlTextWriter):
+        for i in indices:
+            with open(self.path(i), "rb") as file:
+                self.assertEqual(writer_class(create_document(i)).structure_as_text(create_document(i).structures[0]),
+                                 file.read())
+
+    def test_export(self):
+        jobs = [DdlExportJob(create_document(i), self.path(i)) for i in range(10)] + \
+               [DdlExportJob(functools.partial(create_document, i), self.path(i), DdlCompressedTextWriter,
+                             {"rounding": 2}) for i in range(10, 20)]
+        calls = []
+
+        with DdlBatchExporter(processes=2, chunk_size=3, max_in_flight=2) as exporter:
+            self.assertEqual(20, exporter.export(jobs, progress=lambda done, total: calls.append((done, total))))
+            # the workers are reused, and generators are accepted as well
+            self.assertEqual(5, exporter.export((create_document(i), self.path(i)) for i in range(20, 25)))
+
+        self.assertExported(range(10))
+        self.assertExported(range(20, 25))
+        with open(self.path(10), "rb") as file:
+            self.assertEqual(B"Node$node10(index=10){Transform{float[2]{{1.0,0.0},{0.0,10.0}}}}", file.read())
+        self.assertEqual((20, 20), calls[-1])
+        self.assertEqual(sorted(calls), calls)
+
+    def test_errors(self):
+        jobs = [(create_document(i), self.path(i) if i % 3 else os.path.join(self.directory, "missing", "x.ddl"))
+                for i in range(7)]
+
+        for processes in [0, 2]:
+            with DdlBatchExporter(processes=processes, chunk_size=2) as exporter:
+                with self.assertRaises(DdlExportError) as context:
+                    exporter.export(jobs)
+            self.assertEqual([0, 3, 6], [failure.index for failure in context.exception.failures])
+            self.assertIn("FileNotFoundError", context.exception.failures[0].error)
+            self.assertExported([1, 2, 4, 5])
+
+
+    def test_broken_pool(self):
+        with DdlBatchExporter(processes=2, chunk_size=1) as exporter:
+            # a worker exits while creating the document
+            jobs = [(create_document(0), self.path(0)), (functools.partial(os._exit, 1), self.path(1))]
+            with self.assertRaises(concurrent.futures.process.BrokenProcessPool):
+                exporter.export(jobs)
+
+            # the exporter starts new workers
+            self.assertEqual(3, exporter.export((create_document(i), self.path(i)) for i in range(2, 5)))
+        self.assertExported(range(2, 5))
+
+    def test_progress_error(self):
+        def progress(done, total):
+            raise KeyboardInterrupt()
+
+        with DdlBatchExporter(processes=2, chunk_size=1, max_in_flight=2) as exporter:
+            with self.assertRaises(KeyboardInterrupt):
+                exporter.export([(create_document(i), self.path(i)) for i in range(10)], progress)
+            self.assertEqual(2, exporter.export([(create_document(i), self.path(i)) for i in range(2)]))
+        self.assertExported(range(2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import array
+import copy
+import gc
+import pickle
+import unittest
+import weakref
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlContentHashTest(unittest.TestCase):
+
+    @staticmethod
+    def create_document():
+        document = DdlDocument()
+        for i in range(10):
+            node = document.add_structure(B"Node", bytes("node" + str(i), "UTF-8"), props={B"visible": True})
+            node.add_structure(B"Transform", children=[DdlPrimitive(DataType.float, [(1.0, 0.0), (0.0, 1.0)],
+                                                                    vector_size=2)])
+            node.add_structure(B"Mesh").add_primitive(DataType.int32, list(range(i)))
+        return document
+
+    def test_equal_documents(self):
+        a = self.create_document()
+        b = self.create_document()
+
+        self.assertEqual(a.content_hash(), b.content_hash())
+        self.assertEqual(a.structures[3].content_hash(), b.structures[3].content_hash())
+        self.assertNotEqual(a.structures[3].content_hash(), a.structures[4].content_hash())
+        self.assertEqual([], a.diff(b))
+
+    def test_typed_data(self):
+        values = array.array("f", range(1000))
+        hashed = DdlPrimitive(DataType.float, values).content_hash()
+
+        # typed buffers are hashed by format, shape and bytes
+        self.assertEqual(hashed, DdlPrimitive(DataType.float, memoryview(values)).content_hash())
+        self.assertNotEqual(hashed, DdlPrimitive(DataType.float, array.array("d", range(1000))).content_hash())
+        self.assertNotEqual(hashed, DdlPrimitive(DataType.float, values[:-1]).content_hash())
+        values[999] = 0.0
+        self.assertNotEqual(hashed, DdlPrimitive(DataType.float, values).content_hash())
+
+    def test_invalidation(self):
+        document = self.create_document()
+        before = document.content_hash()
+        transform = document.structures[5].children[0]
+
+        transform.children[0].data = [(2.0, 0.0), (0.0, 1.0)]
+        changed = document.content_hash()
+        self.assertNotEqual(before, changed)
+
+        transform.children[0].data[0] = (1.0, 0.0)
+        self.assertEqual(changed, document.content_hash())  # in place modification is not noticed...
+        transform.children[0].invalidate_hash()
+        self.assertEqual(before, document.content_hash())  # ...until explicitly invalidated
+
+        document.structures[2].properties[B"visible"] = False
+        self.assertNotEqual(before, document.content_hash())
+        del document.structures[2].properties[B"visible"]
+        document.structures[2].properties[B"visible"] = True
+        self.assertEqual(before, document.content_hash())
+
+        DdlTextWriter.set_comment(document.structures[0], B"comment")
+        self.assertNotEqual(before, document.content_hash())
+
+    def test_diff(self):
+        old = self.create_document()
+        new = self.create_document()
+
+        new.structures[4].children[1].children[0].data = [7]
+        del new.structures[6]
+        new.structures.append(DdlStructure(B"Light"))
+
+        differences = old.diff(new)
+        self.assertEqual(3, len(differences))
+
+        changed = [d for d in differences if d.old is not None and d.new is not None]
+        self.assertEqual(1, len(changed))
+        self.assertEqual((4, 1, 0), changed[0].old_path)
+        self.assertEqual([7], changed[0].new.data)
+
+        self.assertIn(DdlDifference((6,), None, old.structures[6], None), differences)
+        self.assertIn(DdlDifference(None, (9,), None, new.structures[9]), differences)
+
+    def test_pickle(self):
+        document = self.create_document()
+        copy = pickle.loads(pickle.dumps(document))
+
+        self.assertEqual(document.content_hash(), copy.content_hash())
+        copy.structures[0].children.pop()
+        self.assertNotEqual(document.content_hash(), copy.content_hash())
+
+    def test_copy(self):
+        for copy_function in [copy.copy, copy.deepcopy]:
+            document = self.create_document()
+            hashed = document.content_hash()
+            copied = copy_function(document)
+            self.assertIsNot(document.structures, copied.structures)
+            self.assertEqual(hashed, copied.content_hash())
+
+            # changes to the original's own containers invalidate the original only
+            document.structures.pop()
+            self.assertNotEqual(hashed, document.content_hash())
+            self.assertEqual(hashed, copied.content_hash())
+            self.assertEqual(10, len(copied.structures))
+
+            structure = copied.structures[0]
+            copied_structure = copy_function(structure)
+            self.assertIsNot(structure.children, copied_structure.children)
+            self.assertIsNot(structure.properties, copied_structure.properties)
+            copied_structure.children.pop()
+            copied_structure.properties[B"visible"] = False
+            self.assertEqual(2, len(structure.children))
+            self.assertEqual(True, structure.properties[B"visible"])
+            self.assertEqual(hashed, copied.content_hash())
+
+            # a shallow copy shares the children, changing one invalidates both documents
+            copied = copy_function(document)
+            hashed = document.content_hash()
+            document.structures[0].children[0].children[0].data = [(0.0, 1.0), (1.0, 0.0)]
+            self.assertNotEqual(hashed, document.content_hash())
+            self.assertEqual(copy_function is copy.copy, hashed != copied.content_hash())
+
+    def test_free(self):
+        # parent links are weak, documents are freed without the garbage collector, hashed or not
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for hashed in [False, True]:
+                document = self.create_document()
+                if hashed:
+                    document.content_hash()
+                references = [weakref.ref(document), weakref.ref(document.structures[0]),
+                              weakref.ref(document.structures[0].children[0])]
+                del document
+                self.assertEqual([None] * 3, [reference() for reference in references])
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        # removed children do not keep their old parent alive and do not invalidate it anymore
+        document = self.create_document()
+        document.content_hash()
+        mesh = document.structures[3].children.pop()
+        hashed = document.content_hash()
+        mesh.children[0].data = [1]
+        self.assertEqual(hashed, document.content_hash())
+        del document
+        mesh.children[0].data = [2]
+        self.assertIsNotNone(mesh.content_hash())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import pickle
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlFragmentTest(unittest.TestCase):
+
+    def tearDown(self):
+        for filename in ["test_fragment.ddl", "test_fragment.snapshot"]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def create_geometry(i):
+        geometry = DdlStructure(B"GeometryObject", bytes("geometry" + str(i), "UTF-8"))
+        mesh = geometry.add_structure(B"Mesh", props={B"primitive": "triangles"})
+        DdlTextWriter.set_comment(mesh, B"mesh")
+        mesh.add_structure(B"VertexArray", props={B"attrib": "position"}).add_primitive(
+            DataType.float, [(float(i), 1.0, 2.0)] * 20, vector_size=3)
+        mesh.add_structure(B"IndexArray").add_primitive(DataType.unsigned_int32, list(range(30)))
+        return geometry
+
+    @classmethod
+    def create_document(cls, fragments):
+        document = DdlDocument()
+        document.add_structure(B"Metric", props={B"key": "distance"}, children=[DdlPrimitive(DataType.float, [1.0])])
+        for i in range(2):
+            geometries = [cls.create_geometry(i), cls.create_geometry(i + 10)]
+            if fragments:
+                geometries = [DdlFragment.from_structures(geometries)]
+            document.structures.extend(geometries)
+            document.add_structure(B"Group", children=geometries + [DdlStructure(B"Name", children=[
+                DdlPrimitive(DataType.string, ["group"])])])
+        return document
+
+    def written(self, writer_class, document):
+        writer_class(document).write("test_fragment.ddl")
+        with open("test_fragment.ddl", "rb") as file:
+            return file.read()
+
+    def test_write(self):
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            expected = self.written(writer_class, self.create_document(False))
+            self.assertEqual(expected, self.written(writer_class, self.create_document(True)))
+
+    def test_text_only(self):
+        document = DdlDocument()
+        document.add_structure(B"Group", children=[DdlFragment(B"Node\n{\n\tName {string {\"a\"}}\n}\n\nNode {}")])
+
+        self.assertEqual(B"Group\n{\n\tNode\n\t{\n\t\tName {string {\"a\"}}\n\t}\n\n\tNode {}\n}\n",
+                         self.written(DdlTextWriter, document))
+        self.assertEqual(B"Group{Node\n{\n\tName {string {\"a\"}}\n}\n\nNode {}}",
+                         self.written(DdlCompressedTextWriter, document))
+
+        read = DdlTextReader().read("test_fragment.ddl")
+        self.assertEqual([B"Node", B"Node"], [s.identifier for s in read.structures[0].children])
+
+    def test_content_hash(self):
+        fragment = DdlFragment(B"Node {}")
+        document = DdlDocument()
+        document.add_structure(B"Group", children=[fragment])
+
+        before = document.content_hash()
+        self.assertEqual(before, self.create_fragment_document(B"Node {}").content_hash())
+        fragment.compressed = B"Node{}"
+        self.assertNotEqual(before, document.content_hash())
+
+        differences = document.diff(self.create_fragment_document(B"Node {}"))
+        self.assertEqual([(0, 0)], [d.old_path for d in differences])
+
+    @staticmethod
+    def create_fragment_document(text):
+        document = DdlDocument()
+        document.add_structure(B"Group", children=[DdlFragment(text)])
+        return document
+
+    def test_instance(self):
+        prototype = DdlStructure(B"Group", children=[DdlFragment(B"Node {}")])
+        document = DdlDocument()
+        document.structures.extend([prototype, prototype.instance(B"a"), prototype.instance(B"b")])
+        document.structures[2].children.append(DdlStructure(B"Light"))
+
+        self.assertIs(prototype.children[0], document.structures[2].children[0])
+        self.assertEqual(B"Group{Node {}}Group$a{Node {}}Group$b{Node {}Light{}}",
+                         self.written(DdlCompressedTextWriter, document))
+
+    def test_snapshot_and_pickle(self):
+        document = self.create_document(True)
+        save_snapshot(document, "test_fragment.snapshot")
+        for copy in [load_snapshot("test_fragment.snapshot"), pickle.loads(pickle.dumps(document))]:
+            self.assertEqual(document.content_hash(), copy.content_hash())
+            for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+                self.assertEqual(self.written(writer_class, document), self.written(writer_class, copy))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlIndexTest(unittest.TestCase):
+
+    def tearDown(self):
+        for filename in ["test_index.ddl", "test_index.ddl.index"]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def create_document():
+        document = DdlDocument()
+        document.add_structure(B"Metric", B"metric", props={B"key": "distance"},
+                               children=[DdlPrimitive(DataType.float, [1.0])])
+        for i in range(3):
+            node = document.add_structure(B"GeometryNode", bytes("node" + str(i), "UTF-8"))
+            DdlTextWriter.set_comment(node, B"node")
+            node.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["node" + str(i)])])
+            mesh = node.add_structure(B"Mesh", bytes("mesh" + str(i), "UTF-8"), props={B"lod": i})
+            mesh.add_structure(B"VertexArray").add_primitive(DataType.float, [(1.0, 2.0, 3.0)] * 10, vector_size=3)
+            local = node.add_structure(B"Material", B"material")
+            local.name_is_global = False
+            node.add_structure(B"ObjectRef", children=[DdlPrimitive(DataType.ref, [document.structures[0], local])])
+        return document
+
+    def test_index(self):
+        template = self.create_document().structures[1]
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            for index in ["footer", "sidecar"]:
+                document = self.create_document()
+                document.structures.append(template.instance(B"instance"))
+                writer_class(document, index=index).write("test_index.ddl")
+                self.assertEqual(index == "sidecar", os.path.exists("test_index.ddl.index"))
+
+                # the whole file can still be read, the footer is a comment
+                self.assertEqual(5, len(DdlTextReader().read("test_index.ddl").structures))
+
+                ddl_index = DdlIndex("test_index.ddl")
+                self.assertEqual([B"Metric", B"GeometryNode", B"GeometryNode", B"GeometryNode", B"GeometryNode"],
+                                 [entry.identifier for entry in ddl_index.top_level()])
+                self.assertEqual({B"metric", B"node0", B"node1", B"node2", B"mesh0", B"mesh1", B"mesh2", B"instance"},
+                                 set(ddl_index.names))
+
+                for name, expected in [(B"node2", document.structures[3]), (B"instance", document.structures[4])]:
+                    text = writer_class(document).structure_as_text(expected)
+                    self.assertEqual(text.rstrip(B"\n"), ddl_index.read_text(name))
+                    self.assertEqual(expected.identifier, ddl_index.read_structure(name).identifier)
+
+                # nested structures keep their indent, except on the first line
+                self.assertEqual(B"Mesh", ddl_index.read_text(B"mesh1")[:4])
+                self.assertEqual(B"}", ddl_index.read_text(B"mesh1")[-1:])
+                self.assertEqual({B"lod": 1}, ddl_index.read_structure(B"mesh1").properties)
+                self.assertEqual(document.structures[0].content_hash(),
+                                 ddl_index.read_structure(ddl_index.top_level()[0]).content_hash())
+
+                # references to structures outside of the read one are kept
+                ref = ddl_index.read_structure(B"node0").children[3].children[0].data
+                self.assertIsInstance(ref[0], DdlReference)
+                self.assertEqual(B"$metric", ref[0])
+                self.tearDown()
+
+    def test_no_index(self):
+        DdlTextWriter(self.create_document(), index="sidecar").write("test_index.ddl")
+        DdlTextWriter(self.create_document()).write("test_index.ddl")
+        os.remove("test_index.ddl.index")
+        self.assertRaises(ValueError, DdlIndex, "test_index.ddl")
+
+        DdlTextWriter(self.create_document(), index="sidecar").write("test_index.ddl")
+        with open("test_index.ddl", "ab") as file:
+            file.write(B"Extra {}\n")
+        self.assertRaises(ValueError, DdlIndex, "test_index.ddl")
+
+        self.assertRaises(ValueError, DdlTextWriter, DdlDocument(), index="trailer")
+
+
+if __name__ == "__main__":
+    unittest.main()
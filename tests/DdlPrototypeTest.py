@@ -0,0 +1,175 @@
+import gc
+import os
+import pickle
+import unittest
+import weakref
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlPrototypeTest(unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            os.remove("test_prototype.bin")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def create_light(name=None, intensity=1.0):
+        light = DdlStructure(B"LightObject", name, props={B"type": "point"})
+        light.add_structure(B"Color", props={B"attrib": "light"}, children=[
+            DdlPrimitive(DataType.float, [(1.0, 0.5, 0.25)], vector_size=3)])
+        light.add_structure(B"Param", props={B"attrib": "intensity"}, children=[
+            DdlPrimitive(DataType.float, [intensity])])
+        light.add_structure(B"Transform", children=[
+            DdlPrimitive(DataType.float, [tuple(float(i == j) for i in range(4) for j in range(4))], vector_size=16)])
+        return light
+
+    def create_documents(self):
+        """
+        :return: a document with instances of a prototype and the same document built from copies
+        """
+        instances, copies = DdlDocument(), DdlDocument()
+        template = self.create_light(B"template")
+        instances.structures.append(template)
+        copies.structures.append(self.create_light(B"template"))
+        for i in range(3):
+            name = bytes("light" + str(i), "UTF-8")
+            instances.structures.append(template.instance(name))
+            copies.structures.append(self.create_light(name))
+        return instances, copies
+
+    def assertSameText(self, expected, actual):
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            self.assertEqual([writer_class(expected).structure_as_text(s) for s in expected.structures],
+                             [writer_class(actual).structure_as_text(s) for s in actual.structures])
+
+    def test_shared(self):
+        instances, copies = self.create_documents()
+        instance = instances.structures[1]
+
+        self.assertNotIn("children", instance.__dict__)
+        self.assertNotIn("properties", instance.__dict__)
+        self.assertFalse(instance.is_simple_structure())
+        self.assertEqual(copies.structures[1].content_hash(), instance.content_hash())
+        self.assertSameText(copies, instances)
+        # writing does not copy anything
+        self.assertNotIn("children", instance.__dict__)
+
+        # only instances look up missing attributes in their prototype
+        self.assertIsInstance(instance, DdlStructure)
+        self.assertIsInstance(instance.children[0].children[0], DdlPrimitive)
+        self.assertFalse(hasattr(instances.structures[0], "comment"))
+        template = instances.structures[0]
+        template.comment = B"template"
+        self.assertEqual(B"template", instance.comment)
+        self.assertFalse(hasattr(template.children[0], "comment"))
+
+    def test_copy_on_write(self):
+        instances, copies = self.create_documents()
+        template = instances.structures[0]
+
+        # modifying an instance copies what is needed, the prototype is unaffected
+        instance = instances.structures[2]
+        instance.children[1].children[0].data[0] = 2.0
+        instance.children[1].children[0].invalidate_hash()
+        copies.structures[2].children[1].children[0].data[0] = 2.0
+        self.assertEqual([1.0], template.children[1].children[0].data)
+        self.assertIsNot(template.children[0], instance.children[0])
+        self.assertNotIn("data", instance.children[0].children[0].__dict__)
+
+        instance.properties[B"type"] = "spot"
+        copies.structures[2].properties[B"type"] = "spot"
+        self.assertEqual("point", template.properties[B"type"])
+        self.assertSameText(copies, instances)
+
+        # modifying the prototype changes the instances which still share the modified parts
+        before = instances.structures[1].content_hash()
+        matrix = [tuple(map(float, range(16)))]
+        template.children[2].children[0].data = matrix
+        for structure in copies.structures:
+            structure.children[2].children[0].data = matrix
+        self.assertNotEqual(before, instances.structures[1].content_hash())
+        self.assertSameText(copies, instances)
+
+    def test_properties(self):
+        template = self.create_light()
+        instance = template.instance(props={B"type": "spot", B"shadow": True})
+
+        self.assertEqual({B"type": "spot", B"shadow": True}, instance.properties)
+        self.assertEqual({B"type": "point"}, template.properties)
+
+        # properties copied after hashing are still followed
+        instance = template.instance()
+        hashed = instance.content_hash()
+        instance.properties[B"type"] = "spot"
+        self.assertNotEqual(hashed, instance.content_hash())
+
+    def test_free(self):
+        template = self.create_light()
+        template.content_hash()
+
+        # prototypes only refer to their instances weakly
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for hashed in [False, True]:
+                instance = template.instance(B"light")
+                instance.children[0].properties[B"attrib"] = "diffuse"
+                if hashed:
+                    instance.content_hash()
+                references = [weakref.ref(instance), weakref.ref(instance.children[0])]
+                del instance
+                self.assertEqual([None, None], [reference() for reference in references])
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def test_pickle(self):
+        instances, copies = self.create_documents()
+        instances.structures[2].children[0].children.append(DdlPrimitive(DataType.int32, [1]))
+        copies.structures[2].children[0].children.append(DdlPrimitive(DataType.int32, [1]))
+
+        loaded = pickle.loads(pickle.dumps(instances))
+        self.assertSameText(copies, loaded)
+        self.assertEqual(instances.content_hash(), loaded.content_hash())
+
+    def test_snapshot(self):
+        instances, copies = self.create_documents()
+        instances.structures[2].children[0].children.append(DdlPrimitive(DataType.int32, [1]))
+        copies.structures[2].children[0].children.append(DdlPrimitive(DataType.int32, [1]))
+        instances.structures[3].properties[B"type"] = "spot"
+        copies.structures[3].properties[B"type"] = "spot"
+
+        save_snapshot(instances, "test_prototype.bin")
+        loaded = load_snapshot("test_prototype.bin")
+        self.assertSameText(copies, loaded)
+        self.assertEqual(instances.content_hash(), loaded.content_hash())
+
+        # instances still share with their prototype, only what they copied before is their own
+        template, instance = loaded.structures[0], loaded.structures[1]
+        self.assertNotIn("children", instance.__dict__)
+        self.assertNotIn("properties", instance.__dict__)
+        self.assertNotIn("children", loaded.structures[3].__dict__)
+        self.assertIn("children", loaded.structures[2].__dict__)
+        self.assertNotIn("data", loaded.structures[2].children[1].children[0].__dict__)
+
+        # and are copied on write
+        instance.children[1].children[0].data = [2.0]
+        copies.structures[1].children[1].children[0].data = [2.0]
+        self.assertIsNot(template.children[1], instance.children[1])
+        self.assertEqual([1.0], template.children[1].children[0].data)
+        self.assertSameText(copies, loaded)
+
+        # changes of the prototype still reach the instances which share them
+        hashed = loaded.structures[3].content_hash()
+        template.children[2].children[0].data = [tuple(map(float, range(16)))]
+        self.assertNotEqual(hashed, loaded.structures[3].content_hash())
+
+
+if __name__ == "__main__":
+    unittest.main()
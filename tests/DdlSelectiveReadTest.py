@@ -0,0 +1,90 @@
+import os
+import unittest
+
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlSelectiveReadTest(unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            os.remove("test_selective.ddl")
+        except FileNotFoundError:
+            pass
+
+    TEXT = B"""
+        Metric (key = "distance") {float {1.0}}
+        GeometryNode $node1 {
+            Name {string {"node1"}}
+            Mesh $mesh1 (lod = 0) {
+                VertexArray (attrib = "position") {
+                    float[3] {{1.0, 2.0, 3.0}, {4.0, 5.0, 6.0}}
+                }
+                IndexArray {unsigned_int32[2] {{0, 1}}}
+            }
+            ObjectRef {ref {$material1}}
+        }
+        Material $material1 {
+            // a comment with braces: {{ }
+            Texture {string {"texture {with} \\"braces\\" }}"}}
+            Color {float[3] $c {}}
+            /* { } */
+            Param {unsigned_int8 {'}'}}
+        }
+        Material $material2 (ref = $node1) {}
+        """
+
+    def test_exclude(self):
+        document = DdlTextReader(exclude=[B"VertexArray", "Material"]).read_bytes(self.TEXT)
+
+        self.assertEqual([B"Metric", B"GeometryNode"], [s.identifier for s in document.structures])
+        mesh = document.structures[1].children[1]
+        self.assertEqual([B"IndexArray"], [s.identifier for s in mesh.children])
+        self.assertEqual([(0, 1)], mesh.children[0].children[0].data)
+
+        # references to skipped structures are not resolved
+        reference = document.structures[1].children[2].children[0].data[0]
+        self.assertIsInstance(reference, DdlReference)
+        self.assertEqual(B"$material1", reference)
+
+    def test_include(self):
+        document = DdlTextReader(include=[B"Material", B"Texture", B"Color"]).read_bytes(self.TEXT)
+
+        self.assertEqual([B"material1", B"material2"], [s.name for s in document.structures])
+        self.assertEqual([B"Texture", B"Color"], [s.identifier for s in document.structures[0].children])
+        self.assertEqual(["texture {with} \"braces\" }}"], document.structures[0].children[0].children[0].data)
+        self.assertEqual(B"$node1", document.structures[1].properties[B"ref"])
+
+    def test_predicate(self):
+        reader = DdlTextReader(predicate=lambda structure: structure.properties.get(B"lod", 0) == 0 and
+                               structure.name != B"material1")
+        document = reader.read_bytes(self.TEXT)
+
+        self.assertEqual([B"Metric", B"GeometryNode", B"Material"], [s.identifier for s in document.structures])
+        self.assertIs(document.structures[1], document.structures[2].properties[B"ref"])
+        self.assertEqual(3, len(document.structures[1].children))
+
+        reader = DdlTextReader(predicate=lambda structure: structure.properties.get(B"lod", 1) != 0)
+        document = reader.read_bytes(self.TEXT)
+        self.assertEqual([B"Name", B"ObjectRef"], [s.identifier for s in document.structures[1].children])
+        self.assertIs(document.structures[2], document.structures[1].children[1].children[0].data[0])
+
+    def test_unterminated(self):
+        for text in [B"Node {Skipped {float {1.0}", B"Node {Skipped {string {\"}}}\"}}", B"Skipped {/* }}"]:
+            with self.assertRaises(DdlParseError):
+                DdlTextReader(exclude=[B"Skipped"]).read_bytes(text)
+
+    def test_written(self):
+        reader = DdlTextReader(predicate=lambda structure: B"ref" not in structure.properties)
+        document = reader.read_bytes(self.TEXT)
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            writer_class(document).write("test_selective.ddl")
+            skipped = DdlTextReader(exclude=[B"Mesh"]).read("test_selective.ddl")
+            self.assertEqual([B"Name", B"ObjectRef"], [s.identifier for s in skipped.structures[1].children])
+            self.assertEqual(len(document.structures), len(skipped.structures))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import array
+import copy
+import os
+import pickle
+import shutil
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = "Jonathan Hale"
+
+
+class DdlSnapshotTest(unittest.TestCase):
+
+    def tearDown(self):
+        for filename in ["test_snapshot.bin", "test_snapshot.ddl"]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+        shutil.rmtree("test_snapshot_cache", ignore_errors=True)
+
+    def assertSameDocument(self, expected, actual):
+        self.assertEqual(expected.content_hash(), actual.content_hash())
+        self.assertEqual(DdlTextWriter(expected).structure_as_text(expected.structures[0]),
+                         DdlTextWriter(actual).structure_as_text(actual.structures[0]))
+
+    @staticmethod
+    def create_document():
+        document = DdlDocument()
+        human = document.add_structure(B"Human", B"human1", props={B"Weird": True, B"Funny": 12, B"Big": 1 << 70,
+                                                                  B"Type": DataType.half, B"Title": "Sir"})
+        DdlTextWriter.set_comment(human, B"not an alien")
+        human.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["Peter", "Parker"])])
+        positions = DdlPrimitive(DataType.float, [(1.0, 2.5), (3.0, 4.0)], B"positions", 2)
+        positions.name_is_global = False
+        DdlTextWriter.set_max_elements_per_line(positions, 1)
+        human.add_structure(B"Mesh", children=[positions,
+                                               DdlPrimitive(DataType.int64, [1 << 40, -3]),
+                                               DdlPrimitive(DataType.int8, [1 << 70]),
+                                               DdlPrimitive(DataType.unsigned_int16, array.array("H", [1, 2, 3, 4]),
+                                                            vector_size=2),
+                                               DdlPrimitive(DataType.type, [DataType.float])])
+        human.add_structure(B"Friends", props={B"Best": human},
+                            children=[DdlPrimitive(DataType.ref, [human, positions, None, DdlReference(B"$other")])])
+        return document
+
+    def test_round_trip(self):
+        document = self.create_document()
+        save_snapshot(document, "test_snapshot.bin")
+
+        for copy in [False, True]:
+            loaded = load_snapshot("test_snapshot.bin", copy=copy)
+            self.assertSameDocument(document, loaded)
+
+            human = loaded.structures[0]
+            self.assertIs(human, human.children[2].properties[B"Best"])
+            self.assertIs(human.children[1].children[0], human.children[2].children[0].data[1])
+            # loaded documents are invalidated by changes like any other
+            hashed = loaded.content_hash()
+            human.children[0].children[0].data = ["Bruce"]
+            self.assertNotEqual(hashed, loaded.content_hash())
+            self.assertEqual([(1.0, 2.5), (3.0, 4.0)], human.children[1].children[0].data)
+            self.assertEqual([1, 2, 3, 4], list(human.children[1].children[3].data))
+
+            # typed data is a view into the snapshot, which is only writable if it was copied into memory
+            data = human.children[1].children[3].data
+            if copy:
+                data[0] = 5
+                self.assertEqual(5, data[0])
+            else:
+                self.assertRaises(TypeError, data.__setitem__, 0, 5)
+            del data, human, loaded
+
+    def test_reader(self):
+        for typed_arrays in [None, "array"]:
+            document = DdlTextReader(typed_arrays=typed_arrays).read("expected.ddl")
+            save_snapshot(document, "test_snapshot.bin")
+            self.assertSameDocument(document, load_snapshot("test_snapshot.bin"))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        document = DdlTextReader(typed_arrays="numpy").read("expected.ddl")
+        vertices = numpy.arange(12, dtype=numpy.float32).reshape(-1, 3)
+        document.add_structure(B"VertexArray").add_primitive(DataType.float, vertices, vector_size=3)
+        document.add_structure(B"Half").add_primitive(DataType.half, numpy.array([0.5, 2.0], numpy.float16))
+        save_snapshot(document, "test_snapshot.bin")
+
+        for copy in [False, True]:
+            loaded = load_snapshot("test_snapshot.bin", copy=copy)
+            self.assertSameDocument(document, loaded)
+            data = loaded.structures[-2].children[0].data
+            self.assertIsInstance(data, numpy.ndarray)
+            self.assertEqual((4, 3), data.shape)
+            self.assertEqual(vertices.tolist(), data.tolist())
+            self.assertEqual(numpy.float16, loaded.structures[-1].children[0].data.dtype)
+            self.assertEqual(copy, data.flags.writeable)
+            del data, loaded
+
+    def test_pickle(self):
+        document = self.create_document()
+        save_snapshot(document, "test_snapshot.bin")
+        loaded = load_snapshot("test_snapshot.bin")
+
+        # the views into the file are pickled as copies
+        for copied in [pickle.loads(pickle.dumps(loaded)), copy.deepcopy(loaded)]:
+            self.assertSameDocument(document, copied)
+            data = copied.structures[0].children[1].children[3].data
+            self.assertIsInstance(data, array.array)
+            self.assertEqual([1, 2, 3, 4], data.tolist())
+
+    def test_invalid(self):
+        with open("test_snapshot.bin", "wb") as file:
+            file.write(B"Human {}")
+        self.assertRaises(ValueError, load_snapshot, "test_snapshot.bin")
+
+    def test_cache(self):
+        shutil.copy("expected.ddl", "test_snapshot.ddl")
+        cache = DdlSnapshotCache("test_snapshot_cache")
+
+        document = cache.load("test_snapshot.ddl")
+        self.assertTrue(os.path.exists(cache.snapshot_path("test_snapshot.ddl")))
+        self.assertSameDocument(document, cache.load("test_snapshot.ddl"))
+
+        # the data is of the same kind whether the snapshot was written or used
+        def values(document):
+            return document.structures[1].children[0].children[0].data
+
+        for copy in [False, True]:
+            os.remove(cache.snapshot_path("test_snapshot.ddl"))
+            for data in [values(cache.load("test_snapshot.ddl", copy)) for i in range(2)]:
+                self.assertIsInstance(data, memoryview)
+                self.assertEqual(copy, not data.readonly)
+            del data
+
+        # touched, but with the same content: the snapshot is still used
+        stat = os.stat("test_snapshot.ddl")
+        os.utime("test_snapshot.ddl", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        inode = os.stat(cache.snapshot_path("test_snapshot.ddl")).st_ino
+        self.assertSameDocument(document, cache.load("test_snapshot.ddl"))
+        self.assertEqual(inode, os.stat(cache.snapshot_path("test_snapshot.ddl")).st_ino)
+
+        # modified: the text is read again
+        with open("test_snapshot.ddl", "ab") as file:
+            file.write(B"Extra {}\n")
+        self.assertEqual(B"Extra", cache.load("test_snapshot.ddl").structures[-1].identifier)
+        self.assertEqual(B"Extra", cache.load("test_snapshot.ddl").structures[-1].identifier)
+
+
+    def test_read_only_cache(self):
+        shutil.copy("expected.ddl", "test_snapshot.ddl")
+        cache = DdlSnapshotCache("test_snapshot_cache")
+        document = cache.load("test_snapshot.ddl")
+        path = cache.snapshot_path("test_snapshot.ddl")
+        os.chmod(path, 0o444)
+        os.chmod("test_snapshot_cache", 0o555)
+        try:
+            if os.access(path, os.W_OK):
+                self.skipTest("files are writable regardless of their permissions")
+
+            # the snapshot is used, even if the text file was touched and the snapshot cannot be updated
+            inode = os.stat(path).st_ino
+            stat = os.stat("test_snapshot.ddl")
+            os.utime("test_snapshot.ddl", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            for i in range(2):
+                self.assertSameDocument(document, cache.load("test_snapshot.ddl"))
+            self.assertEqual(inode, os.stat(path).st_ino)
+        finally:
+            os.chmod("test_snapshot_cache", 0o755)
+
+if __name__ == "__main__":
+    unittest.main()
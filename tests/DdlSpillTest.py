@@ -0,0 +1,141 @@
+import array
+import gc
+import os
+import pickle
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = "Jonathan Hale"
+
+
+class DdlSpillTest(unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            os.remove("test_spill.ddl")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def create_document(count=3, values=70000):
+        document = DdlDocument()
+        for i in range(count):
+            mesh = document.add_structure(B"Mesh", bytes("mesh" + str(i), "UTF-8"))
+            mesh.add_structure(B"VertexArray").add_primitive(
+                DataType.float, [(j * 0.5, float(i), -1.0) for j in range(values // 3)], vector_size=3)
+            indices = DdlPrimitive(DataType.unsigned_int32, list(range(values)))
+            DdlTextWriter.set_max_elements_per_line(indices, 10)
+            mesh.add_structure(B"IndexArray", children=[indices])
+            mesh.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["mesh"])])
+        return document
+
+    def written(self, writer_class, document):
+        writer_class(document).write("test_spill.ddl")
+        with open("test_spill.ddl", "rb") as file:
+            return file.read()
+
+    def test_budget(self):
+        expected = self.create_document()
+        with DdlSpillStore(budget=4 << 20, threshold=1 << 20) as store:
+            document = self.create_document()
+
+        data = [s.children[0].children[0].data for s in document.structures]
+        self.assertFalse(any(isinstance(d, list) for d in data[:-1]))
+        self.assertLessEqual(store.resident, store.budget)
+        self.assertGreater(store.spilled, 0)
+
+        # lists of vectors stay sequences of tuples
+        vertices = data[0]
+        self.assertEqual(70000 // 3, len(vertices))
+        self.assertEqual((1.0, 0.0, -1.0), vertices[2])
+        self.assertEqual((11666.0, 0.0, -1.0), vertices[-1])
+        self.assertEqual([(0.5, 0.0, -1.0), (1.0, 0.0, -1.0)], vertices[1:3])
+        self.assertEqual(expected.structures[0].children[0].children[0].data, list(vertices))
+        with self.assertRaises(IndexError):
+            vertices[70000 // 3]
+        with self.assertRaises(TypeError):
+            vertices[0] = (0.0, 0.0, 0.0)
+        primitive = document.structures[0].children[0].children[0]
+        self.assertEqual(list(vertices), primitive.instance().data)
+        self.assertEqual(list(vertices), pickle.loads(pickle.dumps(primitive)).data)
+
+        # typed data is hashed as raw bytes, the hash of spilled data is kept
+        hashed = document.content_hash()
+        document.structures[0].children[0].children[0].invalidate_hash()
+        self.assertEqual(hashed, document.content_hash())
+        hashed = expected.content_hash()
+        self.assertTrue(DdlSpillStore().spill(expected.structures[0].children[0].children[0]))
+        self.assertEqual(hashed, expected.content_hash())
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            self.assertEqual(self.written(writer_class, expected), self.written(writer_class, document))
+
+        # new primitives are not tracked anymore
+        primitive = DdlPrimitive(DataType.float, [0.0] * 100000)
+        self.assertIsInstance(primitive.data, list)
+
+    def test_track(self):
+        store = DdlSpillStore(budget=1 << 16, threshold=1 << 10)
+        primitive = DdlPrimitive(DataType.int32, array.array("i", range(1000)))
+        small = DdlPrimitive(DataType.int32, [1, 2, 3])
+        large = DdlPrimitive(DataType.unsigned_int64, [(1 << 64) - 1] * 1000)
+        strings = DdlPrimitive(DataType.string, ["a"] * 1000)
+        document = DdlDocument()
+        document.add_structure(B"Node", children=[primitive, small, large, strings])
+
+        store.track_all(document)
+        self.assertEqual(4000 + 32000, store.resident)
+        self.assertTrue(store.spill(primitive))
+        self.assertFalse(store.spill(strings))
+        self.assertEqual(list(range(1000)), primitive.data.tolist())
+        self.assertIsInstance(small.data, list)
+        self.assertEqual(32000, store.resident)
+
+        # data of primitives which are no longer referenced is not counted
+        document.structures[0].children.remove(large)
+        del large
+        gc.collect()
+        self.assertEqual(0, store.resident)
+
+        with store:
+            primitive.data = list(range(10000))
+            large = DdlPrimitive(DataType.unsigned_int64, [(1 << 64) - 1] * 10000)
+        self.assertIsInstance(primitive.data, memoryview)
+        self.assertTrue(primitive.data.readonly)
+        self.assertIsInstance(large.data, list)
+        self.assertEqual(0, store.resident)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        vertices = DdlPrimitive(DataType.float, numpy.arange(30000, dtype=numpy.float32).reshape(-1, 3),
+                                vector_size=3)
+        indices = DdlPrimitive(DataType.unsigned_int16, numpy.arange(10000, dtype=numpy.uint16))
+        document = DdlDocument()
+        document.add_structure(B"Mesh", children=[vertices, indices])
+        hashed = document.content_hash()
+        expected = [self.written(writer_class, document) for writer_class in [DdlTextWriter, DdlCompressedTextWriter]]
+
+        store = DdlSpillStore(budget=1 << 30, threshold=1 << 10)
+        self.assertTrue(store.spill(vertices))
+        self.assertTrue(store.spill(indices))
+        self.assertEqual(120000 + 20000, store.spilled)
+
+        # the arrays keep their type and shape, but are read-only views of the file
+        self.assertIsInstance(vertices.data, numpy.ndarray)
+        self.assertEqual((10000, 3), vertices.data.shape)
+        self.assertEqual(numpy.uint16, indices.data.dtype)
+        self.assertFalse(vertices.data.flags.owndata)
+        self.assertFalse(vertices.data.flags.writeable)
+        self.assertEqual(hashed, document.content_hash())
+        self.assertEqual(expected, [self.written(writer_class, document)
+                                    for writer_class in [DdlTextWriter, DdlCompressedTextWriter]])
+
+
+if __name__ == "__main__":
+    unittest.main()
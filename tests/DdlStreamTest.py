@@ -0,0 +1,97 @@
+import io
+import os
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlStreamTest(unittest.TestCase):
+
+    def readContents(self, filename):
+        """
+        Open, read the contents and then close a file.
+        :param filename: name of the file to read the contents of
+        :return: Contents of the file with given filename
+        """
+        file = open(filename, "rb")
+        contents = file.read()
+        file.close()
+
+        return contents
+
+    def tearDown(self):
+        for filename in ["test_stream.ddl", "test_stream_pretty.ddl"]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def create_document():
+        document = DdlDocument()
+        document.add_structure(B"Metric", props={B"key": "distance"}, children=[DdlPrimitive(DataType.float, [1.0])])
+        document.add_structure(B"Metric", props={B"key": "up"}, children=[DdlPrimitive(DataType.string, ["z"])])
+
+        node = document.add_structure(B"GeometryNode", B"node1", props={B"visible": True})
+        node.add_primitive(DataType.float, [], name=B"empty")
+        node.add_structure(B"Transform", children=[DdlPrimitive(DataType.float, [(1.0, 0.0, 0.0, 1.0)], None, 4)])
+        node.add_structure(B"VertexArray", children=[DdlPrimitive(DataType.float, [(1.0, 2.0), (3.0, 4.0)], None, 2)])
+        node.add_structure(B"ObjectRef", children=[DdlPrimitive(DataType.ref, [node, None])])
+        return document
+
+    def test_minify(self):
+        for chunk_size in [1, 5, 1 << 20]:
+            output = io.BytesIO()
+            with open("expected.ddl", "rb") as file:
+                minify_stream(file, output, chunk_size)
+            self.assertEqual(self.readContents("expected_compressed.ddl"), output.getvalue())
+
+    def test_prettify(self):
+        DdlTextWriter(self.create_document()).write("test_stream_pretty.ddl")
+        expected = self.readContents("test_stream_pretty.ddl")
+
+        for chunk_size in [1, 5, 1 << 20]:
+            compressed = io.BytesIO()
+            minify_stream(io.BytesIO(expected), compressed, chunk_size)
+            output = io.BytesIO()
+            prettify_stream(io.BytesIO(compressed.getvalue()), output, chunk_size)
+            self.assertEqual(expected, output.getvalue())
+
+    def test_statistics(self):
+        with open("expected.ddl", "rb") as file:
+            statistics = stream_statistics(file, chunk_size=7)
+
+        self.assertEqual([1, 135], statistics[B"Human"])
+        self.assertEqual([2, 1539, 99 + 99 * 2], statistics[B"int32"])
+        self.assertEqual(1, statistics[B"ref"][2])
+
+    def test_numeric_data(self):
+        text = B"A { int32 { 1, 2, /* three */ 3, 'c', 4 } float[2] { {1, 2}, // end\n {3, 4} } int8 [3] { } }"
+        for chunk_size in [1, 5, 1 << 20]:
+            output = io.BytesIO()
+            minify_stream(io.BytesIO(text), output, chunk_size)
+            self.assertEqual(B"A{int32{1,2,3,'c',4}float[2]{{1,2},{3,4}}int8[3]{}}", output.getvalue())
+
+    def test_errors(self):
+        for text in [B"A {", B"A }", B"A { float {1 2} }", B"A { \"", B"A { /* }"]:
+            self.assertRaises(DdlParseError, prettify_stream, io.BytesIO(text), io.BytesIO())
+
+        # vectors of the wrong size
+        for text in [B"A { float[2] {{1}, {2, 3, 4}} }", B"A { float[2] {{1, 2}, 3, {4}} }",
+                     B"A { float[2] {{1, 2}, {3 4}} }", B"A { float[2] {{1, 2}, {3,}} }"]:
+            for chunk_size in [1, 5, 1 << 20]:
+                self.assertRaises(DdlParseError, prettify_stream, io.BytesIO(text), io.BytesIO(), chunk_size)
+
+    def test_main(self):
+        self.assertEqual(0, main(["minify", "expected.ddl", "-o", "test_stream.ddl"]))
+        self.assertEqual(self.readContents("expected_compressed.ddl"), self.readContents("test_stream.ddl"))
+
+        self.assertEqual(0, main(["stats", "expected.ddl", "-o", "test_stream.ddl"]))
+        self.assertIn(B"AnVectorArray", self.readContents("test_stream.ddl"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import array
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = "Jonathan Hale"
+
+
+class DdlTextReaderTest(unittest.TestCase):
+
+    def readContents(self, filename):
+        """
+        Open, read the contents and then close a file.
+        :param filename: name of the file to read the contents of
+        :return: Contents of the file with given filename
+        """
+        file = open(filename, "rb")
+        contents = file.read()
+        file.close()
+
+        return contents
+
+    def test_empty(self):
+        document = DdlTextReader().read_bytes(B"// nothing to see here\n")
+        self.assertEqual([], document.structures)
+
+    def test_round_trip(self):
+        expected = self.readContents("expected_compressed.ddl")
+
+        for filename in ["expected.ddl", "expected_compressed.ddl"]:
+            for typed_arrays in [None, "array"]:
+                document = DdlTextReader(typed_arrays).read(filename)
+                writer = DdlCompressedTextWriter(document)
+                self.assertEqual(expected, B"".join(writer.structure_as_text(s) for s in document.structures))
+
+        # the reference in "Self" is resolved
+        human = document.structures[0]
+        self.assertIs(human, human.children[2].children[0].data[0])
+        self.assertEqual({B"Weird": True, B"Funny": 12}, human.properties)
+
+    def test_typed_arrays(self):
+        text = B"""
+            VertexArray { float[3] {{1.5, 0x3F800000, -2e1}, {0b0, 1_000, +.5}} }
+            IndexArray { unsigned_int16 {1, 0x10, 0o10, 0b10, 'a', 'ab'} }
+        """
+        document = DdlTextReader().read_bytes(text)
+        self.assertEqual([(1.5, 1.0, -20.0), (0.0, 1000.0, 0.5)], document.structures[0].children[0].data)
+        self.assertEqual([1, 16, 8, 2, 97, 24930], document.structures[1].children[0].data)
+
+        document = DdlTextReader(typed_arrays="array").read_bytes(text)
+        vertices = document.structures[0].children[0]
+        self.assertEqual(array.array("f", [1.5, 1.0, -20.0, 0.0, 1000.0, 0.5]), vertices.data)
+        self.assertEqual([(1.5, 1.0, -20.0), (0.0, 1000.0, 0.5)], vertices.elements())
+        self.assertEqual(array.array("H", [1, 16, 8, 2, 97, 24930]), document.structures[1].children[0].data)
+
+        self.assertRaises(DdlParseError, DdlTextReader("array").read_bytes, B"A { int8 {128} }")
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        text = B"""
+            VertexArray { float[3] {{1.5, 1, -2e1}, {0, 1000, +.5}} }
+            IndexArray { unsigned_int16 {1, 16, 8, 2, 97, 24930} }
+            Literals { int32 {0x10, 1_000, 'a'} }
+            Comment { double[2] {{1, 2}, /* two */ {3, 4}} }
+            Half { half {0.5, 2} }
+            Limits { int64 {9223372036854775807, -9223372036854775808} unsigned_int64 {18446744073709551615} }
+            Empty { int8 {} }
+        """
+        document = DdlTextReader(typed_arrays="numpy").read_bytes(text)
+        data = [[c.data for c in s.children] for s in document.structures]
+
+        self.assertEqual(numpy.float32, data[0][0].dtype)
+        self.assertEqual([[1.5, 1.0, -20.0], [0.0, 1000.0, 0.5]], data[0][0].tolist())
+        self.assertEqual(numpy.uint16, data[1][0].dtype)
+        self.assertEqual([1, 16, 8, 2, 97, 24930], data[1][0].tolist())
+        self.assertEqual([16, 1000, 97], data[2][0].tolist())
+        self.assertEqual([[1.0, 2.0], [3.0, 4.0]], data[3][0].tolist())
+        self.assertEqual(numpy.float16, data[4][0].dtype)
+        self.assertEqual([0.5, 2.0], data[4][0].tolist())
+        self.assertEqual([9223372036854775807, -9223372036854775808], data[5][0].tolist())
+        self.assertEqual(numpy.uint64, data[5][1].dtype)
+        self.assertEqual([18446744073709551615], data[5][1].tolist())
+        self.assertEqual((0,), data[6][0].shape)
+
+        for text in [B"A { int8 {128} }", B"A { unsigned_int8 {-1} }", B"A { int64 {9223372036854775808} }",
+                     B"A { unsigned_int64 {18446744073709551616} }", B"A { int32 {1.5} }", B"A { float {1.5x} }",
+                     B"A { float {1 2} }", B"A { float[2] {{1}, {2, 3, 4}} }"]:
+            self.assertRaises(DdlParseError, DdlTextReader("numpy").read_bytes, text)
+
+    def test_literals(self):
+        text = B"""
+            /* all kinds of data */
+            Node $node (id = "a" "b", type = float, count = 0x10, scale = 1.5e1, flag) {
+                string %names {"line\\n", "\\x41\\u00e9"}
+                ref {$node, %names, null}
+                type {float, i32}
+                bool {true, false}
+                Empty {}
+            }
+        """
+        document = DdlTextReader().read_bytes(text)
+        node = document.structures[0]
+
+        self.assertEqual({B"id": "ab", B"type": DataType.float, B"count": 16, B"scale": 15.0, B"flag": True},
+                         node.properties)
+        self.assertEqual(B"names", node.children[0].name)
+        self.assertFalse(node.children[0].name_is_global)
+        self.assertEqual(["line\n", "A\u00e9"], node.children[0].data)
+        self.assertEqual([node, DdlReference(B"%names"), None], node.children[1].data)
+        self.assertEqual([DataType.float, DataType.int32], node.children[2].data)
+        self.assertEqual([True, False], node.children[3].data)
+        self.assertEqual([], node.children[4].children)
+
+    def test_errors(self):
+        for text in [B"A {", B"A }", B"A { float {1, 2 3} }", B"A { float {1,, 2} }", B"A { int32[2] {{1, 2}, {3}} }",
+                     B"A { bool {1} }", B"A (x = ) {}", B"A { string {\"\\q\"} }", B"float {1}", B"A { # }"]:
+            self.assertRaises(DdlParseError, DdlTextReader().read_bytes, text)
+
+        # vectors of the wrong size, read in bulk or tokenized because of a comment
+        for text in [B"A { float[2] {{1}, {2, 3, 4}} }", B"A { float[2] {{1, 2}, 3, {4}} }",
+                     B"A { float[2] {{1, 2}, {3 4}} }", B"A { float[2] {{1, 2}, {3,}} }", B"A { float {, 1} }"]:
+            for typed_arrays in [None, "array"]:
+                self.assertRaises(DdlParseError, DdlTextReader(typed_arrays).read_bytes, text)
+                self.assertRaises(DdlParseError, DdlTextReader(typed_arrays).read_bytes,
+                                  text.replace(B", ", B", /* comment */ ", 1))
+
+        try:
+            DdlTextReader().read_bytes(B"A\n{\n\tint32 {1, 2 3}\n}")
+        except DdlParseError as e:
+            self.assertEqual(3, e.line)
+
+
+if __name__ == "__main__":
+    unittest.main()
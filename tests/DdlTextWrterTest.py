@@ -108,5 +108,83 @@ class DdlTextWriterTest(unittest.TestCase):
 
         self.assertFilesEqual("test_compressed.ddl", "expected_compressed.ddl")
 
+    def test_deep(self):
+        # create a hierarchy deeper than the recursion limit
+        document = DdlDocument()
+        node = document.add_structure(B"Node")
+        for i in range(5000):
+            node = node.add_structure(B"Node", children=[DdlPrimitive(DataType.int32, [i])])
+
+        text = DdlTextWriter(document).structure_as_text(document.structures[0])
+        self.assertTrue(text.startswith(B"Node\n{\n\tNode\n\t{\n\t\tint32 {0}\n\n\t\tNode\n"))
+        self.assertTrue(text.endswith(B"\t\t}\n\t}\n}\n"))
+        self.assertTrue(B"\n" + B"\t" * 5000 + B"Node {int32 {4999}}\n" in text)
+
+        text = DdlCompressedTextWriter(document).structure_as_text(document.structures[0])
+        self.assertTrue(text.startswith(B"Node{Node{int32{0}Node{int32{1}Node{"))
+        self.assertTrue(text.endswith(B"Node{int32{4999}}" + B"}" * 5000))
+
+    def test_compressed_values(self):
+        document = DdlDocument()
+        target = document.add_structure(B"Target", B"target")
+        document.add_structure(B"Node", props={B"target": target}, children=[
+            DdlPrimitive(DataType.int32, [1, 2, 3]), DdlPrimitive(DataType.ref, [target, None])])
+
+        text = DdlCompressedTextWriter(document).structure_as_text(document.structures[1])
+        self.assertEqual(B"Node(target=$target){int32{1,2,3}ref{$target,null}}", text)
+
+    def test_layout(self):
+        document = DdlDocument()
+        node = document.add_structure(B"Node", props={B"a": 1, B"b": "x"})
+        DdlTextWriter.set_comment(node, B"comment")
+        node.add_structure(B"Array").add_primitive(DataType.int32, list(range(10)))
+        node.add_structure(B"Vectors").add_primitive(DataType.int32, [(i, i) for i in range(6)], vector_size=2)
+
+        layout = DdlTextLayout(indent=B"  ", comment_prefix=B" // ", line_width=12)
+        self.assertEqual(B"Node (a = 1, b = \"x\") // comment\n{\n"
+                         B"  Array\n  {\n    int32\n    {\n"
+                         B"      0, 1, 2, 3,\n      4, 5, 6, 7,\n      8, 9\n    }\n  }\n\n"
+                         B"  Vectors\n  {\n    int32[2]\n    {\n"
+                         B"      {0, 0},\n      {1, 1},\n      {2, 2},\n      {3, 3},\n      {4, 4},\n      {5, 5}\n"
+                         B"    }\n  }\n}\n",
+                         DdlTextWriter(document, layout=layout).structure_as_text(node))
+
+        self.assertEqual(DdlCompressedTextWriter(document).structure_as_text(node),
+                         DdlTextWriter(document, layout=DdlTextLayout.compact()).structure_as_text(node))
+        self.assertEqual(B"Node (a = 1, b = \"x\"){Array{int32{0, 1, 2, 3, 4, 5, 6, 7, 8, 9}}"
+                         B"Vectors{int32[2]{{0, 0}, {1, 1}, {2, 2}, {3, 3}, {4, 4}, {5, 5}}}}",
+                         DdlTextWriter(document, layout=DdlTextLayout(B"", B"", B" ", None)).structure_as_text(node))
+
+        with self.assertRaises(ValueError):
+            DdlTextLayout(newline=B"")
+
+        # the options after rounding are keyword-only, as the writers take different ones
+        with self.assertRaises(TypeError):
+            DdlTextWriter(document, 6, None, layout)
+        with self.assertRaises(TypeError):
+            DdlCompressedTextWriter(document, 6, None, print)
+
+    def test_strings(self):
+        values = ["plain", "quote \" and backslash \\", "line\nbreak\ttab", "\x01\x7f\x85", "\u00fcnicode", b"bytes \"",
+                  "plain"]
+        document = DdlDocument()
+        node = document.add_structure(B"Node", props={B"path": "C:\\textures", B"raw": b"\""}, children=[
+            DdlPrimitive(DataType.string, values), DdlPrimitive(DataType.string, ["a", "b", "c", "d", "e"]),
+            DdlPrimitive(DataType.string, [("x", b"y"), ("\"", "z")], vector_size=2)])
+        DdlTextWriter.set_max_elements_per_line(node.children[1], 2)
+
+        writer = DdlTextWriter(document)
+        text = writer.structure_as_text(node)
+        self.assertTrue(B'"quote \\" and backslash \\\\", "line\\nbreak\\ttab", "\\x01\\x7f\\u0085"' in text)
+        self.assertTrue(B'\t\t"a", "b",\n\t\t"c", "d",\n\t\t"e"\n' in text)
+        self.assertIs(writer.to_string_literal("plain"), writer.to_string_literal("plain"))
+
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            written = DdlTextReader().read_bytes(writer_class(document).structure_as_text(node)).structures[0]
+            self.assertEqual({B"path": "C:\\textures", B"raw": "\""}, dict(written.properties))
+            self.assertEqual([v if isinstance(v, str) else v.decode() for v in values], written.children[0].data)
+            self.assertEqual(["a", "b", "c", "d", "e"], written.children[1].data)
+            self.assertEqual([("x", "y"), ("\"", "z")], [tuple(v) for v in written.children[2].data])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,133 @@
+import array
+import os
+import unittest
+
+from pyddl import DdlPrimitiveDataType as DataType
+from pyddl import *
+
+__author__ = "Jonathan Hale"
+
+
+class DdlWriteProgressTest(unittest.TestCase):
+
+    def tearDown(self):
+        for filename in ["test_progress.ddl", "test_progress.ddl.index"]:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def create_document(count=2000):
+        document = DdlDocument()
+        prototype = DdlStructure(B"Mesh", children=[
+            DdlStructure(B"VertexArray", children=[
+                DdlPrimitive(DataType.float, [(0.0, 1.0, 2.0)] * 10, vector_size=3)]),
+            DdlStructure(B"IndexArray", children=[DdlPrimitive(DataType.unsigned_int32, list(range(30)))])])
+        for i in range(count):
+            node = document.add_structure(B"Node", bytes("node" + str(i), "UTF-8"))
+            node.add_structure(B"Name", children=[DdlPrimitive(DataType.string, ["node"])])
+            node.children.append(prototype.instance())
+        document.add_structure(B"Data", children=[DdlPrimitive(DataType.int32, array.array("i", range(200000)))])
+        document.structures.append(DdlFragment(B"Fragment {int32 {1, 2}}\n"))
+        return document
+
+    def test_progress(self):
+        document = self.create_document()
+        for writer_class in [DdlTextWriter, DdlCompressedTextWriter]:
+            reports = []
+            writer = writer_class(document, progress=reports.append)
+            writer.progress_interval = 0
+            writer.write("test_progress.ddl")
+
+            # 2000 nodes with 5 structures each and the data structure,
+            # 2000 names, 2000 * 60 values in the instances and the large data
+            final = reports[-1]
+            self.assertEqual(DdlWriteProgress(10001, 10001, 322000, 322000, os.path.getsize("test_progress.ddl"),
+                                              os.path.getsize("test_progress.ddl")), final)
+            self.assertGreater(len(reports), 2)
+            for previous, report in zip(reports, reports[1:]):
+                self.assertLessEqual(previous.structures, report.structures)
+                self.assertLessEqual(previous.elements, report.elements)
+                self.assertLessEqual(previous.written, report.written)
+            self.assertTrue(all(r.estimated_size >= r.written for r in reports if r.estimated_size is not None))
+
+        # reports are throttled
+        reports = []
+        DdlTextWriter(document, progress=reports.append).write("test_progress.ddl")
+        self.assertEqual(final.total_structures, reports[-1].structures)
+        self.assertLess(len(reports), 3)
+
+    def test_cancel(self):
+        token = DdlCancellationToken()
+        reports = []
+
+        def progress(report):
+            reports.append(report)
+            token.cancel()
+
+        writer = DdlTextWriter(self.create_document(), index="sidecar", progress=progress, cancellation=token)
+        writer.progress_interval = 0
+        with self.assertRaises(DdlWriteCancelled):
+            writer.write("test_progress.ddl")
+        self.assertEqual(1, len(reports))
+        self.assertLess(reports[0].structures, reports[0].total_structures)
+        self.assertTrue(writer.file.closed)
+        self.assertFalse(os.path.exists("test_progress.ddl"))
+        self.assertFalse(os.path.exists("test_progress.ddl.index"))
+
+        # large data is cancelled at the next chunk
+        token = DdlCancellationToken()
+        document = DdlDocument()
+        document.add_structure(B"Data", children=[DdlPrimitive(DataType.int32, array.array("i", range(1 << 20)))])
+        reports = []
+        writer = DdlCompressedTextWriter(document, progress=progress, cancellation=token)
+        writer.progress_interval = 0
+        with self.assertRaises(DdlWriteCancelled):
+            writer.write("test_progress.ddl")
+        self.assertEqual(1, len(reports))
+        self.assertLess(reports[0].elements, 1 << 20)
+        self.assertFalse(os.path.exists("test_progress.ddl"))
+
+        # cancelled after the sidecar index was written, at the final check
+        class Token:
+            @property
+            def cancelled(self):
+                return os.path.exists("test_progress.ddl.index")
+
+        writer = DdlTextWriter(self.create_document(10), index="sidecar", cancellation=Token())
+        with self.assertRaises(DdlWriteCancelled):
+            writer.write("test_progress.ddl")
+        self.assertFalse(os.path.exists("test_progress.ddl"))
+        self.assertFalse(os.path.exists("test_progress.ddl.index"))
+
+    def test_reuse(self):
+        document = self.create_document()
+        DdlTextWriter(document, index="footer").write("test_progress.ddl")
+        with open("test_progress.ddl", "rb") as file:
+            expected = file.read()
+
+        # a writer is reset at the start of every write, wherever the previous one stopped
+        token = DdlCancellationToken()
+        writer = DdlTextWriter(document, index="footer", progress=lambda report: token.cancel(), cancellation=token)
+        writer.progress_interval = 0
+        with self.assertRaises(DdlWriteCancelled):
+            writer.write("test_progress.ddl")
+        writer.cancellation = DdlCancellationToken()
+        writer.write("test_progress.ddl")
+        with open("test_progress.ddl", "rb") as file:
+            self.assertEqual(expected, file.read())
+        self.assertEqual(B"node0", DdlIndex("test_progress.ddl").read_structure(B"node0").name)
+
+    def test_error(self):
+        document = DdlDocument()
+        document.add_structure(B"Node", props={B"invalid": object()})
+        writer = DdlTextWriter(document)
+        with self.assertRaises(Exception):
+            writer.write("test_progress.ddl")
+        self.assertTrue(writer.file.closed)
+        self.assertFalse(os.path.exists("test_progress.ddl"))
+
+
+if __name__ == "__main__":
+    unittest.main()